@@ -0,0 +1,198 @@
+import io
+import os
+import asyncio
+from typing import List, Optional
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, File, Form, HTTPException, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from file_jobs import FileJobs, TERMINE
+from backends_inference import adaptateurs_disponibles, BACKEND_LOCAL
+from prompt_patient import construire_user_prompt
+from prechauffage import PRECHAUFFAGE_ACTIF, prechauffer, rapport_prechauffage
+
+# === 0) Configuration ===
+MAX_REQUETES = int(os.environ.get("API_MAX_REQUETES", "4"))          # extractions simultanées
+MAX_JOBS_EN_ATTENTE = int(os.environ.get("API_MAX_JOBS", "200"))      # au-delà : 429
+TAILLE_MAX_DOCX = 20 * 1024 * 1024
+
+def job_prechauffage(job):
+    job.avancer(0.1, "Chargement et préchauffage du modèle...")
+    prechauffer()
+
+@asynccontextmanager
+async def cycle_de_vie(app):
+    # Préchauffage dans l'unique worker de génération : les jobs soumis entre-temps passent après lui
+    if PRECHAUFFAGE_ACTIF and not os.environ.get("INFERENCE_WORKER"):
+        file_jobs.soumettre(job_prechauffage, nom="préchauffage")
+    yield
+
+app = FastAPI(title="CIRCB – API rapports TR", version="1.0", lifespan=cycle_de_vie)
+limite_requetes = asyncio.Semaphore(MAX_REQUETES)
+# Un seul worker de génération : le modèle chargé est partagé par toutes les requêtes
+file_jobs = FileJobs(max_workers=1)
+
+class DemandeGeneration(BaseModel):
+    """Soit un prompt déjà construit, soit le contexte patient + les données Stanford extraites"""
+    user_prompt: Optional[str] = None
+    patient: Optional[dict] = None
+    extraction: Optional[dict] = None
+    adaptateur: Optional[str] = None      # adaptateur LoRA (BACKEND_LOCAL=lora), pour comparer deux fine-tunings
+
+class DemandeLot(BaseModel):
+    demandes: List[DemandeGeneration]
+
+# === 1) Utilitaires ===
+async def lire_docx(fichier: UploadFile):
+    if not fichier.filename.lower().endswith(".docx"):
+        raise HTTPException(415, f"{fichier.filename} : seuls les fichiers .docx sont acceptés")
+    contenu = await fichier.read()
+    if len(contenu) > TAILLE_MAX_DOCX:
+        raise HTTPException(413, f"{fichier.filename} : fichier trop volumineux")
+    return io.BytesIO(contenu)
+
+async def extraire(fn, *args):
+    """Exécute une extraction dans le pool de threads, au plus MAX_REQUETES à la fois"""
+    async with limite_requetes:
+        try:
+            return await run_in_threadpool(fn, *args)
+        except Exception as e:
+            raise HTTPException(422, f"Extraction impossible : {e}")
+
+def job_generation(job, user_prompt, mutations, adaptateur=None):
+    from pipeline_rapport import generer_rapport
+    return generer_rapport(user_prompt, mutations, job, adaptateur=adaptateur)
+
+def verifier_adaptateur(adaptateur):
+    if adaptateur and BACKEND_LOCAL != "lora":
+        raise HTTPException(422, f"Le backend '{BACKEND_LOCAL}' ne gère pas les adaptateurs LoRA (BACKEND_LOCAL=lora)")
+    if adaptateur and adaptateur not in adaptateurs_disponibles():
+        raise HTTPException(422, f"Adaptateur LoRA inconnu : {adaptateur}")
+
+def soumettre_generation(user_prompt, mutations, nom="", adaptateur=None):
+    if file_jobs.en_attente() >= MAX_JOBS_EN_ATTENTE:
+        raise HTTPException(429, "File de génération pleine, réessayer plus tard")
+    verifier_adaptateur(adaptateur)
+    return file_jobs.soumettre(job_generation, user_prompt, mutations, adaptateur, nom=nom)
+
+def prompt_depuis_demande(demande: DemandeGeneration):
+    if demande.user_prompt:
+        mutations = (demande.extraction or {}).get("mutations")
+        return demande.user_prompt, mutations
+    if demande.patient is None:
+        raise HTTPException(422, "Fournir 'user_prompt' ou 'patient'")
+    extraction = demande.extraction or {}
+    return construire_user_prompt(demande.patient, extraction), extraction.get("mutations")
+
+def etat_job(job):
+    etat = {
+        "job_id": job.id,
+        "nom": job.nom,
+        "statut": job.statut,
+        "progression": job.progression,
+        "etape": job.etape,
+        "duree": round(job.duree, 2)
+    }
+    if job.statut == TERMINE:
+        etat["resultat"] = job.resultat
+    if job.erreur:
+        etat["erreur"] = job.erreur
+    return etat
+
+# === 2) Extraction ===
+@app.post("/extraction/stanford")
+async def extraction_stanford(fichier: UploadFile = File(...)):
+    """Mutations, commentaires et scores d'un rapport Stanford (.docx)"""
+    from extract import extract_info_from_text
+    return await extraire(extract_info_from_text, await lire_docx(fichier))
+
+@app.post("/extraction/note")
+async def extraction_note(fichier: UploadFile = File(...)):
+    """Note, interprétation, charges virales et CD4 d'un rapport clinique (.docx)"""
+    from extractrslt import extract_note_and_interpretation
+    return await extraire(extract_note_and_interpretation, await lire_docx(fichier))
+
+# === 3) Génération (asynchrone : job + polling) ===
+@app.post("/generation", status_code=202)
+async def generation(demande: DemandeGeneration):
+    user_prompt, mutations = prompt_depuis_demande(demande)
+    code = (demande.patient or {}).get("code_patient", "")
+    return {"job_id": soumettre_generation(user_prompt, mutations, nom=code, adaptateur=demande.adaptateur)}
+
+@app.post("/generation/lot", status_code=202)
+async def generation_lot(lot: DemandeLot):
+    if file_jobs.en_attente() + len(lot.demandes) > MAX_JOBS_EN_ATTENTE:
+        raise HTTPException(429, "Lot trop volumineux pour la file de génération actuelle")
+    job_ids = []
+    for demande in lot.demandes:
+        user_prompt, mutations = prompt_depuis_demande(demande)
+        job_ids.append(soumettre_generation(user_prompt, mutations, nom=(demande.patient or {}).get("code_patient", ""),
+                                            adaptateur=demande.adaptateur))
+    return {"job_ids": job_ids}
+
+@app.post("/generation/docx", status_code=202)
+async def generation_docx(
+    notes: List[UploadFile] = File(...),
+    stanford: List[UploadFile] = File(...),
+    codes: Optional[str] = Form(None),
+    adaptateur: Optional[str] = Form(None)
+):
+    """Lot de paires (note clinique, rapport Stanford) appariées par ordre ; `codes` : liste séparée par des virgules"""
+    from pipeline_rapport import extraire_patient
+    if len(notes) != len(stanford):
+        raise HTTPException(422, "Autant de notes que de rapports Stanford sont attendus")
+    verifier_adaptateur(adaptateur)
+    liste_codes = [c.strip() for c in codes.split(",")] if codes else []
+    if file_jobs.en_attente() + len(notes) > MAX_JOBS_EN_ATTENTE:
+        raise HTTPException(429, "Lot trop volumineux pour la file de génération actuelle")
+
+    job_ids = []
+    for i, (note, mut) in enumerate(zip(notes, stanford)):
+        code = liste_codes[i] if i < len(liste_codes) else os.path.splitext(note.filename)[0]
+        patient, extraction, _ = await extraire(extraire_patient, await lire_docx(note), await lire_docx(mut), code)
+        user_prompt = construire_user_prompt(patient, extraction)
+        job_ids.append(soumettre_generation(user_prompt, extraction.get("mutations"), nom=code, adaptateur=adaptateur))
+    return {"job_ids": job_ids}
+
+@app.get("/jobs/{job_id}")
+async def lire_job(job_id: str):
+    job = file_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job inconnu ou expiré")
+    return etat_job(job)
+
+@app.delete("/jobs/{job_id}")
+async def annuler_job(job_id: str):
+    if file_jobs.get(job_id) is None:
+        raise HTTPException(404, "Job inconnu ou expiré")
+    return {"annule": file_jobs.annuler(job_id)}
+
+@app.get("/adaptateurs")
+async def adaptateurs():
+    """Adaptateurs LoRA utilisables dans le champ `adaptateur` des demandes de génération"""
+    return {"adaptateurs": list(adaptateurs_disponibles())}
+
+def etat_prechauffage():
+    """État local, ou celui du worker d'inférence partagé (INFERENCE_WORKER=1)"""
+    if not os.environ.get("INFERENCE_WORKER"):
+        return rapport_prechauffage()
+    try:
+        from serveur_inference import stats_worker
+        return stats_worker()["prechauffage"]
+    except Exception as e:
+        return {"pret": False, "erreur": f"Worker d'inférence injoignable : {e}"}
+
+@app.get("/sante")
+async def sante(response: Response):
+    """Prêt (200) seulement une fois le modèle chargé et préchauffé ; 503 avant"""
+    etat = await run_in_threadpool(etat_prechauffage)
+    pret = bool(etat.get("pret")) or not PRECHAUFFAGE_ACTIF
+    if not pret:
+        response.status_code = 503
+    return {"ok": True, "pret": pret, "jobs_en_attente": file_jobs.en_attente(), "prechauffage": etat}
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.environ.get("API_HOTE", "127.0.0.1"), port=int(os.environ.get("API_PORT", "8010")))
@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import subprocess
+
+from backends_inference import MERGED_MODEL_PATH, DOSSIER_CONFIG_HOTE, chemin_config_hote, appliquer_threads, quantifier_int8
+
+# === 0) Configuration ===
+PRECISIONS = ("fp32", "bf16", "int8")
+THREADS_INTER = (1, 2)
+LOTS = (1, 2, 4)
+TOKENS_MESURE = 32          # tokens générés par mesure (longueur fixe : min_new_tokens = max_new_tokens)
+REPETITIONS = 2             # meilleure de N mesures après une génération de mise en route
+
+def threads_candidats():
+    n = os.cpu_count() or 1
+    return sorted({max(1, n // 4), max(1, n // 2), n})
+
+def prompt_standard():
+    """Prompt d'un patient type (même encodeur que l'interface)"""
+    from prechauffage import patient_fictif
+    from prompt_patient import construire_user_prompt
+    return ("Système : Tu es un expert en virologie spécialisé dans la prise en charge du VIH.\n"
+            f"Utilisateur : {construire_user_prompt(*patient_fictif(4))}\nRéponse :\n")
+
+# === 1) Mesures (sous-processus : le nombre de threads inter-op ne se fixe qu'une fois par processus) ===
+def mesurer(chemin, precision, inter, intras, lots, tokens=TOKENS_MESURE):
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM
+
+    appliquer_threads({"threads_inter": inter})
+    tokenizer = AutoTokenizer.from_pretrained(chemin, use_fast=True)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    dtype = torch.bfloat16 if precision == "bf16" else torch.float32
+    model = AutoModelForCausalLM.from_pretrained(chemin, torch_dtype=dtype, device_map="cpu",
+                                                 trust_remote_code=True, low_cpu_mem_usage=True).eval()
+    if precision == "int8":
+        model = quantifier_int8(model)
+
+    prompt = prompt_standard()
+    options = {"do_sample": False, "pad_token_id": tokenizer.pad_token_id}
+    for intra in intras:
+        torch.set_num_threads(intra)
+        for lot in lots:
+            entrees = tokenizer([prompt] * lot, return_tensors="pt", padding=True)
+            with torch.inference_mode():
+                model.generate(**entrees, max_new_tokens=4, **options)
+                durees = []
+                for _ in range(REPETITIONS):
+                    debut = time.perf_counter()
+                    model.generate(**entrees, max_new_tokens=tokens, min_new_tokens=tokens, **options)
+                    durees.append(time.perf_counter() - debut)
+            duree = min(durees)
+            # Une ligne JSON par combinaison, lue par le processus parent
+            print(json.dumps({"precision": precision, "threads_inter": inter, "threads_intra": intra,
+                              "taille_lot": lot, "latence_s": round(duree, 3),
+                              "tokens_par_s": round(lot * tokens / duree, 2)}), flush=True)
+
+def lancer_mesures(chemin, precision, inter, intras, lots):
+    commande = [sys.executable, os.path.abspath(__file__), "--mesurer", "--modele", str(chemin),
+                "--precisions", precision, "--inter", str(inter),
+                "--intra", ",".join(map(str, intras)), "--lots", ",".join(map(str, lots))]
+    sortie = subprocess.run(commande, capture_output=True, text=True)
+    mesures = [json.loads(l) for l in sortie.stdout.splitlines() if l.startswith("{")]
+    if sortie.returncode != 0 and not mesures:
+        erreur = (sortie.stderr.strip().splitlines() or ["erreur inconnue"])[-1]
+        print(f"❌ {precision} / inter {inter} : {erreur}")
+    for m in mesures:
+        print(f"   {m['precision']:5s} inter={m['threads_inter']} intra={m['threads_intra']:<3d} lot={m['taille_lot']} "
+              f"{m['latence_s']:7.2f}s  {m['tokens_par_s']:7.1f} tokens/s")
+    return mesures
+
+# === 2) Choix et écriture de la configuration de l'hôte ===
+def choisir(mesures, critere="debit"):
+    """debit : meilleur tokens/s (micro-lots compris) ; latence : requête seule la plus rapide"""
+    if critere == "latence":
+        seules = [m for m in mesures if m["taille_lot"] == 1] or mesures
+        return min(seules, key=lambda m: m["latence_s"])
+    return max(mesures, key=lambda m: m["tokens_par_s"])
+
+def autotune(chemin=MERGED_MODEL_PATH, precisions=PRECISIONS, inters=THREADS_INTER, intras=None, lots=LOTS,
+             critere="debit", dossier=DOSSIER_CONFIG_HOTE):
+    intras = intras or threads_candidats()
+    debut = time.perf_counter()
+    mesures = []
+    for precision in precisions:
+        for inter in inters:
+            mesures += lancer_mesures(chemin, precision, inter, intras, lots)
+    if not mesures:
+        raise RuntimeError("Aucune mesure n'a abouti")
+    retenue = {k: v for k, v in choisir(mesures, critere).items() if k not in ("latence_s", "tokens_par_s")}
+    config = {
+        "hote": socket.gethostname(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "cpu_count": os.cpu_count(),
+        "modele": str(chemin),
+        "critere": critere,
+        "retenue": retenue,
+        "mesures": mesures,
+        "duree_s": round(time.perf_counter() - debut, 1)
+    }
+    path = chemin_config_hote(dossier)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+    return path, config
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recherche de la configuration CPU la plus rapide pour cet hôte")
+    parser.add_argument("--modele", default=MERGED_MODEL_PATH)
+    parser.add_argument("--precisions", default=",".join(PRECISIONS), help="parmi fp32, bf16, int8")
+    parser.add_argument("--inter", default=",".join(map(str, THREADS_INTER)), help="threads inter-op à essayer")
+    parser.add_argument("--intra", default=None, help="threads intra-op à essayer (défaut : n/4, n/2, n)")
+    parser.add_argument("--lots", default=",".join(map(str, LOTS)), help="tailles de micro-lot à essayer")
+    parser.add_argument("--critere", choices=["debit", "latence"], default="debit")
+    parser.add_argument("--mesurer", action="store_true", help=argparse.SUPPRESS)   # sous-processus de mesure
+    args = parser.parse_args()
+
+    entiers = lambda texte: [int(x) for x in texte.split(",") if x]
+    intras = entiers(args.intra) if args.intra else threads_candidats()
+    if args.mesurer:
+        mesurer(args.modele, args.precisions, int(args.inter), intras, entiers(args.lots))
+    else:
+        path, config = autotune(args.modele, args.precisions.split(","), entiers(args.inter), intras,
+                                entiers(args.lots), args.critere)
+        print(f"✅ Configuration retenue ({config['critere']}) : {config['retenue']} -> {path} ({config['duree_s']}s)")
@@ -0,0 +1,294 @@
+import os
+import json
+import shutil
+import socket
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+# === 0) Configuration ===
+MERGED_MODEL_PATH = r".\Phi4_merged"
+GGUF_PATH = os.environ.get("GGUF_PATH", r".\Phi4_gguf\phi4-mini-q4_k_m.gguf")
+OLLAMA_MODELE = os.environ.get("OLLAMA_MODELE", "phi4")
+OFFLOAD_DIR = r".\phi4_offload"
+
+# Backend lora : modèle de base chargé une fois + adaptateurs LoRA (un sous-dossier par adaptateur,
+# tel qu'enregistré par le Trainer du notebook) activables par nom, sans fusion ni rechargement
+BASE_MODEL_PATH = os.environ.get("BASE_MODEL_PATH", r".\Phi-4-mini")
+DOSSIER_ADAPTATEURS = os.environ.get("ADAPTATEURS_DOSSIER", r".\adaptateurs")
+ADAPTATEUR = os.environ.get("ADAPTATEUR")   # adaptateur par défaut (sinon le premier par ordre alphabétique)
+
+# Backend de chaque étape : hf (transformers), lora (base + adaptateurs), ollama, llamacpp (quantifié CPU, GGUF).
+# BACKEND=llamacpp fait servir les deux étapes par le même modèle chargé une seule fois.
+BACKEND_LOCAL = os.environ.get("BACKEND_LOCAL", os.environ.get("BACKEND", "hf"))
+BACKEND_RAFFINEMENT = os.environ.get("BACKEND_RAFFINEMENT", os.environ.get("BACKEND", "ollama"))
+
+# Exécution compilée (torch.compile) du modèle transformers, surtout utile sur CPU :
+# COMPILATION=1 (mode par défaut), reduce-overhead ou max-autotune. Compilation au premier appel (cf. prechauffage.py)
+COMPILATION = os.environ.get("COMPILATION", "")
+
+# Configuration CPU (threads, précision, micro-lot) mesurée sur cet hôte par autotune_cpu.py ; AUTOTUNE=0 pour l'ignorer
+DOSSIER_CONFIG_HOTE = os.environ.get("CONFIG_HOTE_DOSSIER", r".\config_hote")
+
+MAX_NEW_TOKENS = 812
+# Réponse renvoyée par generate_interpretation quand la génération échoue (à ne pas traiter comme un rapport)
+REPONSE_ERREUR = "Je suis désolé, il y a eu une erreur."
+TEMPERATURE = 0.2
+
+def texte_prompt(entree):
+    """Texte d'une sortie de ChatPromptTemplate (ou d'une chaîne)"""
+    return entree.to_string() if hasattr(entree, "to_string") else str(entree)
+
+def chemin_config_hote(dossier=DOSSIER_CONFIG_HOTE):
+    return Path(dossier) / f"{socket.gethostname()}.json"
+
+def config_hote(dossier=DOSSIER_CONFIG_HOTE):
+    """Configuration retenue par autotune_cpu.py pour cet hôte ({} si absente ou AUTOTUNE=0)"""
+    path = chemin_config_hote(dossier)
+    if os.environ.get("AUTOTUNE") == "0" or not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("retenue", {})
+
+def appliquer_threads(config):
+    import torch
+    if config.get("threads_intra"):
+        torch.set_num_threads(int(config["threads_intra"]))
+    if config.get("threads_inter"):
+        try:
+            torch.set_num_interop_threads(int(config["threads_inter"]))
+        except RuntimeError:
+            pass   # fixé une seule fois par processus, avant tout calcul parallèle
+
+def quantifier_int8(model):
+    """Quantification dynamique int8 des couches linéaires (CPU)"""
+    import torch
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+# === 1) Backends ===
+class BackendHF:
+    """Modèle fusionné chargé avec transformers (GPU si disponible, repli CPU float32)"""
+    nom = "hf"
+
+    def __init__(self, chemin=MERGED_MODEL_PATH, max_new_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE):
+        import torch
+        from transformers import AutoTokenizer, pipeline
+        from langchain_huggingface import HuggingFacePipeline
+
+        device = "cuda" if torch.cuda.is_available() else ("mps" if torch.backends.mps.is_available() else "cpu")
+        dtype = torch.bfloat16 if device == "cuda" and torch.cuda.is_bf16_supported() else torch.float16 if device == "cuda" else torch.float32
+        config = config_hote() if device == "cpu" else {}
+        if config:
+            appliquer_threads(config)
+            dtype = torch.bfloat16 if config.get("precision") == "bf16" else dtype
+            print(f"⚙️ Configuration de l'hôte appliquée : {config}")
+
+        try:
+            self.tokenizer = AutoTokenizer.from_pretrained(chemin, use_fast=True)
+            if self.tokenizer.pad_token is None:
+                self.tokenizer.pad_token = self.tokenizer.eos_token if self.tokenizer.eos_token else "<|endoftext|>"
+            self.tokenizer.padding_side = "left"  # génération par lot (modèle décodeur)
+            print("✅ Tokenizer chargé avec succès")
+        except Exception as e:
+            print(f"❌ Erreur lors du chargement du tokenizer: {e}")
+            from transformers import GPT2Tokenizer
+            self.tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+
+        self.model = self._charger_modele(chemin, dtype)
+        self.model.eval()
+        if config.get("precision") == "int8":
+            if self.nom == "hf":
+                self.model = quantifier_int8(self.model)
+            else:
+                print("⚠️ int8 ignoré : les adaptateurs LoRA se greffent sur des couches non quantifiées")
+        if COMPILATION:
+            mode = None if COMPILATION in ("1", "default") else COMPILATION
+            # forward seul : generate() reste celui du modèle, chaque pas de décodage passe par le graphe compilé
+            self.model.forward = torch.compile(self.model.forward, mode=mode, dynamic=True)
+            print(f"⚙️ torch.compile activé (mode {mode or 'default'}, device {device})")
+
+        self.pipe = pipeline(
+            "text-generation",
+            model=self.model,
+            tokenizer=self.tokenizer,
+            max_new_tokens=max_new_tokens,
+            temperature=temperature,
+            do_sample=True,
+            device_map="auto",
+            batch_size=int(config.get("taille_lot", 1)),
+            pad_token_id=self.tokenizer.eos_token_id
+        )
+        self.llm = HuggingFacePipeline(pipeline=self.pipe)
+
+    def _charger_modele(self, chemin, dtype):
+        import torch
+        from transformers import AutoModelForCausalLM
+
+        shutil.rmtree(OFFLOAD_DIR, ignore_errors=True)
+        os.makedirs(OFFLOAD_DIR, exist_ok=True)
+        try:
+            print("🔄 Tentative sans quantification...")
+            model = AutoModelForCausalLM.from_pretrained(
+                chemin, device_map="auto", torch_dtype=dtype, trust_remote_code=True, low_cpu_mem_usage=True
+            )
+            print("✅ Modèle chargé sans quantification")
+        except Exception as e:
+            print(f"❌ Erreur sans quantification: {e}")
+            print("🔄 Tentative sur CPU...")
+            model = AutoModelForCausalLM.from_pretrained(
+                chemin, device_map="cpu", torch_dtype=torch.float32, trust_remote_code=True
+            )
+            print("✅ Modèle chargé sur CPU")
+        return model
+
+def adaptateurs_disponibles(dossier=DOSSIER_ADAPTATEURS):
+    """{nom: chemin} des adaptateurs LoRA enregistrés (sous-dossiers contenant adapter_config.json)"""
+    dossier = Path(dossier)
+    if not dossier.is_dir():
+        return {}
+    return {d.name: str(d) for d in sorted(dossier.iterdir()) if (d / "adapter_config.json").exists()}
+
+class BackendLoRA(BackendHF):
+    """Modèle de base partagé + adaptateurs LoRA chargés à la demande et activés par nom
+
+    Chaque adaptateur ne coûte que ses matrices de rang faible : comparer deux fine-tunings
+    (A/B, par centre, par campagne d'entraînement) ne recharge jamais le modèle de base.
+    """
+    nom = "lora"
+
+    def __init__(self, chemin=BASE_MODEL_PATH, dossier=DOSSIER_ADAPTATEURS, defaut=ADAPTATEUR, **kwargs):
+        self.dossier = dossier
+        self.chemins = adaptateurs_disponibles(dossier)
+        if not self.chemins:
+            raise FileNotFoundError(f"Aucun adaptateur LoRA (adapter_config.json) dans {dossier}")
+        self.defaut = defaut or next(iter(self.chemins))
+        if self.defaut not in self.chemins:
+            raise ValueError(f"Adaptateur inconnu : {self.defaut} (choix : {', '.join(self.chemins)})")
+        self.actif = None
+        self._verrou = threading.RLock()   # l'adaptateur actif est global au modèle : une génération à la fois
+        super().__init__(chemin, **kwargs)
+
+    def _charger_modele(self, chemin, dtype):
+        from peft import PeftModel
+        base = super()._charger_modele(chemin, dtype)
+        model = PeftModel.from_pretrained(base, self.chemins[self.defaut], adapter_name=self.defaut)
+        self.actif = self.defaut
+        print(f"✅ Adaptateur LoRA '{self.defaut}' chargé")
+        return model
+
+    def adaptateurs(self):
+        """Adaptateurs disponibles sur disque et déjà chargés en mémoire"""
+        self.chemins.update(adaptateurs_disponibles(self.dossier))
+        return {"disponibles": list(self.chemins), "charges": list(self.model.peft_config), "actif": self.actif}
+
+    def charger_adaptateur(self, nom, chemin=None):
+        """Ajoute un adaptateur au modèle (quelques Mo) ; `chemin` pour un dossier hors ADAPTATEURS_DOSSIER"""
+        with self._verrou:
+            if nom in self.model.peft_config:
+                return
+            if chemin is None:
+                self.chemins.update(adaptateurs_disponibles(self.dossier))
+                if nom not in self.chemins:
+                    raise ValueError(f"Adaptateur inconnu : {nom} (choix : {', '.join(self.chemins)})")
+                chemin = self.chemins[nom]
+            self.model.load_adapter(chemin, adapter_name=nom)
+            self.chemins[nom] = str(chemin)
+            print(f"✅ Adaptateur LoRA '{nom}' chargé")
+
+    def decharger_adaptateur(self, nom):
+        with self._verrou:
+            if nom == self.actif:
+                raise ValueError(f"Adaptateur actif : {nom}")
+            if nom in self.model.peft_config:
+                self.model.delete_adapter(nom)
+
+    @contextmanager
+    def adaptateur(self, nom=None):
+        """Active `nom` (défaut : ADAPTATEUR) le temps d'une génération"""
+        nom = nom or self.defaut
+        with self._verrou:
+            self.charger_adaptateur(nom)
+            if self.actif != nom:
+                self.model.set_adapter(nom)
+                self.actif = nom
+            yield
+
+@contextmanager
+def adaptateur_actif(backend, nom=None):
+    """Contexte de génération avec l'adaptateur demandé ; erreur si le backend n'en gère pas"""
+    if hasattr(backend, "adaptateur"):
+        with backend.adaptateur(nom):
+            yield
+    elif nom:
+        raise ValueError(f"Le backend '{backend.nom}' ne gère pas les adaptateurs LoRA (BACKEND_LOCAL=lora)")
+    else:
+        yield
+
+class BackendOllama:
+    """Modèle servi par Ollama (processus séparé)"""
+    nom = "ollama"
+
+    def __init__(self, modele=OLLAMA_MODELE):
+        from langchain_ollama import OllamaLLM
+        self.llm = OllamaLLM(model=modele)
+
+class BackendLlamaCpp:
+    """Modèle GGUF quantifié exécuté sur CPU par llama.cpp (optionnel : pip install llama-cpp-python)"""
+    nom = "llamacpp"
+
+    def __init__(self, chemin=GGUF_PATH, n_ctx=4096, n_threads=None,
+                 max_new_tokens=MAX_NEW_TOKENS, temperature=TEMPERATURE):
+        try:
+            from llama_cpp import Llama
+        except ImportError as e:
+            raise ImportError("Backend 'llamacpp' : installer llama-cpp-python") from e
+        from langchain_core.runnables import RunnableLambda
+
+        n_threads = n_threads or config_hote().get("threads_intra") or os.cpu_count()
+        self.modele = Llama(model_path=chemin, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self._verrou = threading.Lock()   # un contexte llama.cpp ne génère qu'une séquence à la fois
+        self.llm = RunnableLambda(self.completion)
+
+    def completion(self, entree):
+        with self._verrou:
+            sortie = self.modele(texte_prompt(entree), max_tokens=self.max_new_tokens, temperature=self.temperature)
+        return sortie["choices"][0]["text"]
+
+BACKENDS = {"hf": BackendHF, "lora": BackendLoRA, "ollama": BackendOllama, "llamacpp": BackendLlamaCpp}
+
+# === 2) Instances partagées ===
+_instances = {}
+_verrou = threading.Lock()
+
+def obtenir_backend(nom):
+    """Backend chargé une seule fois par processus : deux étapes sur le même nom partagent le modèle"""
+    if nom not in BACKENDS:
+        raise ValueError(f"Backend inconnu : {nom} (choix : {', '.join(BACKENDS)})")
+    with _verrou:
+        if nom not in _instances:
+            print(f"🔌 Chargement du backend '{nom}'")
+            _instances[nom] = BACKENDS[nom]()
+        return _instances[nom]
+
+if __name__ == "__main__":
+    # Banc d'essai : temps de génération d'un même prompt sur chaque backend (et adaptateur) disponible
+    import sys, time
+    noms = sys.argv[1:] or list(BACKENDS)
+    prompt = "Système : Tu es virologue.\nUtilisateur : Résume en une phrase l'intérêt d'un test de résistance du VIH.\nRéponse :\n"
+    for nom in noms:
+        try:
+            backend = obtenir_backend(nom)
+        except Exception as e:
+            print(f"❌ {nom:9s} indisponible : {e}")
+            continue
+        # lora : chaque adaptateur à tour de rôle, sur le même modèle de base
+        for adaptateur in (backend.adaptateurs()["disponibles"] if nom == "lora" else [None]):
+            debut = time.perf_counter()
+            with adaptateur_actif(backend, adaptateur):
+                reponse = texte_prompt(backend.llm.invoke(prompt))
+            duree = time.perf_counter() - debut
+            libelle = f"{nom}:{adaptateur}" if adaptateur else nom
+            print(f"✅ {libelle:9s} {duree:6.1f}s  {len(reponse.split()) / max(duree, 1e-9):5.1f} mots/s")
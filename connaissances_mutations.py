@@ -0,0 +1,241 @@
+import os
+import re
+from functools import lru_cache
+
+# === 0) Configuration ===
+MEMORY_FILE = r".\memoire.txt"
+# Journal des interactions (les deux étapes de génération), séparé de memoire.txt : l'index de référence,
+# mis en cache sur la date de modification, n'est plus invalidé ni relu à chaque génération
+JOURNAL_FILE = r".\interactions.txt"
+
+# Classe ARV -> région du gène (sections de extract_mutation_blocks)
+GENE_CLASSE = {"NRTI": "RT", "NNRTI": "RT", "INSTI": "IN", "PI": "PR"}
+# Libellés français du tableau synthétique -> classe
+CLASSE_LIBELLE = {"INTI": "NRTI", "INNTI": "NNRTI", "INSTI": "INSTI", "IP": "PI"}
+# Ordre d'affichage des catégories
+ORDRE_CATEGORIES = ["TAM", "non-TAM", "MDR", "majeure", "accessoire"]
+
+MUTATION_GROUPE = re.compile(r"\b([A-Z])(\d{1,3})((?:Ins|del|[A-Z])(?:/(?:Ins|del|[A-Z]))*)\b")
+TITRE_CLASSE = re.compile(r"^\s*\d\.\s+Inhibiteurs.*\((.+?)\)\s*$")
+FIN_REFERENCE = re.compile(r"^(Note Bien|USER:)")
+TITRE_TABLEAU = re.compile(r"^\s*Tableau synth")
+
+def classe_depuis_titre(titre):
+    for classe in ("NNRTI", "NRTI", "INSTI", "PI"):
+        if re.search(rf"\b{classe}\b", titre):
+            return classe
+    return None
+
+def developper(groupe):
+    """'K65R/N' -> [('K', 65, 'R'), ('K', 65, 'N')]"""
+    ref, pos, alts = groupe
+    return [(ref, int(pos), alt) for alt in alts.split("/")]
+
+def categorie_ligne(ligne):
+    """Catégorie portée par une ligne de liste de mutations (None pour une ligne de note)"""
+    texte = ligne.strip().lstrip("*").strip()
+    if texte.startswith("TAMs"):
+        return "TAM"
+    if texte.startswith("Non-TAMs"):
+        return "non-TAM"
+    if texte.startswith("Insertions ou autres MDR"):
+        return "MDR"
+    if re.match(r"Mutations accessoires", texte):
+        return "accessoire"
+    if re.match(r"\*\*Mutations( clés| majeures)?\s*:\*\*", texte):
+        return "majeure"
+    return None
+
+# === 1) Index compilé ===
+class IndexMutations:
+    """Index (gène, position, acide aminé) -> classes, catégories et notes de référence"""
+
+    def __init__(self):
+        self.par_mutation = {}   # (gene, pos, aa) -> {"ref", "classes", "categories", "notes"}
+        self.par_position = {}   # (gene, pos) -> set(classes) : positions clés
+        self.classes = {}        # classe -> {"gene", "medicaments", "effets"}
+
+    def _entree(self, classe, ref, pos, aa):
+        gene = GENE_CLASSE[classe]
+        entree = self.par_mutation.setdefault((gene, pos, aa), {"ref": ref, "classes": [], "categories": [], "notes": []})
+        if classe not in entree["classes"]:
+            entree["classes"].append(classe)
+        return entree
+
+    def ajouter(self, classe, ref, pos, aa, categorie=None, note=None):
+        entree = self._entree(classe, ref, pos, aa)
+        if categorie and categorie not in entree["categories"]:
+            entree["categories"].append(categorie)
+            entree["categories"].sort(key=ORDRE_CATEGORIES.index)
+        if note and note not in entree["notes"]:
+            entree["notes"].append(note)
+
+    def annoter(self, section, mutation):
+        """Annotations d'une mutation extraite (gère les mélanges Stanford, ex: M184MV)"""
+        match = re.match(r"^([A-Z])(\d{1,3})([A-Za-z]+)$", mutation)
+        if not match:
+            return []
+        ref, pos, alts = match.group(1), int(match.group(2)), match.group(3)
+        gene = section.upper()
+        # 'Ins'/'del' sont des codes entiers ; sinon chaque lettre est un acide aminé du mélange
+        aas = [alts] if alts in ("Ins", "del") else [aa for aa in alts if aa != ref]
+        resultats = []
+        for aa in aas:
+            entree = self.par_mutation.get((gene, pos, aa))
+            if entree:
+                resultats.append({"mutation": f"{ref}{pos}{aa}", **entree})
+        if not resultats and (gene, pos) in self.par_position:
+            resultats.append({"mutation": mutation, "ref": ref, "classes": sorted(self.par_position[(gene, pos)]),
+                              "categories": ["position clé"], "notes": []})
+        return resultats
+
+    def annoter_blocs(self, mutation_table):
+        """Annote toute la sortie de extract_mutation_blocks"""
+        from extract import aplatir_mutations
+        annotations = []
+        for section, _, mut in aplatir_mutations(mutation_table):
+            annotations.extend(self.annoter(section, mut))
+        return annotations
+
+    def faits_pertinents(self, annotations):
+        """Texte de référence limité aux mutations et classes effectivement rencontrées"""
+        lignes, classes_vues, deja_vues = [], [], set()
+        for a in annotations:
+            if a["mutation"] in deja_vues:
+                continue
+            deja_vues.add(a["mutation"])
+            ligne = f"- {a['mutation']} ({'/'.join(a['classes'])}, {', '.join(a['categories']) or 'référencée'})"
+            if a["notes"]:
+                ligne += " : " + " ; ".join(a["notes"])
+            lignes.append(ligne)
+            for c in a["classes"]:
+                if c not in classes_vues:
+                    classes_vues.append(c)
+
+        for c in classes_vues:
+            info = self.classes.get(c, {})
+            details = []
+            if info.get("medicaments"):
+                details.append(f"molécules : {', '.join(info['medicaments'])}")
+            details.extend(info.get("effets", []))
+            if details:
+                lignes.append(f"* {c} : " + " ; ".join(details))
+        if not lignes:
+            return ""
+        return "Données de référence Stanford HIVdb pertinentes :\n" + "\n".join(lignes)
+
+def compiler_reference(texte):
+    """Compile la partie référence de memoire.txt en IndexMutations"""
+    index = IndexMutations()
+    classe = None
+    categorie_attendue = None
+    dans_effets = False
+
+    for ligne in texte.splitlines():
+        if FIN_REFERENCE.match(ligne.strip()):
+            break
+        if not ligne.strip():
+            continue
+
+        # Tableau synthétique : | INTI | 3TC, FTC, ... | ... |
+        if ligne.lstrip().startswith("|"):
+            cellules = [c.strip() for c in ligne.strip().strip("|").split("|")]
+            c = CLASSE_LIBELLE.get(cellules[0])
+            if c and len(cellules) >= 2:
+                index.classes.setdefault(c, {"gene": GENE_CLASSE[c], "medicaments": [], "effets": []})
+                index.classes[c]["medicaments"] = [m.strip() for m in cellules[1].split(",") if m.strip()]
+            continue
+
+        if TITRE_TABLEAU.match(ligne):
+            classe = None
+            continue
+
+        titre = TITRE_CLASSE.match(ligne)
+        if titre:
+            classe = classe_depuis_titre(titre.group(1))
+            if classe:
+                index.classes.setdefault(classe, {"gene": GENE_CLASSE[classe], "medicaments": [], "effets": []})
+            categorie_attendue, dans_effets = None, False
+            continue
+        if classe is None:
+            continue
+
+        texte_ligne = ligne.strip().lstrip("*").strip()
+        groupes = MUTATION_GROUPE.findall(ligne)
+
+        if texte_ligne.startswith("**Positions clés"):
+            gene = GENE_CLASSE[classe]
+            for pos in re.findall(r"\d+", texte_ligne):
+                index.par_position.setdefault((gene, int(pos)), set()).add(classe)
+            continue
+        if texte_ligne.startswith("**Effets"):
+            dans_effets = True
+            continue
+        if texte_ligne.startswith("**Notes"):
+            dans_effets = False
+            continue
+
+        categorie = categorie_ligne(ligne)
+        if categorie and not groupes:
+            # Titre seul : la liste suit sur la ligne suivante
+            categorie_attendue = categorie
+            continue
+        if categorie is None and categorie_attendue and groupes:
+            categorie, categorie_attendue = categorie_attendue, None
+
+        if categorie:
+            for groupe in groupes:
+                for ref, pos, aa in developper(groupe):
+                    index.ajouter(classe, ref, pos, aa, categorie=categorie)
+            continue
+
+        # Ligne descriptive : note attachée aux mutations en tête de l'entrée (« K65R : ... », « V179D + K103R → ... »,
+        # « T97A est ... »), pas à celles citées dans le texte (M184V dans la note de K65R) ; une entrée titrée par
+        # une molécule ou une catégorie (« Hypersusceptibilité : I50L, L76V ») vaut pour toute sa liste ;
+        # sans mutation, effet de classe
+        note = re.sub(r"\*\*", "", texte_ligne).strip()
+        if groupes:
+            tete = re.split(r":|→", note, maxsplit=1)
+            if len(tete) > 1 and MUTATION_GROUPE.search(tete[0]):
+                groupes = MUTATION_GROUPE.findall(tete[0])
+            elif MUTATION_GROUPE.match(note):
+                groupes = groupes[:1]
+            for groupe in groupes:
+                for ref, pos, aa in developper(groupe):
+                    index.ajouter(classe, ref, pos, aa, note=note)
+        elif dans_effets and note and not note.endswith(":") and note not in index.classes[classe]["effets"]:
+            index.classes[classe]["effets"].append(note)
+
+    return index
+
+@lru_cache(maxsize=4)
+def _charger_index(path, mtime):
+    with open(path, "r", encoding="utf-8") as f:
+        return compiler_reference(f.read())
+
+def charger_index(path=MEMORY_FILE):
+    """Index compilé (mis en cache, recompilé si le fichier change)"""
+    if not os.path.exists(path):
+        return IndexMutations()
+    return _charger_index(path, os.path.getmtime(path))
+
+# === 2) Contexte de prompt ===
+SECTION_TEXTE = re.compile(r"^Mutations (PR|RT|IN): (.*)$", re.MULTILINE)   # cf. prompt_patient.formater_mutations
+MUTATION_TEXTE = re.compile(r"\b[A-Z]\d{1,3}[A-Z]{1,6}\b")
+
+def mutations_depuis_prompt(user_msg):
+    """Retrouve (section, mutation) dans un prompt utilisateur déjà formaté"""
+    for match in SECTION_TEXTE.finditer(user_msg or ""):
+        for mut in MUTATION_TEXTE.findall(match.group(2)):
+            yield match.group(1), mut
+
+def contexte_reference(user_msg, mutations=None, path=MEMORY_FILE):
+    """Faits de référence pertinents pour le patient au lieu du fichier mémoire complet"""
+    index = charger_index(path)
+    if mutations is not None:
+        annotations = index.annoter_blocs(mutations)
+    else:
+        annotations = []
+        for section, mut in mutations_depuis_prompt(user_msg):
+            annotations.extend(index.annoter(section, mut))
+    return index.faits_pertinents(annotations)
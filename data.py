@@ -3,25 +3,28 @@ from pathlib import Path
 from datetime import date
 from extract import extract_info_from_text
 from extract2 import extract_note_and_interpretation
+from dataset_shards import ShardWriter, construire_exemple
+from registre_patients import ouvrir_registre, enregistrer_patient
+from pipeline_rapport import apparier_fichiers
+from prompt_patient import construire_user_prompt
+from profilage import profiler
 
 # 📁 Racine où se trouvent tous les dossiers patients (à adapter)
 DOSSIER_RACINE = Path(r".\Dossier_patient")
 DOSSIER_OUTPUT = Path(r".\data_json")
 DOSSIER_OUTPUT.mkdir(parents=True, exist_ok=True)
+DOSSIER_SHARDS = Path(r".\phi_train_shards")
+FORMAT_SHARDS = "jsonl"  # ou "parquet" (nécessite pyarrow)
+REGISTRE_PATH = Path(r".\registre_patients.db")
 
-# 🔍 Recherche récursive de tous les fichiers .docx
-fichiers = list(DOSSIER_RACINE.rglob("*.docx"))
+# 🔍 Recherche récursive des .docx, regroupés par patient à partir de leur nom
+# (ex: P001_TR.docx et P001_Stanford.docx, P001_note.docx et P001_mutation.docx)
+patients = apparier_fichiers(DOSSIER_RACINE)
 
-# Regroupe les fichiers par patient à partir de leur nom (ex: P001_note.docx et P001_mut.docx)
-patients = {}
-for f in fichiers:
-    name = f.stem.lower()
-    if "TR" in name:
-        code = name.replace("_note", "").upper()
-        patients.setdefault(code, {})["note"] = f
-    elif "Stanford" in name or "mutation" in name:
-        code = name.replace("_mut", "").replace("_mutation", "").upper()
-        patients.setdefault(code, {})["mut"] = f
+# 🗃️ Écriture en flux des exemples d'entraînement (instruction/input/output)
+writer = ShardWriter(DOSSIER_SHARDS, format=FORMAT_SHARDS)
+# 🗂️ Registre indexé (SQLite) pour les requêtes de cohorte
+registre = ouvrir_registre(REGISTRE_PATH)
 
 # 🔁 Traitement de chaque patient ayant une paire complète
 for code, fichiers in patients.items():
@@ -32,8 +35,10 @@ for code, fichiers in patients.items():
         continue
 
     try:
-        data_note = extract_note_and_interpretation(str(note_path))
-        data_mut = extract_info_from_text(str(mut_path))
+        # PROFILAGE=1 : profil CPU/allocations de l'extraction de chaque patient
+        with profiler(f"etl_{code}"):
+            data_note = extract_note_and_interpretation(str(note_path))
+            data_mut = extract_info_from_text(str(mut_path))
 
         json_data = {
             "code_patient": code,
@@ -52,46 +57,8 @@ for code, fichiers in patients.items():
             }
         }
 
-        # Création de input/output
-        input_parts = [
-            f"Code du patient: {code}",
-            f"Sexe: {json_data['sexe']}",
-            f"Date naissance: {json_data['date_naissance']}",
-            "Observance: inconnu"
-        ]
-
-        for t in json_data["historique_therapeutique"]:
-            input_parts.append(f"Traitement: {t['arv']} | Début: {t['debut']} | Fin: {t['fin']} | Raison: {t.get('raison_changement', '')}")
-        for cv in json_data["charges_virales"]:
-            input_parts.append(f"CV: {cv['valeur']} copies/ml le {cv['date']}")
-        for cd4 in json_data["taux_cd4"]:
-            input_parts.append(f"Taux_CD4: {cd4['valeur']} cellules/ml le {cd4['date']}")
-        for bloc in data_mut.get("mutations", []):
-            section = bloc.get("Section", "inconnue")
-            mutation_texts = []
-            if section == "RT" and isinstance(bloc.get("Mutations_majeures", [])[0], dict):
-                nrtis = bloc["Mutations_majeures"][0].get("NRTIs", [])
-                nnrtis = bloc["Mutations_majeures"][1].get("NNRTIS", [])
-                if nrtis: mutation_texts.append(f"NRTIs: {', '.join(nrtis)}")
-                if nnrtis: mutation_texts.append(f"NNRTIs: {', '.join(nnrtis)}")
-            else:
-                for k in ["Mutations_majeures", "Mutations_accessoires", "Autres_mutations"]:
-                    if bloc.get(k): mutation_texts.append(f"{k.replace('_', ' ').capitalize()}: {', '.join(bloc[k])}")
-            if mutation_texts:
-                input_parts.append(f"Mutation {section}: {' | '.join(mutation_texts)}")
-
-        for bloc in data_mut.get("scores", []):
-            section = bloc.get("section", "inconnue")
-            sous_section = bloc.get("sous_section", None)
-            scores = bloc.get("scores", {})
-            efficience = bloc.get("efficience", {})
-            section_label = f"{section} - {sous_section}" if sous_section else section
-            if scores:
-                input_parts.append(f"Scores {section_label}:")
-                for arv, val in scores.items():
-                    input_parts.append(f"  - {arv}: score={val}, efficience={efficience.get(arv, '')}")
-
-        json_data["input"] = "\n".join(input_parts)
+        # Entrée d'entraînement : même encodage que le prompt de l'interface et de l'API
+        json_data["input"] = construire_user_prompt(json_data, data_mut)
         json_data["output"] = {
             "Résultats": json_data["results"]["resultats"],
             "Note": json_data["results"]["note"],
@@ -101,8 +68,14 @@ for code, fichiers in patients.items():
         output_path = DOSSIER_OUTPUT / f"{code}.json"
         with open(output_path, "w", encoding="utf-8") as f:
             json.dump(json_data, f, ensure_ascii=False, indent=2)
+        writer.write(construire_exemple(json_data))
+        enregistrer_patient(registre, json_data)
 
         print(f"✅ Patient {code} traité et enregistré")
 
     except Exception as e:
         print(f"❌ Erreur avec {code} : {e}")
+
+manifest = writer.close()
+registre.close()
+print(f"🗃️ {manifest['total_records']} exemples écrits dans {len(manifest['shards'])} shard(s) ({DOSSIER_SHARDS})")
@@ -0,0 +1,189 @@
+import json
+import gzip
+import hashlib
+from pathlib import Path
+
+# === 0) Configuration ===
+DOSSIER_SHARDS = Path(r".\phi_train_shards")
+MANIFEST_NAME = "manifest.json"
+TAILLE_MAX_SHARD = 64 * 1024 * 1024      # octets non compressés par shard
+RECORDS_MAX_SHARD = 50_000
+
+# Instruction utilisée pour chaque exemple d'entraînement (cf. fine_tuning_phi4.ipynb)
+INSTRUCTION = (
+    "À partir des mutations génétiques, des scores d'efficacité des antirétroviraux (ARV) "
+    "et du contexte clinique du patient, rédige l'interprétation clinique du génotype VIH "
+    "en un seul paragraphe."
+)
+
+def construire_exemple(json_data, instruction=INSTRUCTION):
+    """Construit l'enregistrement instruction/input/output à partir d'un patient de data.py"""
+    output = json_data.get("output", {})
+    if isinstance(output, dict):
+        output = output.get("Interprétation_clinique", "")
+    return {
+        "instruction": instruction,
+        "input": json_data.get("input", ""),
+        "output": output or ""
+    }
+
+# === 1) Écriture en shards ===
+class ShardWriter:
+    """Écrit des enregistrements en flux dans des shards bornés en taille (JSONL gzip ou Parquet)"""
+
+    def __init__(self, dossier=DOSSIER_SHARDS, prefixe="phi_train", format="jsonl",
+                 taille_max=TAILLE_MAX_SHARD, records_max=RECORDS_MAX_SHARD):
+        if format not in ("jsonl", "parquet"):
+            raise ValueError(f"Format de shard inconnu : {format}")
+        if format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError("pyarrow est requis pour écrire des shards Parquet (pip install pyarrow)")
+
+        self.dossier = Path(dossier)
+        self.dossier.mkdir(parents=True, exist_ok=True)
+        self.prefixe = prefixe
+        self.format = format
+        self.taille_max = taille_max
+        self.records_max = records_max
+
+        self.shards = []
+        self._index = 0
+        self._buffer = []
+        self._n = 0
+        self._taille = 0
+        self._gz = None
+        self._fichier = None
+        self._chemin = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _nom_shard(self):
+        ext = "jsonl.gz" if self.format == "jsonl" else "parquet"
+        return f"{self.prefixe}-{self._index:05d}.{ext}"
+
+    def _ouvrir(self):
+        self._chemin = self.dossier / self._nom_shard()
+        if self.format == "jsonl":
+            self._fichier = open(self._chemin, "wb")
+            self._gz = gzip.GzipFile(fileobj=self._fichier, mode="wb", mtime=0)
+
+    def write(self, record):
+        """Ajoute un enregistrement au shard courant (rotation automatique si plein)"""
+        ligne = json.dumps(record, ensure_ascii=False) + "\n"
+        donnees = ligne.encode("utf-8")
+
+        if self._chemin is None:
+            self._ouvrir()
+
+        if self.format == "jsonl":
+            self._gz.write(donnees)
+        else:
+            self._buffer.append(record)
+        self._n += 1
+        self._taille += len(donnees)
+
+        if self._taille >= self.taille_max or self._n >= self.records_max:
+            self._fermer_shard()
+
+    def _fermer_shard(self):
+        if self._chemin is None:
+            return
+        if self.format == "jsonl":
+            self._gz.close()
+            self._fichier.close()
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pylist(self._buffer)
+            pq.write_table(table, self._chemin, compression="zstd")
+
+        self.shards.append({
+            "fichier": self._chemin.name,
+            "records": self._n,
+            "octets": self._chemin.stat().st_size,
+            "sha256": sha256_fichier(self._chemin)
+        })
+        self._index += 1
+        self._buffer = []
+        self._n = 0
+        self._taille = 0
+        self._gz = None
+        self._fichier = None
+        self._chemin = None
+
+    def close(self):
+        """Ferme le dernier shard et écrit le manifeste"""
+        self._fermer_shard()
+        manifest = {
+            "format": self.format,
+            "prefixe": self.prefixe,
+            "total_records": sum(s["records"] for s in self.shards),
+            "shards": self.shards
+        }
+        with open(self.dossier / MANIFEST_NAME, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return manifest
+
+def sha256_fichier(path, taille_bloc=1024 * 1024):
+    """Somme de contrôle SHA-256 d'un fichier, lue par blocs"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloc in iter(lambda: f.read(taille_bloc), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+# === 2) Lecture des shards ===
+def lire_manifest(dossier=DOSSIER_SHARDS):
+    with open(Path(dossier) / MANIFEST_NAME, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def fichiers_shards(dossier=DOSSIER_SHARDS):
+    """Liste ordonnée des shards (utilisable avec load_dataset(..., data_files=...))"""
+    manifest = lire_manifest(dossier)
+    return [str(Path(dossier) / s["fichier"]) for s in manifest["shards"]]
+
+def verifier_shards(dossier=DOSSIER_SHARDS):
+    """Vérifie les sommes de contrôle ; renvoie la liste des shards corrompus"""
+    manifest = lire_manifest(dossier)
+    return [s["fichier"] for s in manifest["shards"]
+            if sha256_fichier(Path(dossier) / s["fichier"]) != s["sha256"]]
+
+def lire_shards(dossier=DOSSIER_SHARDS):
+    """Itère sur tous les enregistrements, shard par shard (lecture séquentielle)"""
+    manifest = lire_manifest(dossier)
+    for shard in manifest["shards"]:
+        chemin = Path(dossier) / shard["fichier"]
+        if manifest["format"] == "jsonl":
+            with gzip.open(chemin, "rt", encoding="utf-8") as f:
+                for ligne in f:
+                    if ligne.strip():
+                        yield json.loads(ligne)
+        else:
+            import pyarrow.parquet as pq
+            yield from pq.read_table(chemin).to_pylist()
+
+def exporter_jsonl(dossier=DOSSIER_SHARDS, sortie="phi_train_clean.jsonl"):
+    """Fusionne les shards en un unique JSONL (format attendu par le notebook)"""
+    n = 0
+    with open(sortie, "w", encoding="utf-8") as f:
+        for record in lire_shards(dossier):
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            n += 1
+    return n
+
+if __name__ == "__main__":
+    import sys
+    dossier = sys.argv[1] if len(sys.argv) > 1 else DOSSIER_SHARDS
+    sortie = sys.argv[2] if len(sys.argv) > 2 else "phi_train_clean.jsonl"
+    corrompus = verifier_shards(dossier)
+    if corrompus:
+        print(f"❌ Shards corrompus : {', '.join(corrompus)}")
+        sys.exit(1)
+    n = exporter_jsonl(dossier, sortie)
+    print(f"✅ {n} exemples écrits dans {sortie}")
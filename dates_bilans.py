@@ -0,0 +1,115 @@
+import re
+from datetime import date
+from functools import lru_cache
+
+# === 0) Motifs précompilés ===
+DATE_JMA = re.compile(r"(\d{2})/(\d{2})/(\d{4})")   # 05/03/2021
+DATE_MA = re.compile(r"(\d{2})/(\d{4})")             # 03/2021 -> 1er du mois
+NON_CHIFFRE = re.compile(r"[^\d\x00]")
+SEPARATEUR = "\x00"
+
+MIN_YEAR = 1930
+
+# === 1) Valeurs unitaires (mémoïsées : les mêmes dates reviennent d'une ligne à l'autre) ===
+@lru_cache(maxsize=8192)
+def parser_date(texte):
+    """'05/03/2021' ou '03/2021' -> date (jour en premier), None si invalide"""
+    match = DATE_JMA.match(texte)
+    if match:
+        jour, mois, annee = int(match.group(1)), int(match.group(2)), int(match.group(3))
+    else:
+        match = DATE_MA.match(texte)
+        if not match:
+            return None
+        jour, mois, annee = 1, int(match.group(1)), int(match.group(2))
+    if mois > 12 and jour <= 12:
+        jour, mois = mois, jour   # saisie au format mois/jour
+    try:
+        return date(annee, mois, jour)
+    except ValueError:
+        return None
+
+@lru_cache(maxsize=8192)
+def date_iso(texte):
+    """Date d'un bilan au format YYYY-MM-DD (None si invalide)"""
+    d = parser_date(texte.strip())
+    return d.isoformat() if d else None
+
+def date_naissance(texte):
+    """Date de naissance au format dd/mm/YYYY ('' si absente ou antérieure à MIN_YEAR)"""
+    if not DATE_JMA.match(texte):
+        return ""
+    d = parser_date(texte)
+    return d.strftime("%d/%m/%Y") if d and d.year >= MIN_YEAR else ""
+
+def valeur_numerique(texte):
+    """'1 250 copies/ml' -> '1250'"""
+    return NON_CHIFFRE.sub("", texte)
+
+# === 2) Mode colonne : une colonne entière de tableau en un seul passage ===
+def dates_colonne(cellules):
+    """Dates ISO d'une colonne ; chaque valeur distincte n'est analysée qu'une fois"""
+    uniques = {c: date_iso(c) for c in set(cellules)}
+    return [uniques[c] for c in cellules]
+
+def valeurs_colonne(cellules):
+    """Chiffres de chaque cellule d'une colonne, avec une seule substitution sur la colonne jointe"""
+    if not cellules:
+        return []
+    return NON_CHIFFRE.sub("", SEPARATEUR.join(c.replace(SEPARATEUR, "") for c in cellules)).split(SEPARATEUR)
+
+def extraire_bilans(lignes):
+    """Charges virales (date col 2, valeur col 5) et CD4 (date col 2, valeur col 3) des lignes de tableau"""
+    lignes = [l for l in lignes if len(l) >= 4]
+    dates = dates_colonne([l[2] for l in lignes])
+    cd4 = valeurs_colonne([l[3] for l in lignes])
+    cv = valeurs_colonne([l[5] if len(l) >= 6 else "" for l in lignes])
+
+    charges_virales, taux_cd4 = [], []
+    for d, viremie, valeur_cd4 in zip(dates, cv, cd4):
+        if d is None:
+            continue
+        if viremie:
+            charges_virales.append({"valeur": viremie, "date": d})
+        if valeur_cd4:
+            taux_cd4.append({"valeur": valeur_cd4, "date": d})
+    return charges_virales, taux_cd4
+
+if __name__ == "__main__":
+    # Banc d'essai : note volumineuse synthétique, ligne par ligne vs colonnes
+    import sys, time, random
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    random.seed(0)
+    dates_possibles = [f"{j:02d}/{m:02d}/{a}" for a in range(2005, 2025) for m in range(1, 13) for j in (1, 10, 20)]
+    dates_possibles += [f"{m:02d}/{a}" for a in range(2005, 2025) for m in range(1, 13)]
+    lignes = [["", "", random.choice(dates_possibles), f"{random.randint(50, 900)} cell/µl", "",
+               f"{random.randint(20, 900000):,} copies/ml".replace(",", " ")] for _ in range(n)]
+
+    def ligne_par_ligne(lignes):
+        charges, taux = [], []
+        for l in lignes:
+            parser_date.cache_clear(); date_iso.cache_clear()
+            d = date_iso(l[2])
+            if d is None:
+                continue
+            if valeur_numerique(l[5]):
+                charges.append({"valeur": valeur_numerique(l[5]), "date": d})
+            if valeur_numerique(l[3]):
+                taux.append({"valeur": valeur_numerique(l[3]), "date": d})
+        return charges, taux
+
+    mesures = {}
+    debut = time.perf_counter(); ref = ligne_par_ligne(lignes); mesures["ligne par ligne (sans cache)"] = time.perf_counter() - debut
+    parser_date.cache_clear(); date_iso.cache_clear()
+    debut = time.perf_counter(); res = extraire_bilans(lignes); mesures["colonnes + mémoïsation"] = time.perf_counter() - debut
+    assert res == ref
+    try:
+        import pandas as pd
+        debut = time.perf_counter()
+        for l in lignes[:2000]:
+            pd.to_datetime(l[2] if l[2].count("/") == 2 else "01/" + l[2], dayfirst=True, errors="coerce")
+        mesures["pandas to_datetime par cellule (extrapolé)"] = (time.perf_counter() - debut) * n / min(n, 2000)
+    except ImportError:
+        pass
+    for nom, duree in mesures.items():
+        print(f"{nom:45s} {duree * 1000:9.1f} ms  ({n / duree:,.0f} lignes/s)")
@@ -0,0 +1,192 @@
+import re
+
+# === 0) Molécules autorisées dans un schéma thérapeutique ===
+# Associations proposées dans l'interface (historique thérapeutique)
+ARV_OPTIONS = ["TDF+3TC+NVP", "TDF+3TC+EFV", "AZT+3TC+NVP", "ABC+3TC+LPV/r", "ABC+3TC+ATV/r",
+               "TDF+3TC+DTG", "TDF+3TC+ATV/r", "AZT+3TC+ATV/r", "ABC+3TC+NVP", "Autres"]
+
+MOLECULE_VALIDE = re.compile(r"^[A-Z0-9][A-Za-z0-9]*(?:/r)?$")
+LIGNE_SCORES = re.compile(r"^Scores [^:]*: (.*)$", re.MULTILINE)   # cf. prompt_patient.formater_scores
+SCORE_PROMPT = re.compile(r"([A-Za-z0-9/]+) -?\d+(?=,|\s;|$)")
+DELIMITEURS = set(" ,.;:)\n")
+FENETRE = 16   # tokens décodés en fin de séquence pour savoir si l'on est dans un schéma
+FIN_QUEUE = re.compile(r"([\w/]*)(\*?[ \t]*)$")         # dernier mot avant un éventuel '+' : mot, '*' et espaces
+AVANT_PLUS = re.compile(r"^([\w/]*)(\*?[ \t]*)$")       # texte d'un token avant son '+' qui prolonge ce mot
+MOT_FINAL = re.compile(r"[\w/]+(?=\*?[ \t]*$)")
+MUTATION = re.compile(r"^[A-Z]\d{1,3}(?:[A-Z]*|ins|del)$")  # M41L+T215Y, Q148H+G140S : combinaisons de mutations
+HORS_SCHEMA = frozenset({"CD4", "CD8"})                    # CD4+, CD8+
+
+def molecules_autorisees(scores=None, user_prompt=None):
+    """Abréviations ARV connues : arv_options, table de règles et molécules des tableaux de scores du patient"""
+    noms = {m for option in ARV_OPTIONS if option != "Autres" for m in option.split("+")}
+    try:
+        from moteur_scores import charger_moteur
+        noms |= set(charger_moteur().medicaments)
+    except OSError:
+        pass
+    for bloc in scores or []:
+        noms |= set(bloc.get("scores", {}))
+    if user_prompt:
+        for ligne in LIGNE_SCORES.findall(user_prompt):
+            noms |= set(SCORE_PROMPT.findall(ligne))
+    return frozenset(n for n in noms if MOLECULE_VALIDE.match(n))
+
+def variantes(noms):
+    """'LPV/r' s'écrit aussi 'LPV/R' dans les dossiers"""
+    return frozenset(noms) | frozenset(n[:-1] + "R" for n in noms if n.endswith("/r"))
+
+# === 1) Contrainte de décodage ===
+_vocabulaires = {}
+_contraintes = {}
+
+def vocabulaire(tokenizer):
+    """Texte décodé de chaque token (calculé une seule fois par tokenizer)"""
+    cle = id(tokenizer)
+    if cle not in _vocabulaires:
+        _vocabulaires[cle] = tokenizer.batch_decode([[i] for i in range(len(tokenizer))])
+    return _vocabulaires[cle]
+
+class ContrainteSchema:
+    """LogitsProcessor : après 'molécule+', seuls les tokens qui prolongent une molécule connue sont permis ;
+    un '+' après un mot qui a l'allure d'une molécule n'est permis que si elle est connue (la première molécule
+    d'un schéma est donc contrainte aussi ; mutations et CD4+ restent libres)"""
+
+    def __init__(self, tokenizer, molecules, fenetre=FENETRE):
+        self.tokenizer = tokenizer
+        self.noms = sorted(variantes(molecules), key=len, reverse=True)
+        self.connus = frozenset(self.noms)
+        self.initiales = {n[0] for n in self.noms}
+        self.fenetre = fenetre
+        alternatives = "|".join(re.escape(n) for n in self.noms)
+        self.en_schema = re.compile(rf"(?<![\w/])(?:{alternatives})\*?\s*\+\s*([A-Za-z0-9/]*)$")
+        self._masques = {}
+        self._tokens_plus = None
+        self._candidats = {}
+        self._interdits = {}
+
+    def suite_valide(self, texte):
+        """`texte` (après un '+') commence une molécule connue, éventuellement suivie d'un délimiteur"""
+        if any(n.startswith(texte) for n in self.noms):
+            return True
+        for n in self.noms:
+            if not texte.startswith(n):
+                continue
+            reste = texte[len(n):].lstrip("*")
+            if not reste or reste[0] in DELIMITEURS:
+                return True
+            if reste[0] == "+":
+                suite = reste[1:].lstrip(" ")
+                if not suite or self.suite_valide(suite):
+                    return True
+        return False
+
+    def token_autorise(self, chaine, partiel):
+        texte = partiel + chaine if partiel else chaine.lstrip(" ")
+        if not texte:
+            return True   # espaces entre '+' et la molécule
+        if not partiel and texte[0] not in self.initiales:
+            return False
+        return self.suite_valide(texte)
+
+    def masque(self, partiel, taille, device):
+        """Masque booléen des tokens permis pour un début de molécule donné (mis en cache)"""
+        cle = (partiel, taille, str(device))
+        if cle not in self._masques:
+            import torch
+            permis = [self.token_autorise(chaine, partiel) for chaine in vocabulaire(self.tokenizer)]
+            masque = torch.zeros(taille, dtype=torch.bool)
+            n = min(taille, len(permis))
+            masque[:n] = torch.tensor(permis[:n], dtype=torch.bool)
+            self._masques[cle] = masque.to(device) if masque.any() else None
+        return self._masques[cle]
+
+    def molecule_inconnue(self, mot):
+        """`mot` a l'allure d'une abréviation ARV mais n'est pas connu : un '+' après lui ouvrirait un schéma inventé"""
+        if mot not in self._candidats:
+            self._candidats[mot] = (mot not in self.connus and MOLECULE_VALIDE.match(mot) is not None
+                                    and not MUTATION.match(mot) and mot not in HORS_SCHEMA)
+        return self._candidats[mot]
+
+    def _classer_tokens_plus(self):
+        """Tokens contenant un '+', classés une fois : interdits d'office (mot complet dans le token), ou
+        regroupés par (début de mot, séparateur) quand leur '+' prolonge le dernier mot de la queue"""
+        fixes, prolongent = [], {}
+        for i, chaine in enumerate(vocabulaire(self.tokenizer)):
+            if "+" not in chaine:
+                continue
+            avant = chaine[:chaine.index("+")]
+            match = AVANT_PLUS.match(avant)
+            if match:
+                prolongent.setdefault(match.groups(), []).append(i)
+            else:
+                mot = MOT_FINAL.search(avant)
+                if mot and self.molecule_inconnue(mot.group(0)):
+                    fixes.append(i)
+        self._tokens_plus = (fixes, prolongent)
+
+    def plus_interdits(self, queue):
+        """Ids des tokens dont le '+' suivrait une molécule inconnue (ex. 'XYZ' + '+', 'XY' + 'Z+') ; mis en cache
+        par fin de queue"""
+        if self._tokens_plus is None:
+            self._classer_tokens_plus()
+        cle = FIN_QUEUE.search(queue).groups()
+        if cle not in self._interdits:
+            mot, separateur = cle
+            fixes, prolongent = self._tokens_plus
+            interdits = list(fixes)
+            for (debut, sep), ids in prolongent.items():
+                if debut:
+                    candidat = debut if separateur else mot + debut
+                else:
+                    candidat = mot if re.fullmatch(r"\*?[ \t]*", separateur + sep) else ""
+                if candidat and self.molecule_inconnue(candidat):
+                    interdits += ids
+            if len(self._interdits) > 4096:
+                self._interdits.clear()
+            self._interdits[cle] = interdits
+        return self._interdits[cle]
+
+    def __call__(self, input_ids, scores):
+        for i in range(input_ids.shape[0]):
+            queue = self.tokenizer.decode(input_ids[i, -self.fenetre:], skip_special_tokens=True)
+            match = self.en_schema.search(queue)
+            if not match:
+                interdits = [t for t in self.plus_interdits(queue) if t < scores.shape[-1]]
+                if interdits:
+                    scores[i, interdits] = float("-inf")
+                continue
+            masque = self.masque(match.group(1), scores.shape[-1], scores.device)
+            if masque is not None:
+                scores[i] = scores[i].masked_fill(~masque, float("-inf"))
+        return scores
+
+def processeur_schema(tokenizer, *user_prompts):
+    """LogitsProcessorList à passer au pipeline de génération (molécules des prompts du lot incluses)"""
+    from transformers import LogitsProcessorList
+    molecules = frozenset().union(*(molecules_autorisees(user_prompt=p) for p in user_prompts))
+    # Une contrainte (et ses masques) par ensemble de molécules : réutilisée d'un patient à l'autre
+    cle = (id(tokenizer), molecules)
+    if cle not in _contraintes:
+        _contraintes[cle] = ContrainteSchema(tokenizer, molecules)
+    return LogitsProcessorList([_contraintes[cle]])
+
+if __name__ == "__main__":
+    # Vérification sur un vocabulaire réduit : schémas inventés bloqués, mutations et CD4+ libres
+    class TokenizerTest:
+        vocab = ["+", " +", "Z+", "T215Y+", "G140S+", "3TC+", " DTG+", "+3", "a"]
+        def __len__(self):
+            return len(self.vocab)
+        def batch_decode(self, ids):
+            return [self.vocab[i[0]] for i in ids]
+
+    tok = TokenizerTest()
+    contrainte = ContrainteSchema(tok, {"TDF", "3TC", "DTG", "LPV/r"})
+    interdit = lambda queue, token: tok.vocab.index(token) in contrainte.plus_interdits(queue)
+    for queue, token in [("mutations M41L", "+"), ("M41L ", " +"), ("M41L*", "+"), ("Q148H", "+"),
+                         ("lymphocytes T CD4", "+"), ("CD8 ", " +"), ("Schéma TDF", "+"), ("TDF* ", " +"),
+                         ("TDF ", "3TC+"), ("TDF+3TC ", " DTG+"), ("proposer ", " +")]:
+        assert not interdit(queue, token), (queue, token)
+    for queue, token in [("Schéma XYZ", "+"), ("Schéma XY", "Z+"), ("XYZ ", " +"), ("TDF", "3TC+")]:
+        assert interdit(queue, token), (queue, token)
+    assert not interdit("M41L ", "T215Y+") and not interdit("Q148H ", "G140S+")
+    print("✅ Contrainte : M41L+T215Y, Q148H+G140S et CD4+ décodables ; XYZ+ bloqué")
@@ -0,0 +1,188 @@
+import re
+import json
+import time
+import zlib
+import hashlib
+import argparse
+import numpy as np
+from pathlib import Path
+from collections import defaultdict
+
+from dataset_shards import ShardWriter, lire_shards, MANIFEST_NAME
+
+# === 0) Configuration ===
+NB_PERMUTATIONS = 128
+TAILLE_SHINGLE = 3          # n-grammes de mots
+SEUIL_SORTIE = 0.9          # Jaccard estimé entre interprétations pour parler de quasi-doublon
+SEUIL_ENTREE = 0.8          # ... et entre contextes patients (0 = sortie seule)
+PART_HOLDOUT = 0.10
+GRAINE = 42
+PREMIER = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64(0xFFFFFFFF)
+MOT = re.compile(r"\w+", re.UNICODE)
+
+# === 1) Signatures MinHash ===
+class MinHasher:
+    """Signature MinHash (uint32) d'un texte à partir de ses n-grammes de mots"""
+
+    def __init__(self, nb_permutations=NB_PERMUTATIONS, taille_shingle=TAILLE_SHINGLE, graine=GRAINE):
+        rng = np.random.RandomState(graine)
+        self.a = rng.randint(1, 1 << 32, size=nb_permutations, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=nb_permutations, dtype=np.uint64)
+        self.nb_permutations = nb_permutations
+        self.taille_shingle = taille_shingle
+
+    def shingles(self, texte):
+        mots = MOT.findall((texte or "").lower())
+        k = min(self.taille_shingle, len(mots)) or 1
+        return {" ".join(mots[i:i + k]) for i in range(max(len(mots) - k + 1, 1))}
+
+    def signature(self, texte):
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in self.shingles(texte)), dtype=np.uint64)
+        # (a*x + b) mod p tronqué à 32 bits ; le dépassement uint64 est voulu (même schéma que datasketch)
+        with np.errstate(over="ignore"):
+            permutes = ((hashes[:, None] * self.a + self.b) % PREMIER) & MAX_HASH
+        return permutes.min(axis=0).astype(np.uint32)
+
+def jaccard_estime(sig1, sig2):
+    return float(np.mean(sig1 == sig2))
+
+# === 2) Index LSH (bandes) ===
+def bandes_optimales(nb_permutations, seuil):
+    """(bandes, lignes) dont le seuil de la courbe en S (1/b)^(1/r) est le plus proche de `seuil`"""
+    choix = [(b, nb_permutations // b) for b in range(1, nb_permutations + 1) if nb_permutations % b == 0]
+    return min(choix, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - seuil))
+
+def paires_candidates(signatures, seuil):
+    """Paires (i, j) partageant au moins une bande de signature"""
+    bandes, lignes = bandes_optimales(signatures.shape[1], seuil)
+    paires = set()
+    for k in range(bandes):
+        seaux = defaultdict(list)
+        bloc = np.ascontiguousarray(signatures[:, k * lignes:(k + 1) * lignes])
+        for i in range(len(bloc)):
+            seaux[bloc[i].tobytes()].append(i)
+        for membres in seaux.values():
+            for x in range(len(membres)):
+                for y in range(x + 1, len(membres)):
+                    paires.add((membres[x], membres[y]))
+    return paires
+
+# === 3) Regroupement des quasi-doublons ===
+def _racine(parents, i):
+    while parents[i] != i:
+        parents[i] = parents[parents[i]]
+        i = parents[i]
+    return i
+
+def grouper_doublons(exemples, seuil_sortie=SEUIL_SORTIE, seuil_entree=SEUIL_ENTREE, minhasher=None):
+    """Indice du représentant (premier exemple du groupe) de chaque exemple
+
+    Deux exemples sont quasi-doublons si leurs interprétations ET leurs contextes dépassent
+    les seuils ; les candidats viennent du LSH sur la sortie, vérifiés par Jaccard estimé.
+    """
+    minhasher = minhasher or MinHasher()
+    sig_sortie = np.stack([minhasher.signature(e.get("output", "")) for e in exemples]) if exemples \
+        else np.zeros((0, minhasher.nb_permutations), np.uint32)
+    sig_entree = np.stack([minhasher.signature(e.get("input", "")) for e in exemples]) if exemples \
+        else np.zeros((0, minhasher.nb_permutations), np.uint32)
+
+    parents = list(range(len(exemples)))
+    for i, j in paires_candidates(sig_sortie, seuil_sortie):
+        if jaccard_estime(sig_sortie[i], sig_sortie[j]) < seuil_sortie:
+            continue
+        if seuil_entree and jaccard_estime(sig_entree[i], sig_entree[j]) < seuil_entree:
+            continue
+        ri, rj = _racine(parents, i), _racine(parents, j)
+        if ri != rj:
+            parents[max(ri, rj)] = min(ri, rj)   # le plus ancien exemple représente le groupe
+    return [_racine(parents, i) for i in range(len(exemples))]
+
+def dans_holdout(exemple, part=PART_HOLDOUT):
+    """Tirage déterministe (stable d'une exécution à l'autre) sur le contenu de l'exemple"""
+    cle = (exemple.get("input", "") + "\x00" + exemple.get("output", "")).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(cle, digest_size=8).digest(), "big") % 10_000 < part * 10_000
+
+def separer(exemples, representants, part_holdout=PART_HOLDOUT, dedup=True):
+    """(entraînement, holdout) : un groupe entier part en holdout (représentant seul) pour éviter
+    qu'un quasi-doublon d'un exemple d'évaluation reste dans l'entraînement"""
+    train, holdout, retires, fuites = [], [], 0, 0
+    for i, e in enumerate(exemples):
+        rep = representants[i]
+        if dans_holdout(exemples[rep], part_holdout):
+            if rep == i:
+                holdout.append(e)
+            else:
+                fuites += 1
+        elif dedup and rep != i:
+            retires += 1
+        else:
+            train.append(e)
+    return train, holdout, {"doublons_retires": retires, "fuites_evitees": fuites}
+
+# === 4) Corpus ===
+def lire_corpus(source):
+    """Dossier de shards (manifest.json) ou fichier JSONL"""
+    source = Path(source)
+    if (source / MANIFEST_NAME).exists():
+        return list(lire_shards(source))
+    with open(source, "r", encoding="utf-8") as f:
+        return [json.loads(ligne) for ligne in f if ligne.strip()]
+
+def nb_mots(exemples):
+    return sum(len(MOT.findall(e.get("input", ""))) + len(MOT.findall(e.get("output", ""))) for e in exemples)
+
+def dedupliquer(source, sortie, holdout_path, seuil_sortie=SEUIL_SORTIE, seuil_entree=SEUIL_ENTREE,
+                part_holdout=PART_HOLDOUT, dedup=True, format="jsonl"):
+    debut = time.perf_counter()
+    exemples = lire_corpus(source)
+    representants = grouper_doublons(exemples, seuil_sortie, seuil_entree)
+    train, holdout, compteurs = separer(exemples, representants, part_holdout, dedup)
+
+    with ShardWriter(sortie, prefixe="phi_train", format=format) as writer:
+        for e in train:
+            writer.write(e)
+    with open(holdout_path, "w", encoding="utf-8") as f:
+        for e in holdout:
+            f.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+    # Le notebook complète chaque exemple à max_length : la durée d'une époque suit le nombre d'exemples
+    base = len(exemples) - len(holdout) - compteurs["fuites_evitees"]
+    rapport = {
+        "source": str(source),
+        "dedup": dedup,
+        "seuil_sortie": seuil_sortie,
+        "seuil_entree": seuil_entree,
+        "exemples": len(exemples),
+        "groupes": len(set(representants)),
+        "holdout": len(holdout),
+        **compteurs,
+        "entrainement": len(train),
+        "mots_avant": nb_mots(exemples),
+        "mots_apres": nb_mots(train),
+        "ratio_duree_epoque": round(len(train) / base, 3) if base else None,
+        "duree_s": round(time.perf_counter() - debut, 2)
+    }
+    with open(Path(sortie) / "dedup_rapport.json", "w", encoding="utf-8") as f:
+        json.dump(rapport, f, ensure_ascii=False, indent=2)
+    return rapport
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Suppression des quasi-doublons du corpus de fine-tuning (MinHash/LSH)")
+    parser.add_argument("--source", default=r".\phi_train_shards", help="Shards (manifest.json) ou JSONL")
+    parser.add_argument("--sortie", default=None, help=r"Dossier des shards produits (défaut .\phi_train_dedup)")
+    parser.add_argument("--holdout", default=r".\phi_holdout.jsonl")
+    parser.add_argument("--seuil-sortie", type=float, default=SEUIL_SORTIE)
+    parser.add_argument("--seuil-entree", type=float, default=SEUIL_ENTREE)
+    parser.add_argument("--part-holdout", type=float, default=PART_HOLDOUT)
+    parser.add_argument("--sans-dedup", action="store_true",
+                        help=r"Référence : même holdout, doublons conservés (défaut .\phi_train_base)")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    args = parser.parse_args()
+
+    sortie = args.sortie or (r".\phi_train_base" if args.sans_dedup else r".\phi_train_dedup")
+    rapport = dedupliquer(args.source, sortie, args.holdout, args.seuil_sortie, args.seuil_entree,
+                          args.part_holdout, not args.sans_dedup, args.format)
+    print(f"✅ {rapport['exemples']} exemples -> {rapport['entrainement']} en entraînement, {rapport['holdout']} en holdout "
+          f"({rapport['doublons_retires']} doublons retirés, {rapport['fuites_evitees']} fuites évitées) "
+          f"| durée d'époque estimée x{rapport['ratio_duree_epoque']} | {rapport['duree_s']}s")
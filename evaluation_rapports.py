@@ -0,0 +1,281 @@
+import os
+import re
+import csv
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from prompt_patient import construire_user_prompt
+from validation_rapport import schemas_therapeutiques
+from backends_inference import REPONSE_ERREUR
+
+# === 0) Configuration ===
+DOSSIER_DATA = Path(r".\data_json")
+HOLDOUT_PATH = Path(r".\phi_holdout.jsonl")
+DOSSIER_EVALUATION = Path(r".\evaluation")
+# Plusieurs patients en vol à la fois seulement avec INFERENCE_WORKER=1 (batching) : en processus, les threads
+# se disputeraient un seul modèle et les latences mesurées incluraient l'attente
+PARALLELISME = int(os.environ.get("EVALUATION_PARALLELISME", "4" if os.environ.get("INFERENCE_WORKER") else "1"))
+PERCENTILES = (50, 90, 95, 99)
+MOT = re.compile(r"\w+(?:['’]\w+)?")
+CODE_INPUT = re.compile(r"^Patient: code=([^|\n]+)", re.MULTILINE)   # cf. prompt_patient.formater_patient
+
+# === 1) Jeu d'évaluation ===
+def codes_holdout(path=HOLDOUT_PATH):
+    """Codes patients des exemples tenus à l'écart de l'entraînement (dedup_corpus.py)"""
+    codes = set()
+    with open(path, "r", encoding="utf-8") as f:
+        for ligne in f:
+            if ligne.strip():
+                match = CODE_INPUT.search(json.loads(ligne).get("input", ""))
+                if match:
+                    codes.add(match.group(1).strip())
+    return codes
+
+def charger_cas(dossier=DOSSIER_DATA, codes=None, limite=None):
+    """Dossiers data.py ayant une interprétation de référence : [{"code", "user_prompt", "mutations", "reference"}]"""
+    cas = []
+    for path in sorted(Path(dossier).glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            patient = json.load(f)
+        code = patient.get("code_patient", path.stem)
+        reference = (patient.get("results") or {}).get("interpretation", "")
+        if not reference.strip() or (codes is not None and code not in codes):
+            continue
+        extraction = patient.get("extraction_texte") or {}
+        cas.append({
+            "code": code,
+            "user_prompt": construire_user_prompt(patient, extraction),
+            "mutations": extraction.get("mutations"),
+            "reference": reference
+        })
+    return cas[:limite] if limite else cas
+
+# === 2) Métriques de texte (calculées pour tout le lot en une fois) ===
+def mots(texte):
+    return [m.lower() for m in MOT.findall(texte or "")]
+
+def matrice_comptes(listes, vocabulaire):
+    """Comptes (n_textes x taille_vocabulaire) des éléments de chaque liste"""
+    comptes = np.zeros((len(listes), len(vocabulaire)), dtype=np.float64)
+    for i, elements in enumerate(listes):
+        if elements:
+            np.add.at(comptes[i], [vocabulaire[e] for e in elements], 1)
+    return comptes
+
+def f1_recouvrement(candidats, references):
+    """ROUGE-N (F1) ligne à ligne à partir des listes d'éléments (mots ou n-grammes)"""
+    vocabulaire = {}
+    for elements in candidats + references:
+        for e in elements:
+            vocabulaire.setdefault(e, len(vocabulaire))
+    c, r = matrice_comptes(candidats, vocabulaire), matrice_comptes(references, vocabulaire)
+    commun = np.minimum(c, r).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision, rappel = commun / c.sum(axis=1), commun / r.sum(axis=1)
+        f1 = 2 * precision * rappel / (precision + rappel)
+    return np.nan_to_num(f1)
+
+def bigrammes(m):
+    return [(m[i], m[i + 1]) for i in range(len(m) - 1)]
+
+def lcs(a, b):
+    """Longueur de la plus longue sous-séquence commune (une ligne de la table à la fois)"""
+    if not a or not b:
+        return 0
+    vocab = {}
+    a = np.array([vocab.setdefault(x, len(vocab)) for x in a])
+    b = np.array([vocab.setdefault(x, len(vocab)) for x in b])
+    ligne = np.zeros(len(b) + 1, dtype=np.int32)
+    for x in a:
+        # LCS[i][j] = max(LCS[i-1][j], LCS[i][j-1], LCS[i-1][j-1] + égalité) : maximum cumulé sur j
+        candidat = np.maximum(ligne[1:], np.where(b == x, ligne[:-1] + 1, 0))
+        ligne[1:] = np.maximum.accumulate(candidat)
+    return int(ligne[-1])
+
+def rouge_l(candidats, references):
+    res = np.zeros(len(candidats))
+    for i, (c, r) in enumerate(zip(candidats, references)):
+        n = lcs(c, r)
+        if n:
+            precision, rappel = n / len(c), n / len(r)
+            res[i] = 2 * precision * rappel / (precision + rappel)
+    return res
+
+def cosinus_tfidf(candidats, references):
+    """Similarité cosinus TF-IDF (idf calculé sur les textes du lot)"""
+    vocabulaire = {}
+    for elements in candidats + references:
+        for e in elements:
+            vocabulaire.setdefault(e, len(vocabulaire))
+    c, r = matrice_comptes(candidats, vocabulaire), matrice_comptes(references, vocabulaire)
+    documents = np.vstack([c, r]) > 0
+    idf = np.log((1 + len(documents)) / (1 + documents.sum(axis=0))) + 1
+    c, r = c * idf, r * idf
+    normes = np.linalg.norm(c, axis=1) * np.linalg.norm(r, axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.nan_to_num((c * r).sum(axis=1) / normes)
+
+def molecules(schemas):
+    return {m.rstrip("*").upper() for s in schemas for m in s.split("+")}
+
+def accord_schemas(generes, references):
+    """Accord sur le traitement proposé : premier schéma généré identique (en molécules) à un schéma
+    de la référence, et Jaccard des molécules citées dans les schémas"""
+    concordant, jaccard = np.zeros(len(generes)), np.full(len(generes), np.nan)
+    for i, (g, r) in enumerate(zip(generes, references)):
+        sg, sr = schemas_therapeutiques(g), schemas_therapeutiques(r)
+        if not sr:
+            concordant[i] = np.nan      # référence sans schéma : non évaluable
+            continue
+        if sg:
+            concordant[i] = any(molecules(sg[:1]) == molecules([s]) for s in sr)
+        mg, mr = molecules(sg), molecules(sr)
+        jaccard[i] = len(mg & mr) / len(mg | mr)
+    return concordant, jaccard
+
+def metriques_texte(generes, references):
+    mg, mr = [mots(t) for t in generes], [mots(t) for t in references]
+    concordant, jaccard = accord_schemas(generes, references)
+    return {
+        "rouge1": f1_recouvrement(mg, mr),
+        "rouge2": f1_recouvrement([bigrammes(m) for m in mg], [bigrammes(m) for m in mr]),
+        "rougeL": rouge_l(mg, mr),
+        "cosinus_tfidf": cosinus_tfidf(mg, mr),
+        "schema_concordant": concordant,
+        "jaccard_molecules": jaccard
+    }
+
+# === 3) Rejeu des cas dans le pipeline ===
+def compter_tokens(texte):
+    """Tokens du tokenizer local s'il est chargé, sinon mots (unité précisée dans le bilan)"""
+    tokenizer = getattr(sys.modules.get("generate_interpretation"), "tokenizer", None)
+    if tokenizer is not None:
+        return len(tokenizer.encode(texte, add_special_tokens=False)), "tokens"
+    return len(mots(texte)), "mots"
+
+def generer_cas(cas, adaptateur=None):
+    from pipeline_rapport import generer_rapport
+    debut = time.perf_counter()
+    try:
+        rapport = generer_rapport(cas["user_prompt"], cas["mutations"], profil=False, adaptateur=adaptateur)
+        # Échec de la génération locale : réponse vide ou message d'excuse, pas un rapport à noter
+        premiere = rapport.get("premiere", "").strip()
+        erreur = None if premiere and premiere != REPONSE_ERREUR else "Génération locale échouée"
+    except Exception as e:
+        rapport, erreur = {"premiere": "", "finale": "", "durees": {}}, str(e)
+    return {**cas, "rapport": rapport, "latence": time.perf_counter() - debut, "erreur": erreur}
+
+def rejouer(cas, parallelisme=PARALLELISME, adaptateur=None):
+    from pipeline_rapport import charger_generation
+    charger_generation()   # chargement du modèle hors mesure de latence
+    resultats = []
+    with ThreadPoolExecutor(max_workers=parallelisme) as pool:
+        futures = [pool.submit(generer_cas, c, adaptateur) for c in cas]
+        for i, future in enumerate(as_completed(futures), 1):
+            r = future.result()
+            resultats.append(r)
+            print(f"{'❌' if r['erreur'] else '✅'} [{i}/{len(cas)}] {r['code']} en {r['latence']:.1f}s")
+    return sorted(resultats, key=lambda r: r["code"])
+
+# === 4) Bilan qualité / vitesse ===
+def _moyenne(x):
+    x = np.asarray(x, dtype=np.float64)
+    return round(float(np.nanmean(x)), 4) if np.isfinite(x).any() else None
+
+def bilan(resultats, duree_totale, adaptateur=None, etiquette=""):
+    ok = [r for r in resultats if not r["erreur"]]
+    metriques = metriques_texte([r["rapport"]["finale"] for r in ok], [r["reference"] for r in ok])
+    metriques_premiere = metriques_texte([r["rapport"]["premiere"] for r in ok], [r["reference"] for r in ok])
+    latences = np.array([r["latence"] for r in ok])
+    tokens = [compter_tokens(r["rapport"]["finale"]) for r in ok]
+    unite = tokens[0][1] if tokens else "tokens"
+    total_tokens = sum(n for n, _ in tokens)
+    duree_generation = float(latences.sum()) if len(latences) else 0.0
+
+    for i, r in enumerate(ok):
+        r["metriques"] = {k: (None if np.isnan(v[i]) else round(float(v[i]), 4)) for k, v in metriques.items()}
+    return {
+        "etiquette": etiquette,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "configuration": {
+            "backend_local": os.environ.get("BACKEND_LOCAL", os.environ.get("BACKEND", "hf")),
+            "backend_raffinement": os.environ.get("BACKEND_RAFFINEMENT", os.environ.get("BACKEND", "ollama")),
+            "adaptateur": adaptateur or os.environ.get("ADAPTATEUR"),
+            "decodage_contraint": bool(os.environ.get("DECODAGE_CONTRAINT")),
+            "raffinement_toujours": bool(os.environ.get("RAFFINEMENT_TOUJOURS")),
+            "inference_worker": bool(os.environ.get("INFERENCE_WORKER"))
+        },
+        "cas": len(resultats),
+        "erreurs": len(resultats) - len(ok),
+        "qualite": {k: _moyenne(v) for k, v in metriques.items()},
+        "qualite_premiere_version": {k: _moyenne(v) for k, v in metriques_premiere.items()},
+        "validation_premiere_version": _moyenne([r["rapport"].get("validation", {}).get("valide", np.nan) for r in ok]),
+        "taux_raffinement": _moyenne([r["rapport"].get("raffinement", np.nan) for r in ok]),
+        "vitesse": {
+            **{f"latence_p{p}_s": round(float(np.percentile(latences, p)), 2) if len(latences) else None
+               for p in PERCENTILES},
+            "latence_locale_moyenne_s": _moyenne([r["rapport"]["durees"].get("locale", np.nan) for r in ok]),
+            "latence_ollama_moyenne_s": _moyenne([r["rapport"]["durees"].get("ollama", np.nan) for r in ok]),
+            f"{unite}_par_s": round(total_tokens / duree_generation, 2) if duree_generation else None,
+            f"{unite}_par_s_debit": round(total_tokens / duree_totale, 2) if duree_totale else None,
+            "patients_par_min": round(len(ok) / duree_totale * 60, 2) if duree_totale else None,
+            "duree_totale_s": round(duree_totale, 1)
+        }
+    }
+
+def ecrire_bilan(resultats, scorecard, sortie=DOSSIER_EVALUATION):
+    sortie = Path(sortie)
+    sortie.mkdir(parents=True, exist_ok=True)
+    nom = time.strftime("%Y%m%d_%H%M%S") + (f"_{scorecard['etiquette']}" if scorecard["etiquette"] else "")
+    with open(sortie / f"{nom}.json", "w", encoding="utf-8") as f:
+        json.dump(scorecard, f, ensure_ascii=False, indent=2)
+    colonnes = ["rouge1", "rouge2", "rougeL", "cosinus_tfidf", "schema_concordant", "jaccard_molecules"]
+    with open(sortie / f"{nom}_cas.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["code", "latence_s", "raffinement", "erreur"] + colonnes)
+        for r in resultats:
+            m = r.get("metriques", {})
+            writer.writerow([r["code"], round(r["latence"], 2), r["rapport"].get("raffinement", ""), r["erreur"] or ""]
+                            + [m.get(c, "") for c in colonnes])
+    return sortie / f"{nom}.json"
+
+def comparer(scorecard, reference_path):
+    """Écarts avec un bilan précédent (autre modèle, prompt ou backend)"""
+    with open(reference_path, "r", encoding="utf-8") as f:
+        precedent = json.load(f)
+    print(f"\n📊 Comparaison avec {reference_path} ({precedent.get('etiquette') or precedent.get('date')})")
+    for groupe in ("qualite", "vitesse"):
+        for cle, valeur in scorecard[groupe].items():
+            avant = precedent.get(groupe, {}).get(cle)
+            if isinstance(valeur, (int, float)) and isinstance(avant, (int, float)):
+                print(f"   {cle:28s} {avant:10.4g} → {valeur:10.4g} ({valeur - avant:+.4g})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Évaluation hors ligne : interprétations générées vs références cliniques")
+    parser.add_argument("--data", default=str(DOSSIER_DATA), help="dossier data_json produit par data.py")
+    parser.add_argument("--holdout", default=str(HOLDOUT_PATH),
+                        help="exemples tenus à l'écart (dedup_corpus.py) ; 'aucun' pour tous les patients")
+    parser.add_argument("-o", "--sortie", default=str(DOSSIER_EVALUATION))
+    parser.add_argument("--parallelisme", type=int, default=PARALLELISME)
+    parser.add_argument("--limite", type=int, default=None)
+    parser.add_argument("--adaptateur", default=None, help="adaptateur LoRA (BACKEND_LOCAL=lora)")
+    parser.add_argument("--etiquette", default="", help="nom du run (ex: round2_contraint)")
+    parser.add_argument("--comparer", default=None, help="bilan JSON précédent à comparer")
+    args = parser.parse_args()
+
+    codes = codes_holdout(args.holdout) if args.holdout != "aucun" and Path(args.holdout).exists() else None
+    cas = charger_cas(args.data, codes, args.limite)
+    print(f"📋 {len(cas)} cas avec interprétation de référence" + (" (holdout)" if codes is not None else ""))
+    debut = time.perf_counter()
+    resultats = rejouer(cas, args.parallelisme, args.adaptateur)
+    scorecard = bilan(resultats, time.perf_counter() - debut, args.adaptateur, args.etiquette)
+    chemin = ecrire_bilan(resultats, scorecard, args.sortie)
+    print(json.dumps({k: scorecard[k] for k in ("qualite", "vitesse")}, ensure_ascii=False, indent=2))
+    print(f"🏁 Bilan enregistré : {chemin}")
+    if args.comparer:
+        comparer(scorecard, args.comparer)
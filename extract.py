@@ -1,10 +1,5 @@
-from docx import Document
 import re
 import unicodedata
-from docx.oxml.table import CT_Tbl
-from docx.oxml.text.paragraph import CT_P
-from docx.table import Table
-from docx.text.paragraph import Paragraph
 
 MUTATION_PATTERN = r"\b[A-Z]\d{1,3}[A-Z]{1,6}\b"
 PR_POSITIONS = {10, 20, 36, 46, 63, 84, 89}
@@ -85,6 +80,21 @@ def clean_block(text, label):
     match = re.search(label + r"\s*(.*?)(\n[A-Z]|\Z)", text, re.DOTALL | re.IGNORECASE)
     return clean_text(match.group(1)) if match else ""
 
+def aplatir_mutations(mutation_table):
+    """Aplatit la sortie de extract_mutation_blocks en tuples (section, catégorie, mutation)"""
+    categories = {"Mutations_majeures": "majeure", "Mutations_accessoires": "accessoire", "Autres_mutations": "autre"}
+    for bloc in mutation_table:
+        section = bloc.get("Section", "")
+        for key, categorie in categories.items():
+            for item in bloc.get(key, []):
+                # RT : les mutations majeures sont regroupées en [{"NRTIs": [...]}, {"NNRTIS": [...]}]
+                if isinstance(item, dict):
+                    for classe, muts in item.items():
+                        for mut in muts:
+                            yield section, classe.upper().rstrip("S"), mut
+                else:
+                    yield section, categorie, item
+
 def extract_comments(text):
     comments = {}
     for section in ["PR", "RT", "IN"]:
@@ -94,6 +104,12 @@ def extract_comments(text):
     return comments
 
 def extract_scores(doc):
+    # python-docx (et lxml) ne sont chargés qu'à la première extraction
+    from docx.oxml.table import CT_Tbl
+    from docx.oxml.text.paragraph import CT_P
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+    from moteur_scores import niveau_efficacite
     elements = [
         ("paragraph", Paragraph(el, doc)) if isinstance(el, CT_P)
         else ("table", Table(el, doc))
@@ -146,21 +162,7 @@ def extract_scores(doc):
                         if total_row:
                             for col, val in zip(headers[1:], total_row[1:]):
                                 scores[col] = val
-                                try:
-                                    score = int(val)
-                                    if score < 0:
-                                        eff = "Hyper actif"
-                                    elif score < 10:
-                                        eff = "Totalement actif"
-                                    elif score < 30:
-                                        eff = "Bonne activité résiduelle"
-                                    elif score < 60:
-                                        eff = "Partiellement actif"
-                                    else:
-                                        eff = "Inactif"
-                                except:
-                                    eff = "Non interprétable"
-                                efficacite[col] = eff
+                                efficacite[col] = niveau_efficacite(val)
 
                             entry = {
                                 "section": section if section in ["PR", "RT", "IN"] else "RT",
@@ -177,11 +179,18 @@ def extract_scores(doc):
     return scoring_tables
 
 def extract_info_from_text(path):
+    from docx import Document
     doc = Document(path)
     full_text = extract_full_text(doc)
+    mutations = extract_mutation_blocks(full_text)
+    scores = extract_scores(doc)
+    if not scores and mutations:
+        # Pas de tableau "Mutation scoring" dans le rapport : scores calculés localement
+        from moteur_scores import charger_moteur
+        scores = charger_moteur().scores_patient(mutations)
     return {
         "sous_type_viral": extract_hiv_subtype(full_text),
-        "mutations": extract_mutation_blocks(full_text),
+        "mutations": mutations,
         "commentaires": extract_comments(full_text),
-        "scores": extract_scores(doc)
+        "scores": scores
     }
@@ -0,0 +1,291 @@
+import re
+import numpy as np
+from itertools import product
+from pathlib import Path
+
+# === 0) Références HXB2 (acides aminés) ===
+REFERENCES = {
+    "PR": "PQVTLWQRPLVTIKIGGQLKEALLDTGADDTVLEEMSLPGRWKPKMIGGIGGFIKVRQYDQILIEICGHKAIGTVLVGPTPVNIIGRNLLTQIGCTLNF",
+    "RT": "PISPIETVPVKLKPGMDGPKVKQWPLTEEKIKALVEICTEMEKEGKISKIGPENPYNTPVFAIKKKDSTKWRKLVDFRELNKRTQDFWEVQLGIPHPAG"
+          "LKKKKSVTVLDVGDAYFSVPLDEDFRKYTAFTIPSINNETPGIRYQYNVLPQGWKGSPAIFQSSMTKILEPFRKQNPDIVIYQYMDDLYVGSDLEIGQHR"
+          "TKIEELRQHLLRWGLTTPDKKHQKEPPFLWMGYELHPDKWTVQPIVLPEKDSWTVNDIQKLVGKLNWASQIYPGIKVRQLCKLLRGTKALTEVIPLTEE"
+          "AELELAENREILKEPVHGVYYDPSKDLIAEIQKQGQGQWTYQIYQEPFKNLKTGKYARMRGAHTNDVKQLTEAVQKITTESIVIWGKTPKFKLPIQKETW"
+          "ETWWTEYWQATWIPEWEFVNTPPLVKLWYQLEKEPIVGAETFYVDGAANRETKLGKAGYVTNRGRQKVVTLTDTTNQKTELQAIYLALQDSGLEVNIVT"
+          "DSQYALGIIQAQPDQSESELVNQIIEQLIKKEKVYLAWVPAHKGIGGNEQVDKLVSAGIRKVL",
+    "IN": "FLDGIDKAQEEHEKYHSNWRAMASDFNLPPVVAKEIVASCDKCQLKGEAMHGQVDCSPGIWQLDCTHLEGKVILVAVHVASGYIEAEVIPAETGQETAY"
+          "FLLKLAGRWPVKTIHTDNGSNFTGATVRAACWWAGIKQEFGIPYNPQSQGVVESMNKELKKIIGQVRDQAEHLKTAVQMAVFIHNFKRKGGIGGYSAGE"
+          "RIVDIIATDIQTKELQKQITKIQNFRVYYRDSRDPLWKGPAKLLWKGEGAVVIQDNSDIKVVPRRKAKIIRDYGKQMAGDDCVASRQDED",
+}
+
+# === 1) Traduction vectorisée ===
+BASES = "TCAG"
+ACIDES = "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+CODE_GENETIQUE = {"".join(c): ACIDES[i] for i, c in enumerate(product(BASES, repeat=3))}
+TABLE_CODONS = np.frombuffer(ACIDES.encode(), dtype=np.uint8)
+
+# Nucléotide -> index 0..3 ; 4 = ambigu (IUPAC) ; 5 = inconnu
+NT_INDEX = np.full(256, 5, dtype=np.uint8)
+for i, b in enumerate(BASES):
+    NT_INDEX[ord(b)] = NT_INDEX[ord(b.lower())] = i
+NT_INDEX[ord("U")] = NT_INDEX[ord("u")] = 0
+IUPAC = {"R": "AG", "Y": "CT", "S": "CG", "W": "AT", "K": "GT", "M": "AC",
+         "B": "CGT", "D": "AGT", "H": "ACT", "V": "ACG", "N": "ACGT"}
+for b in IUPAC:
+    NT_INDEX[ord(b)] = NT_INDEX[ord(b.lower())] = 4
+
+AMBIGU = ord("X")
+MAX_VARIANTES = 4   # au-delà, la position est considérée comme illisible
+
+def traduire(seq, frame=0):
+    """Traduit une séquence nucléotidique ; renvoie (aa uint8, {indice: ensemble d'aa} pour les codons ambigus)"""
+    nt = np.frombuffer(seq.encode("ascii", "ignore"), dtype=np.uint8)
+    n = (len(nt) - frame) // 3
+    codons = NT_INDEX[nt[frame:frame + 3 * n]].reshape(-1, 3)
+    idx = codons[:, 0].astype(np.int32) * 16 + codons[:, 1] * 4 + codons[:, 2]
+    ambigus = (codons >= 4).any(axis=1)
+    aa = TABLE_CODONS[np.where(ambigus, 0, idx)].copy()
+    aa[ambigus] = AMBIGU
+
+    melanges = {}
+    for k in np.flatnonzero(ambigus):
+        codon = seq[frame + 3 * k: frame + 3 * k + 3].upper().replace("U", "T")
+        choix = [IUPAC.get(b, b) for b in codon]
+        if any(b not in "ACGT" for c in choix for b in c):
+            continue
+        variantes = {CODE_GENETIQUE["".join(c)] for c in product(*choix)}
+        if len(variantes) <= MAX_VARIANTES:
+            melanges[int(k)] = variantes
+    return aa, melanges
+
+def meilleur_cadre(seq):
+    """Cadre de lecture avec le moins de codons stop"""
+    stops = []
+    for frame in range(3):
+        aa, _ = traduire(seq, frame)
+        stops.append(int((aa == ord("*")).sum()))
+    return int(np.argmin(stops))
+
+# === 2) Alignement sur la référence ===
+MATCH, MISMATCH, GAP = 5, -2, -8
+IDENTITE_MIN_DIAGONALE = 0.85
+COUVERTURE_MIN = 20   # acides aminés alignés minimum pour retenir une région
+KMER = 4
+
+REF_ARRAYS = {gene: np.frombuffer(ref.encode(), dtype=np.uint8) for gene, ref in REFERENCES.items()}
+REF_KMERS = {
+    gene: {ref[i:i + KMER]: i for i in range(len(ref) - KMER + 1)}
+    for gene, ref in REFERENCES.items()
+}
+
+def diagonale(query, gene):
+    """Décalage (position ref - position query) le plus fréquent parmi les k-mers communs"""
+    kmers = REF_KMERS[gene]
+    q = query.tobytes().decode("ascii")
+    votes = {}
+    for i in range(len(q) - KMER + 1):
+        j = kmers.get(q[i:i + KMER])
+        if j is not None:
+            votes[j - i] = votes.get(j - i, 0) + 1
+    if not votes:
+        return None, 0
+    d = max(votes, key=votes.get)
+    return d, votes[d]
+
+def alignement_diagonal(query, ref, d):
+    """Alignement sans indel : paires (indice query, indice ref) sur la diagonale d"""
+    debut_q = max(0, -d)
+    fin_q = min(len(query), len(ref) - d)
+    if fin_q - debut_q <= 0:
+        return None, 0.0
+    iq = np.arange(debut_q, fin_q)
+    ir = iq + d
+    lisibles = query[iq] != AMBIGU
+    identite = float((query[iq] == ref[ir])[lisibles].mean()) if lisibles.any() else 0.0
+    return (iq, ir), identite
+
+def alignement_semi_global(query, ref):
+    """Alignement à extrémités libres (gaps linéaires), rempli ligne par ligne avec NumPy"""
+    n, m = len(query), len(ref)
+    H = np.zeros((n + 1, m + 1), dtype=np.int32)
+    ptr = np.zeros((n + 1, m + 1), dtype=np.uint8)   # 0 diag, 1 haut, 2 gauche
+    cols = np.arange(m + 1, dtype=np.int32)
+    for i in range(1, n + 1):
+        score = np.where(ref == query[i - 1], MATCH, MISMATCH)
+        if query[i - 1] == AMBIGU:
+            score[:] = 0
+        diag = H[i - 1, :-1] + score
+        haut = H[i - 1, 1:] + GAP
+        ligne = np.empty(m + 1, dtype=np.int32)
+        ligne[0] = 0
+        ligne[1:] = np.maximum(diag, haut)
+        p = np.zeros(m + 1, dtype=np.uint8)
+        p[1:] = np.where(diag >= haut, 0, 1)
+        # Gaps horizontaux (insertion dans la référence) : max cumulé de H[k] + GAP * (j - k)
+        cumul = np.maximum.accumulate(ligne - GAP * cols) + GAP * cols
+        gauche = cumul > ligne
+        ligne = np.where(gauche, cumul, ligne)
+        p[gauche] = 2
+        H[i], ptr[i] = ligne, p
+
+    # Fin libre : meilleur score sur la dernière ligne ou la dernière colonne
+    j_fin = int(np.argmax(H[n]))
+    i_fin = int(np.argmax(H[:, m]))
+    i, j = (n, j_fin) if H[n, j_fin] >= H[i_fin, m] else (i_fin, m)
+
+    paires = []
+    while i > 0 and j > 0:
+        p = ptr[i, j]
+        if p == 0:
+            paires.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif p == 1:
+            i -= 1
+        else:
+            j -= 1
+    if not paires:
+        return None, 0.0
+    iq, ir = map(np.array, zip(*reversed(paires)))
+    lisibles = query[iq] != AMBIGU
+    identite = float((query[iq] == ref[ir])[lisibles].mean()) if lisibles.any() else 0.0
+    return (iq, ir), identite
+
+def aligner(query, gene):
+    """Paires (indice query, indice ref) alignées ; None si la région n'est pas couverte"""
+    ref = REF_ARRAYS[gene]
+    d, votes = diagonale(query, gene)
+    if d is None or votes < 3:
+        return None
+    paires, identite = alignement_diagonal(query, ref, d)
+    if paires is None or identite < IDENTITE_MIN_DIAGONALE:
+        # Probable indel : alignement complet
+        paires, identite = alignement_semi_global(query, ref)
+    if paires is None or len(paires[0]) < COUVERTURE_MIN or identite < 0.6:
+        return None
+    return paires
+
+# === 3) Appel des mutations ===
+def appeler_mutations(seq):
+    """Mutations par région {gène: [mutation, ...]} numérotées selon HXB2 (mélanges inclus, ex: M184MV)"""
+    seq = re.sub(r"[^A-Za-z]", "", seq)
+    frame = meilleur_cadre(seq)
+    aa, melanges = traduire(seq, frame)
+
+    resultat = {}
+    for gene, ref in REF_ARRAYS.items():
+        paires = aligner(aa, gene)
+        if paires is None:
+            continue
+        iq, ir = paires
+        # Comparaison vectorisée : positions différentes de la référence (hors codons illisibles)
+        diff = (aa[iq] != ref[ir]) & (aa[iq] != AMBIGU) & (aa[iq] != ord("*"))
+        mutations = [
+            f"{chr(ref[j])}{j + 1}{chr(aa[i])}" for i, j in zip(iq[diff], ir[diff])
+        ]
+        # Codons ambigus : mélange d'acides aminés, la référence en premier (notation Stanford)
+        for i, j in zip(iq, ir):
+            variantes = melanges.get(int(i))
+            if not variantes or variantes == {chr(ref[j])}:
+                continue
+            ref_aa = chr(ref[j])
+            autres = "".join(sorted(v for v in variantes if v != ref_aa and v != "*"))
+            if autres:
+                mutations.append(f"{ref_aa}{j + 1}{ref_aa if ref_aa in variantes else ''}{autres}")
+        # Indels : sauts dans les indices alignés (insertion côté query, délétion côté référence)
+        sauts = np.flatnonzero(np.diff(iq) > 1)
+        mutations += [f"{chr(ref[ir[k]])}{ir[k] + 1}Ins" for k in sauts]
+        for k in np.flatnonzero(np.diff(ir) > 1):
+            mutations += [f"{chr(ref[j])}{j + 1}del" for j in range(ir[k] + 1, ir[k + 1])]
+        mutations.sort(key=lambda mut: int(re.search(r"\d+", mut).group()))
+        resultat[gene] = {"mutations": mutations, "debut": int(ir[0]) + 1, "fin": int(ir[-1]) + 1}
+    return resultat
+
+def blocs_mutations(mutations_par_gene):
+    """Convertit {gène: [mutations]} vers la structure renvoyée par extract.extract_mutation_blocks"""
+    from connaissances_mutations import charger_index
+    index = charger_index()
+    blocs = []
+    for gene in ("PR", "RT", "IN"):
+        if gene not in mutations_par_gene:
+            continue
+        major, accessory, nrtis, nnrtis, minor = [], [], [], [], []
+        for mut in mutations_par_gene[gene]["mutations"]:
+            annotations = index.annoter(gene, mut)
+            classes = {c for a in annotations for c in a["classes"]}
+            categories = {c for a in annotations for c in a["categories"]}
+            if gene == "RT":
+                if "NRTI" in classes and categories - {"position clé"}:
+                    nrtis.append(mut)
+                elif "NNRTI" in classes and categories - {"position clé"}:
+                    nnrtis.append(mut)
+                else:
+                    minor.append(mut)
+            elif "majeure" in categories:
+                major.append(mut)
+            elif "accessoire" in categories:
+                accessory.append(mut)
+            else:
+                minor.append(mut)
+
+        if gene == "RT":
+            blocs.append({
+                "Section": gene,
+                "Mutations_majeures": [{"NRTIs": sorted(set(nrtis))}, {"NNRTIS": sorted(set(nnrtis))}],
+                "Mutations_accessoires": [],
+                "Autres_mutations": sorted(set(minor))
+            })
+        else:
+            blocs.append({
+                "Section": gene,
+                "Mutations_majeures": sorted(set(major)),
+                "Mutations_accessoires": sorted(set(accessory)),
+                "Autres_mutations": sorted(set(minor))
+            })
+    return blocs
+
+# === 4) Entrée FASTA ===
+def lire_fasta(path):
+    """Itère sur les (identifiant, séquence) d'un fichier FASTA"""
+    ident, morceaux = None, []
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for ligne in f:
+            ligne = ligne.strip()
+            if ligne.startswith(">"):
+                if ident is not None:
+                    yield ident, "".join(morceaux)
+                ident, morceaux = ligne[1:].split()[0] if ligne[1:].split() else "", []
+            elif ligne:
+                morceaux.append(ligne)
+    if ident is not None:
+        yield ident, "".join(morceaux)
+
+def extract_info_from_fasta(path):
+    """Équivalent de extract.extract_info_from_text pour chaque séquence d'un FASTA (scores calculés localement)"""
+    from moteur_scores import charger_moteur
+    moteur = charger_moteur()
+    resultats = {}
+    for ident, seq in lire_fasta(path):
+        mutations = blocs_mutations(appeler_mutations(seq))
+        resultats[ident] = {
+            "sous_type_viral": {"Subtype": "Inconnu"},
+            "mutations": mutations,
+            "commentaires": {},
+            "scores": moteur.scores_patient(mutations)
+        }
+    return resultats
+
+def extract_info_from_fastas(paths):
+    """Mode lot : plusieurs fichiers FASTA -> {identifiant: données}"""
+    resultats = {}
+    for path in paths:
+        resultats.update(extract_info_from_fasta(path))
+    return resultats
+
+if __name__ == "__main__":
+    import sys, json, time
+    paths = [p for arg in sys.argv[1:] for p in (sorted(Path(arg).glob("*.fa*")) if Path(arg).is_dir() else [Path(arg)])]
+    debut = time.perf_counter()
+    resultats = extract_info_from_fastas(paths)
+    duree = time.perf_counter() - debut
+    for ident, data in resultats.items():
+        print(ident, json.dumps(data["mutations"], ensure_ascii=False))
+    print(f"✅ {len(resultats)} séquences en {duree:.2f}s ({len(resultats) / max(duree, 1e-9):.1f}/s)")
@@ -0,0 +1,135 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# === 0) Statuts ===
+EN_ATTENTE = "en_attente"
+EN_COURS = "en_cours"
+TERMINE = "termine"
+ERREUR = "erreur"
+ANNULE = "annule"
+STATUTS_FINAUX = {TERMINE, ERREUR, ANNULE}
+
+class JobAnnule(Exception):
+    """Levée dans un job lorsque l'annulation a été demandée"""
+
+class Job:
+    """État d'un job : progression, étape courante, résultat ou erreur"""
+
+    def __init__(self, job_id, nom=""):
+        self.id = job_id
+        self.nom = nom
+        self.statut = EN_ATTENTE
+        self.progression = 0.0
+        self.etape = "En attente"
+        self.resultat = None
+        self.erreur = None
+        self.soumis = time.time()
+        self.debut = None
+        self.fin = None
+        self._annulation = threading.Event()
+        self._future = None
+
+    def avancer(self, progression, etape=""):
+        """Met à jour la progression (0..1) ; lève JobAnnule si l'annulation a été demandée"""
+        self.verifier_annulation()
+        self.progression = max(0.0, min(1.0, progression))
+        if etape:
+            self.etape = etape
+
+    def verifier_annulation(self):
+        if self._annulation.is_set():
+            raise JobAnnule()
+
+    @property
+    def annulation_demandee(self):
+        return self._annulation.is_set()
+
+    @property
+    def termine(self):
+        return self.statut in STATUTS_FINAUX
+
+    @property
+    def duree(self):
+        if not self.debut:
+            return 0.0
+        return (self.fin or time.time()) - self.debut
+
+# === 1) File de jobs ===
+class FileJobs:
+    """File de jobs en arrière-plan (threads), partagée entre les reruns Streamlit"""
+
+    def __init__(self, max_workers=1, retention=3600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.retention = retention
+
+    def soumettre(self, fn, *args, nom="", **kwargs):
+        """Soumet fn(job, *args, **kwargs) et renvoie l'identifiant du job"""
+        self.nettoyer()
+        job = Job(uuid.uuid4().hex[:12], nom)
+        with self._lock:
+            self._jobs[job.id] = job
+        job._future = self._executor.submit(self._executer, job, fn, args, kwargs)
+        return job.id
+
+    def _executer(self, job, fn, args, kwargs):
+        if job.annulation_demandee:
+            job.statut, job.fin = ANNULE, time.time()
+            return
+        job.statut, job.debut = EN_COURS, time.time()
+        try:
+            job.resultat = fn(job, *args, **kwargs)
+            job.progression = 1.0
+            job.etape = "Terminé"
+            job.statut = TERMINE
+        except JobAnnule:
+            job.etape = "Annulé"
+            job.statut = ANNULE
+        except Exception as e:
+            job.erreur = str(e)
+            job.etape = "Erreur"
+            job.statut = ERREUR
+        finally:
+            job.fin = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def annuler(self, job_id):
+        """Demande l'annulation (immédiate si le job est encore en attente)"""
+        job = self.get(job_id)
+        if job is None or job.termine:
+            return False
+        job._annulation.set()
+        if job._future is not None and job._future.cancel():
+            job.statut, job.etape, job.fin = ANNULE, "Annulé", time.time()
+        return True
+
+    def resultat(self, job_id):
+        """Résultat d'un job terminé (None sinon) : jamais recalculé"""
+        job = self.get(job_id)
+        return job.resultat if job is not None and job.statut == TERMINE else None
+
+    def position(self, job_id):
+        """Nombre de jobs en attente soumis avant celui-ci"""
+        job = self.get(job_id)
+        if job is None or job.statut != EN_ATTENTE:
+            return 0
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.statut == EN_ATTENTE and j.soumis < job.soumis)
+
+    def en_attente(self):
+        """Nombre de jobs soumis non terminés"""
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if not j.termine)
+
+    def nettoyer(self):
+        """Oublie les jobs terminés depuis plus de `retention` secondes"""
+        limite = time.time() - self.retention
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.termine and j.fin and j.fin < limite]:
+                del self._jobs[job_id]
@@ -1,14 +1,14 @@
-import os, shutil
+import os
 import torch
 import gc
 import psutil
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline, BitsAndBytesConfig
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_huggingface import HuggingFacePipeline
-from langchain_ollama import OllamaLLM
+from connaissances_mutations import contexte_reference, JOURNAL_FILE
+from backends_inference import obtenir_backend, adaptateur_actif, BACKEND_LOCAL, REPONSE_ERREUR
 
-# === 0) Chemins locaux ===
-MERGED_MODEL_PATH = r".\Phi4_merged"
+# === 0) Options ===
+# Décodage contraint du schéma thérapeutique (molécules connues uniquement) : DECODAGE_CONTRAINT=1
+DECODAGE_CONTRAINT = bool(os.environ.get("DECODAGE_CONTRAINT"))
 
 # Prompt systeme
 system_prompt = """
@@ -92,69 +92,12 @@ def liberer_ram():
 
 cleanup_memory()
 
-# === 2) Tokenizer ===
-try:
-    tokenizer = AutoTokenizer.from_pretrained(MERGED_MODEL_PATH, use_fast=True)
-    if tokenizer.pad_token is None:
-        tokenizer.pad_token = tokenizer.eos_token if tokenizer.eos_token else "<|endoftext|>"
-    print("✅ Tokenizer chargé avec succès")
-except Exception as e:
-    print(f"❌ Erreur lors du chargement du tokenizer: {e}")
-    # Fallback
-    from transformers import GPT2Tokenizer
-    tokenizer = GPT2Tokenizer.from_pretrained("gpt2")
-    tokenizer.pad_token = tokenizer.eos_token
-
-# === 3) Charger le modèle avec meilleure gestion d'erreurs ===
-offload_dir = r".\phi4_offload"
-shutil.rmtree(offload_dir, ignore_errors=True)
-os.makedirs(offload_dir, exist_ok=True)
-
-model = None
-try:
-    # Essayer sans quantification mais avec gestion mémoire
-    print("🔄 Tentative sans quantification...")
-    model = AutoModelForCausalLM.from_pretrained(
-        MERGED_MODEL_PATH,
-        device_map="auto",
-        torch_dtype=dtype,
-        trust_remote_code=True,
-        low_cpu_mem_usage=True
-    )
-    model.eval()
-    print("✅ Modèle chargé sans quantification")
-    
-except Exception as e:
-    print(f"❌ Erreur sans quantification: {e}")
-    # Fallback: CPU seulement avec float32
-    print("🔄 Tentative sur CPU...")
-    model = AutoModelForCausalLM.from_pretrained(
-        MERGED_MODEL_PATH,
-        device_map="cpu",
-        torch_dtype=torch.float32,
-        trust_remote_code=True
-    )
-    model.eval()
-    print("✅ Modèle chargé sur CPU")
-
-# === 4) Pipeline HuggingFace avec paramètres optimisés ===
-try:
-    pipe = pipeline(
-        "text-generation",
-        model=model,
-        tokenizer=tokenizer,
-        max_new_tokens=812,  # Réduit pour économiser la mémoire
-        temperature=0.2,
-        do_sample=True,
-        device_map="auto",
-        batch_size=1,  # Important pour éviter les problèmes mémoire
-        pad_token_id=tokenizer.eos_token_id
-    )
-    hf_llm = HuggingFacePipeline(pipeline=pipe)
-    print("✅ Pipeline créé avec succès")
-except Exception as e:
-    print(f"❌ Erreur lors de la création du pipeline: {e}")
-    hf_llm = None
+# === 2) Modèle de la première étape : backend interchangeable (hf, lora, ollama, llamacpp) ===
+# Avec le même backend pour le raffinement (BACKEND=...), les deux étapes partagent un seul modèle chargé
+backend = obtenir_backend(BACKEND_LOCAL)
+tokenizer = getattr(backend, "tokenizer", None)
+model = getattr(backend, "model", None)
+hf_llm = backend.llm
 
 # Templates et chaines (inchangés)
 template = """Système : {system_prompt}
@@ -180,34 +123,79 @@ def read_memory():
         return f.read()
 
 def append_memory(user_msg, model_resp):
-    """Ajoute l'interaction au fichier mémoire"""
-    with open(MEMORY_FILE, "a", encoding="utf-8") as f:
+    """Ajoute l'interaction au journal (pas au fichier mémoire de référence)"""
+    with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
         f.write(f"\nUSER: {user_msg}\nMODEL: {model_resp}\n")
 
 # === 6) Génération avec meilleure gestion mémoire ===
-def generate_model_response(user_msg: str):
-    try:
-        cleanup_memory()
-        
-        memory_context = read_memory()
-        user_prompt_with_memory = f"{memory_context}\n{user_msg}"
-        
-        result = chain.invoke({
-            "system_prompt": system_prompt, 
-            "user_prompt": user_prompt_with_memory,
-            "calque": calque
-        })
-        
-        reponse = result.content if hasattr(result, "content") else str(result)
-        final_form = reponse.split("Réponse :")[-1].strip()
-        append_memory(user_msg, final_form)
-        
-        cleanup_memory()
-        return final_form
-        
-    except Exception as e:
-        print(f"Erreur lors de la génération de réponse : {e}")
-        cleanup_memory()
-        return "Je suis désolé, il y a eu une erreur."
+def preparer_entree(user_msg, mutations=None):
+    """Variables du template pour un message utilisateur"""
+    # Uniquement les faits de référence liés aux mutations du patient (pas tout memoire.txt)
+    memory_context = contexte_reference(user_msg, mutations, MEMORY_FILE)
+    return {
+        "system_prompt": system_prompt,
+        "user_prompt": f"{memory_context}\n{user_msg}",
+        "calque": calque
+    }
+
+def chaine_generation(*user_msgs):
+    """Chaîne du modèle fine-tuné : lot généré en un seul passage du pipeline, contrainte sur les
+    molécules du schéma si activée"""
+    if backend.nom not in ("hf", "lora"):   # taille de lot et logits accessibles uniquement avec transformers
+        return chain
+    llm, pipeline_kwargs = hf_llm, {}
+    if len(user_msgs) > 1:
+        # Lot dynamique du worker : le pipeline (batch_size de la configuration de l'hôte, 1 par défaut)
+        # ne regrouperait pas les prompts ; LangChain découpe aussi par batch_size, d'où une copie propre
+        # à cet appel (le hf_llm partagé n'est pas modifié)
+        pipeline_kwargs["batch_size"] = len(user_msgs)
+        llm = hf_llm.model_copy(update={"batch_size": max(hf_llm.batch_size, len(user_msgs))})
+    if DECODAGE_CONTRAINT:
+        from decodage_schema import processeur_schema
+        pipeline_kwargs["logits_processor"] = processeur_schema(tokenizer, *user_msgs)
+    return prompt | llm.bind(pipeline_kwargs=pipeline_kwargs) if pipeline_kwargs else chain
+
+def extraire_reponse(result):
+    reponse = result.content if hasattr(result, "content") else str(result)
+    return reponse.split("Réponse :")[-1].strip()
+
+def generate_model_response(user_msg: str, mutations=None, adaptateur=None):
+    """`adaptateur` : nom de l'adaptateur LoRA à utiliser (backend lora ; défaut : ADAPTATEUR)
+
+    Un adaptateur inconnu ou non géré par le backend lève une erreur (le job échoue au lieu de
+    servir un message d'excuse comme première version)
+    """
+    with adaptateur_actif(backend, adaptateur):
+        try:
+            cleanup_memory()
+            result = chaine_generation(user_msg).invoke(preparer_entree(user_msg, mutations))
+
+            final_form = extraire_reponse(result)
+            append_memory(user_msg, final_form)
+
+            cleanup_memory()
+            return final_form
 
+        except Exception as e:
+            print(f"Erreur lors de la génération de réponse : {e}")
+            cleanup_memory()
+            return REPONSE_ERREUR
+
+def generate_model_responses(user_msgs, mutations_list=None, adaptateur=None):
+    """Génération par lot (un seul passage du pipeline pour plusieurs prompts, même adaptateur)
+
+    Les erreurs (adaptateur, génération) ne sont pas converties en REPONSE_ERREUR : le worker les
+    remonte aux requêtes du lot, et le client les signale à l'appelant
+    """
+    mutations_list = mutations_list or [None] * len(user_msgs)
+    with adaptateur_actif(backend, adaptateur):
+        try:
+            cleanup_memory()
+            results = chaine_generation(*user_msgs).batch([preparer_entree(m, mut) for m, mut in zip(user_msgs, mutations_list)])
+            reponses = [extraire_reponse(r) for r in results]
+            for user_msg, reponse in zip(user_msgs, reponses):
+                append_memory(user_msg, reponse)
+            return reponses
+        finally:
+            cleanup_memory()
 
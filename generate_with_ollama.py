@@ -1,9 +1,6 @@
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_huggingface import HuggingFacePipeline
-from langchain_ollama import OllamaLLM
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline, BitsAndBytesConfig
-import os, gc, psutil, shutil
-import torch
+import os, gc, sys, shutil
+from functools import lru_cache
+from connaissances_mutations import contexte_reference, JOURNAL_FILE
 
 # === 0) Configuration ===
 MEMORY_FILE = r"D:\docaivancity\PGE2\stage\IA_CIRCB\agent_circb\interpreteur\memoire.txt"
@@ -11,10 +8,6 @@ if not os.path.exists(MEMORY_FILE):
     with open(MEMORY_FILE, "w", encoding="utf-8") as f:
         f.write("")
 
-device = "cuda" if torch.cuda.is_available() else ("mps" if torch.backends.mps.is_available() else "cpu")
-dtype = torch.bfloat16 if device == "cuda" and torch.cuda.is_bf16_supported() else torch.float16 if device == "cuda" else torch.float32
-print(f"[INFO] device={device} | dtype={dtype}")
-
 # === 1) Prompts et calque ===
 system_prompt = """
 Tu es un expert en virologie et infectiologie spécialisé dans la prise en charge du VIH/SIDA.
@@ -51,19 +44,29 @@ et commence ta réponsse par: " Cadre virologique compatible ou incompatible ...
 Ne repète jamais le prompt dans ta réponse.
 Réponse :
 """
-prompt_0 = ChatPromptTemplate.from_template(template_0)
 
-# === 2) Initialisation Ollama ===
-model_ollama = OllamaLLM(model='phi4')
-chain0 = prompt_0 | model_ollama
+# === 2) Initialisation du raffinement (différée : backend chargé au premier appel) ===
+@lru_cache(maxsize=1)
+def chaine_ollama():
+    """Chaîne de raffinement sur BACKEND_RAFFINEMENT (ollama par défaut ; hf ou llamacpp : modèle partagé)"""
+    from langchain_core.prompts import ChatPromptTemplate
+    from backends_inference import obtenir_backend, BACKEND_RAFFINEMENT
+    prompt_0 = ChatPromptTemplate.from_template(template_0)
+    return prompt_0 | obtenir_backend(BACKEND_RAFFINEMENT).llm
 
 # === 3) Gestion mémoire ===
+def torch_charge():
+    """torch seulement s'il est déjà chargé (modèle local dans ce processus) : sinon aucun cache GPU à vider"""
+    return sys.modules.get("torch")
+
 def liberer_ram():
     """Libère la mémoire RAM avant une opération critique"""
+    import psutil
     process = psutil.Process(os.getpid())
     mem_avant = process.memory_info().rss / 1024 / 1024  # MB
     gc.collect()
-    if torch.cuda.is_available():
+    torch = torch_charge()
+    if torch is not None and torch.cuda.is_available():
         try:
             torch.cuda.empty_cache()
         except:
@@ -74,13 +77,16 @@ def liberer_ram():
 def cleanup_memory():
     """Nettoyer la mémoire GPU/MPS et RAM"""
     gc.collect()
-    if device == "cuda":
+    torch = torch_charge()
+    if torch is None:
+        return
+    if torch.cuda.is_available():
         try:
             torch.cuda.empty_cache()
             print("✅ Mémoire CUDA nettoyée")
         except RuntimeError as e:
             print(f"⚠️ Impossible de vider le cache CUDA: {e}")
-    elif device == "mps":
+    elif torch.backends.mps.is_available():
         try:
             torch.mps.empty_cache()
             print("✅ Mémoire MPS nettoyée")
@@ -96,17 +102,18 @@ def read_memory():
         return f.read()
 
 def append_memory(user_msg, model_resp):
-    """Ajoute l'interaction au fichier mémoire"""
-    with open(MEMORY_FILE, "a", encoding="utf-8") as f:
+    """Ajoute l'interaction au journal (pas au fichier mémoire de référence)"""
+    with open(JOURNAL_FILE, "a", encoding="utf-8") as f:
         f.write(f"\nUSER: {user_msg}\nMODEL: {model_resp}\n")
 
 
 # === 5) Génération avec amélioration Ollama ===
-def generate_model_ollama_response(response1, user_msg: str):
+def generate_model_ollama_response(response1, user_msg: str, mutations=None):
     """Améliore la réponse brute avec Ollama en respectant le calque"""
     try:
         cleanup_memory()
-        memory_context = read_memory()
+        # Uniquement les faits de référence liés aux mutations du patient (pas tout memoire.txt)
+        memory_context = contexte_reference(user_msg, mutations, MEMORY_FILE)
 
         # Génération principale avec modèle local si pas fourni
         if not response1:
@@ -116,7 +123,7 @@ def generate_model_ollama_response(response1, user_msg: str):
         # Amélioration avec Ollama
         print("🔄 Amélioration avec Ollama...")
         liberer_ram()
-        result = chain0.invoke({
+        result = chaine_ollama().invoke({
             "reponse1": response1,
             "system_prompt": system_prompt,
             "user_prompt": user_prompt_with_memory,
@@ -126,6 +133,9 @@ def generate_model_ollama_response(response1, user_msg: str):
         # Normalisation en string
         if not isinstance(result, str):
             result = str(result)
+        # Backend hf : la sortie reprend le prompt, seule la suite de "Réponse :" est gardée
+        if "Réponse :" in result:
+            result = result.split("Réponse :")[-1].strip()
 
         append_memory(user_msg, result)
         cleanup_memory()
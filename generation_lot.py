@@ -0,0 +1,162 @@
+import os
+import csv
+import json
+import time
+import argparse
+from pathlib import Path
+
+from pipeline_rapport import apparier_fichiers, extraire_patient, generer_rapport
+from prompt_patient import construire_user_prompt
+from profilage import profiler
+
+# === 0) Configuration ===
+DOSSIER_RACINE = Path(r".\Dossier_patient")
+DOSSIER_SORTIE = Path(r".\rapports_generes")
+FICHIER_CHECKPOINT = "checkpoint.jsonl"
+FICHIER_DUREES = "durees.csv"
+
+# === 1) Checkpoint : une ligne JSON par patient terminé, écrite dès la fin du patient ===
+def lire_checkpoint(sortie):
+    """{code: entrée} des patients déjà traités (la dernière entrée d'un code l'emporte)"""
+    path = Path(sortie) / FICHIER_CHECKPOINT
+    etat = {}
+    if not path.exists():
+        return etat
+    with open(path, "r", encoding="utf-8") as f:
+        for ligne in f:
+            try:
+                entree = json.loads(ligne)
+            except json.JSONDecodeError:
+                continue   # dernière ligne tronquée par une interruption
+            etat[entree["code"]] = entree
+    return etat
+
+def ajouter_checkpoint(sortie, entree):
+    with open(Path(sortie) / FICHIER_CHECKPOINT, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entree, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def ecrire_json(path, data):
+    """Écriture atomique : un rapport n'est jamais à moitié écrit"""
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+def ecrire_durees(sortie, etat):
+    with open(Path(sortie) / FICHIER_DUREES, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, delimiter=";")
+        writer.writerow(["code", "statut", "extraction_s", "locale_s", "ollama_s", "total_s", "raffinement"])
+        for code, e in sorted(etat.items()):
+            d = e.get("durees", {})
+            writer.writerow([code, e["statut"]] + [round(d.get(k, 0.0), 2) for k in ("extraction", "locale", "ollama", "total")]
+                            + [int(d["raffinement"]) if "raffinement" in d else ""])
+
+# === 2) Traitement ===
+def traiter_patient(code, fichiers, sortie, adaptateur=None):
+    """Extraction, prompt identique à l'interface, génération ; écrit <code>.json dans `sortie`
+
+    Avec PROFILAGE=1, le profil du patient est enregistré dans `sortie`/profils, à côté de durees.csv.
+    """
+    with profiler(code, dossier=Path(sortie) / "profils") as capture:
+        debut = time.perf_counter()
+        patient, extraction, _ = extraire_patient(str(fichiers["note"]), str(fichiers["mut"]), code, profil=False)
+        duree_extraction = time.perf_counter() - debut
+
+        user_prompt = construire_user_prompt(patient, extraction)
+        rapport = generer_rapport(user_prompt, extraction.get("mutations"), profil=False, adaptateur=adaptateur)
+        durees = {"extraction": duree_extraction, **rapport["durees"], "total": time.perf_counter() - debut}
+
+    durees["raffinement"] = rapport.get("raffinement", True)
+    ecrire_json(Path(sortie) / f"{code}.json", {
+        "code_patient": code,
+        "fichiers": {k: str(v) for k, v in fichiers.items()},
+        "patient": patient,
+        "extraction": extraction,
+        "user_prompt": user_prompt,
+        "premiere_generation": rapport["premiere"],
+        "interpretation": rapport["finale"],
+        "validation": rapport.get("validation"),
+        "adaptateur": adaptateur,
+        "durees": durees,
+        "profil": capture.fichiers if capture else None
+    })
+    return durees
+
+def generer_lot(dossier=DOSSIER_RACINE, sortie=DOSSIER_SORTIE, reprendre=True, limite=None, adaptateur=None, docx=False):
+    """Génère les rapports de toutes les paires complètes ; reprend après les patients déjà terminés
+
+    `adaptateur` : adaptateur LoRA (BACKEND_LOCAL=lora) ; une sortie par adaptateur pour une comparaison A/B
+    `docx` : rend en fin de lot les rapports terminés dans le modèle Word (`sortie`/docx, cf. rendu_docx.py)
+    """
+    sortie = Path(sortie)
+    sortie.mkdir(parents=True, exist_ok=True)
+    etat = lire_checkpoint(sortie) if reprendre else {}
+    if not reprendre and (sortie / FICHIER_CHECKPOINT).exists():
+        (sortie / FICHIER_CHECKPOINT).unlink()
+
+    patients = apparier_fichiers(dossier)
+    a_traiter = []
+    for code, fichiers in sorted(patients.items()):
+        if not ("note" in fichiers and "mut" in fichiers):
+            print(f"⛔ Fichiers incomplets pour {code}")
+        elif etat.get(code, {}).get("statut") == "ok":
+            continue
+        else:
+            a_traiter.append((code, fichiers))
+    if limite:
+        a_traiter = a_traiter[:limite]
+
+    deja = sum(1 for e in etat.values() if e.get("statut") == "ok")
+    print(f"📋 {len(a_traiter)} patient(s) à traiter, {deja} déjà terminé(s)")
+
+    debut_lot = time.perf_counter()
+    try:
+        for i, (code, fichiers) in enumerate(a_traiter, 1):
+            try:
+                durees = traiter_patient(code, fichiers, sortie, adaptateur)
+                entree = {"code": code, "statut": "ok", "durees": durees}
+                print(f"✅ [{i}/{len(a_traiter)}] {code} en {durees['total']:.1f}s")
+            except Exception as e:
+                # Une erreur n'est pas définitive : le patient sera retenté au prochain lancement
+                entree = {"code": code, "statut": "erreur", "erreur": str(e), "durees": {}}
+                print(f"❌ [{i}/{len(a_traiter)}] {code} : {e}")
+            ajouter_checkpoint(sortie, entree)
+            etat[code] = entree
+    except KeyboardInterrupt:
+        print("⏸️ Interrompu : relancer la même commande pour reprendre")
+        return etat
+    finally:
+        ecrire_durees(sortie, etat)
+
+    termines = [e["durees"] for e in etat.values() if e.get("statut") == "ok" and "raffinement" in e.get("durees", {})]
+    if termines:
+        evites = sum(not d["raffinement"] for d in termines)
+        print(f"⚡ Raffinement Ollama évité pour {evites}/{len(termines)} rapport(s)")
+    print(f"🏁 Lot terminé en {time.perf_counter() - debut_lot:.1f}s → {sortie}")
+    if docx:
+        rendre_docx_lot(sortie, etat)
+    return etat
+
+def rendre_docx_lot(sortie, etat):
+    from rendu_docx import rendre_dossier
+    debut = time.perf_counter()
+    codes = {code for code, e in etat.items() if e.get("statut") == "ok"}
+    resultats = rendre_dossier(sortie, Path(sortie) / "docx", codes=codes)
+    for fichier, erreur in resultats.items():
+        if erreur:
+            print(f"❌ {fichier} : {erreur}")
+    print(f"📄 {sum(not e for e in resultats.values())} rapport(s) .docx en {time.perf_counter() - debut:.1f}s → {Path(sortie) / 'docx'}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génération par lot des interprétations (paires note TR / rapport Stanford)")
+    parser.add_argument("dossier", nargs="?", default=str(DOSSIER_RACINE), help="dossier des .docx patients")
+    parser.add_argument("-o", "--sortie", default=str(DOSSIER_SORTIE), help="dossier des rapports et du checkpoint")
+    parser.add_argument("--recommencer", action="store_true", help="ignore le checkpoint et retraite tous les patients")
+    parser.add_argument("--limite", type=int, default=None, help="nombre maximal de patients à traiter")
+    parser.add_argument("--adaptateur", default=None, help="adaptateur LoRA à utiliser (BACKEND_LOCAL=lora)")
+    parser.add_argument("--docx", action="store_true", help="rend aussi les rapports dans le modèle Word (<sortie>/docx)")
+    args = parser.parse_args()
+    generer_lot(args.dossier, args.sortie, reprendre=not args.recommencer, limite=args.limite, adaptateur=args.adaptateur,
+                docx=args.docx)
@@ -3,17 +3,18 @@
 # ================================================
 
 import streamlit as st
-import pandas as pd
-import json, re, os, gc
+import json, re, os, gc, time
 from pathlib import Path
 from datetime import date, datetime
-try:
-    from extract import extract_info_from_text  # Extraction des mutations et scores
-    from extract2 import extract_note_and_interpretation
-    from generation_tr import generate_model_response
-    from generate_with_ollama import generate_model_ollama_response
-except ImportError:
-    st.warning("⚠️ Certains modules d'extraction ne sont pas disponibles")
+from file_jobs import FileJobs, EN_ATTENTE, TERMINE, ERREUR, ANNULE
+from prompt_patient import construire_user_prompt, libelle_source
+from pipeline_rapport import taux_sans_raffinement
+from decodage_schema import ARV_OPTIONS
+from profilage import profiler, PROFILAGE_ACTIF
+from series_bilans import ordinal, valeur
+from backends_inference import adaptateurs_disponibles, BACKEND_LOCAL, ADAPTATEUR
+# Extraction et génération sont importées au premier usage : l'interface démarre sans charger
+# python-docx, torch ni le modèle (PRECHARGER_MODELE=1 pour le charger en arrière-plan au démarrage)
 
 # ---------------------------
 # Config Streamlit
@@ -21,6 +22,24 @@ except ImportError:
 st.set_page_config(page_title="Génération de rapport de test de resistance", layout="wide")
 st.title("🧠 Génération de rapport TR")
 
+# Profilage à la demande de la prochaine extraction / génération (aucun coût si désactivé)
+profilage_ui = st.sidebar.checkbox("🔬 Profiler extraction et génération", value=PROFILAGE_ACTIF)
+
+# Adaptateur LoRA de la première étape (BACKEND_LOCAL=lora) : changement sans rechargement du modèle de base
+adaptateur_ui = None
+if BACKEND_LOCAL == "lora" and adaptateurs_disponibles():
+    noms_adaptateurs = list(adaptateurs_disponibles())
+    adaptateur_ui = st.sidebar.selectbox("🧩 Adaptateur LoRA", noms_adaptateurs,
+                                         index=noms_adaptateurs.index(ADAPTATEUR) if ADAPTATEUR in noms_adaptateurs else 0)
+
+# Saisie des bilans et traitements en tableau : un widget par série quel que soit le nombre de lignes
+# (SAISIE_LIGNES=1 : ancien formulaire ligne par ligne)
+saisie_tableau = st.sidebar.checkbox("📋 Saisie des bilans en tableau", value=not os.environ.get("SAISIE_LIGNES"))
+
+def afficher_profil(capture):
+    if capture:
+        st.caption(f"🔬 Profil '{capture.nom}' ({capture.resume['duree_s']:.1f}s) : {capture.fichiers['pile']}")
+
 # ---------------------------
 # Intervalle de date
 # ---------------------------
@@ -59,7 +78,9 @@ if uploaded_note:
         # Vérifier si le module d'extraction est disponible
         try:
             from extract2 import extract_note_and_interpretation
-            note_interp = extract_note_and_interpretation("temp_note.docx")
+            with profiler("extraction_note", actif=profilage_ui) as capture:
+                note_interp = extract_note_and_interpretation("temp_note.docx")
+            afficher_profil(capture)
             
             note = note_interp.get("note", "")
             interpretation = note_interp.get("interpretation", "")
@@ -169,8 +190,7 @@ def afficher_taux_cd4(t_cd4):
 # ---------------------
 # Historique thérapeutique
 # ---------------------
-arv_options = ["TDF+3TC+NVP", "TDF+3TC+EFV", "AZT+3TC+NVP", "ABC+3TC+LPV/r", "ABC+3TC+ATV/r", 
-               "TDF+3TC+DTG", "TDF+3TC+ATV/r", "AZT+3TC+ATV/r", "ABC+3TC+NVP", "Autres"]
+arv_options = ARV_OPTIONS
 raison_options = ["Échec virologique", "Stock out", "Toxicité", "Grossesse", "Switch recommandé", "Intéruption du traitement"]
 
 def afficher_et_modifier_historique(historique, arv_options, raison_options):
@@ -265,6 +285,90 @@ def afficher_et_modifier_historique(historique, arv_options, raison_options):
     
     return historique_modifie
 
+# ---------------------
+# Saisie en tableau (st.data_editor)
+# ---------------------
+def vers_date(texte):
+    """'05/03/2021' ou '2021-03-05' -> date (None si inconnue ou invalide)"""
+    o = ordinal(texte)
+    return date.fromordinal(o) if o else None
+
+def date_cellule(v):
+    """Valeur d'une cellule DateColumn (date, datetime, Timestamp, NaT ou None) -> date ou None"""
+    if v is None or v != v:   # NaT / NaN
+        return None
+    if isinstance(v, datetime):
+        return v.date()
+    return v if isinstance(v, date) else vers_date(str(v))
+
+def signaler_lignes(libelle, invalides):
+    if invalides:
+        st.warning(f"⚠️ {libelle} : ligne(s) {', '.join(map(str, invalides))} ignorée(s) (valeur ou date invalide)")
+
+def editer_mesures(mesures, cle, libelle):
+    """Grille éditable d'une série [{"valeur", "date"}] ; les lignes invalides sont signalées et ignorées"""
+    colonnes = {"valeur": [str(m.get("valeur", "")) for m in mesures],
+                "date": [vers_date(m.get("date")) for m in mesures]}
+    edition = st.data_editor(
+        colonnes, key=cle, num_rows="dynamic", use_container_width=True,
+        column_config={
+            "valeur": st.column_config.TextColumn(libelle, help="ex: 12 500, <40, indétectable", required=True),
+            "date": st.column_config.DateColumn("Date", min_value=MIN_DATE, max_value=MAX_DATE,
+                                                format="DD/MM/YYYY", required=True)
+        }
+    )
+    mesures_mod, invalides = [], []
+    for i, (v, d) in enumerate(zip(edition["valeur"], edition["date"]), 1):
+        d = date_cellule(d)
+        if valeur(v) is None or d is None:
+            invalides.append(i)
+        else:
+            mesures_mod.append({"valeur": str(v).strip(), "date": str(d)})
+    signaler_lignes(libelle, invalides)
+    return mesures_mod
+
+def editer_historique(historique, arv_options, raison_options):
+    """Grille éditable de l'historique ; date vide = inconnue, 'Autres' renseigné dans la colonne libre"""
+    st.subheader("💊 Historique thérapeutique")
+    colonnes = {"arv": [], "autre_arv": [], "debut": [], "fin": [], "raison_changement": []}
+    for t in historique:
+        arv = t.get("arv", "")
+        colonnes["arv"].append(arv if arv in arv_options else "Autres")
+        colonnes["autre_arv"].append("" if arv in arv_options else arv)
+        colonnes["debut"].append(vers_date(t.get("debut")))
+        colonnes["fin"].append(vers_date(t.get("fin")))
+        raison = t.get("raison_changement", "")
+        colonnes["raison_changement"].append(raison if raison in raison_options else raison_options[0])
+    edition = st.data_editor(
+        colonnes, key="grille_tarv", num_rows="dynamic", use_container_width=True,
+        column_config={
+            "arv": st.column_config.SelectboxColumn("ARV", options=arv_options, required=True),
+            "autre_arv": st.column_config.TextColumn("ARV (si Autres)"),
+            "debut": st.column_config.DateColumn("Début (vide = inconnu)", min_value=MIN_DATE, max_value=MAX_DATE,
+                                                 format="DD/MM/YYYY"),
+            "fin": st.column_config.DateColumn("Fin (vide = inconnue)", min_value=MIN_DATE, max_value=MAX_DATE,
+                                               format="DD/MM/YYYY"),
+            "raison_changement": st.column_config.SelectboxColumn("Raison", options=raison_options)
+        }
+    )
+    historique_modifie, invalides = [], []
+    for i, ligne in enumerate(zip(*(edition[c] for c in colonnes)), 1):
+        arv, autre, debut, fin, raison = ligne
+        arv = (autre or "").strip() if arv == "Autres" else arv
+        debut, fin = date_cellule(debut), date_cellule(fin)
+        if not arv or (debut and fin and fin < debut):
+            invalides.append(i)
+            continue
+        historique_modifie.append({
+            "arv": arv,
+            "debut": debut.strftime("%d/%m/%Y") if debut else "inconnue",
+            "fin": fin.strftime("%d/%m/%Y") if fin else "inconnue",
+            "raison_changement": raison or raison_options[0]
+        })
+    if invalides:
+        st.warning(f"⚠️ Historique : ligne(s) {', '.join(map(str, invalides))} ignorée(s) (ARV manquant ou fin avant le début)")
+    return historique_modifie
+
 # ---------------------
 # Section édition données extraites
 # ---------------------
@@ -281,7 +385,10 @@ with col_naissance:
                                   min_value=MIN_DATE, max_value=MAX_DATE)
 
 # Affichage de l'historique thérapeutique
-historique = afficher_et_modifier_historique(historique, arv_options, raison_options)
+if saisie_tableau:
+    historique = editer_historique(historique, arv_options, raison_options)
+else:
+    historique = afficher_et_modifier_historique(historique, arv_options, raison_options)
 
 # ---------------------
 # Observance
@@ -312,11 +419,17 @@ for i in range(n_coinf):
 
 # Affichage charges virales
 st.markdown("### 📊 Charges virales")
-charges_virales = afficher_charges_virales(charges_virales)
+if saisie_tableau:
+    charges_virales = editer_mesures(charges_virales, "grille_cv", "Charge virale (copies/ml)")
+else:
+    charges_virales = afficher_charges_virales(charges_virales)
 
 # Affichage t_cd4
 st.markdown("### 📊 Taux de CD4")
-t_cd4 = afficher_taux_cd4(t_cd4)
+if saisie_tableau:
+    t_cd4 = editer_mesures(t_cd4, "grille_cd4", "CD4 (cellules/µl)")
+else:
+    t_cd4 = afficher_taux_cd4(t_cd4)
 
 # ---------------------------
 # Upload rapport mutations
@@ -334,8 +447,15 @@ if uploaded_doc:
         # Vérifier si le module d'extraction est disponible
         try:
             from extract import extract_info_from_text
-            extracted_data = extract_info_from_text(temp_path)
+            with profiler("extraction_stanford", actif=profilage_ui) as capture:
+                extracted_data = extract_info_from_text(temp_path)
+            afficher_profil(capture)
             st.success("✅ Données extraites automatiquement")
+            # Rapport sans tableau "Mutation scoring" : les scores viennent du moteur local, pas de Stanford
+            for bloc in extracted_data.get("scores") or []:
+                if libelle_source(bloc):
+                    titre = bloc.get("section", "") + (f"-{bloc['sous_section']}" if bloc.get("sous_section") else "")
+                    st.warning(f"⚠️ Scores {titre} {libelle_source(bloc)}")
             
             # Afficher un aperçu des données extraites
             with st.expander("Voir les données extraites"):
@@ -354,54 +474,22 @@ if uploaded_doc:
 # ---------------------------
 # Préparation prompt utilisateur
 # ---------------------------
-mutations_prompt = []
-if extracted_data:
-    for mut_block in extracted_data.get("mutations", []):
-        section = mut_block.get("Section", "Unknown")
-        mut_text = f"Section {section}:\n"
-        for key, val in mut_block.items():
-            if key == "Section": 
-                continue
-            mut_text += f"    {key}: {val}\n"
-        mutations_prompt.append(mut_text)
-mutations_prompt_str = "\n".join(mutations_prompt) if mutations_prompt else "Aucune mutation détectée"
-
-scores_prompt = []
-if extracted_data:
-    for bloc in extracted_data.get("scores", []):
-        section = bloc.get("section", "Unknown")
-        sous_section = bloc.get("sous_section", None)
-        scores = bloc.get("scores", {})
-        efficacite = bloc.get("efficacite", {})
-        title = f"{section}" + (f" - {sous_section}" if sous_section else "")
-        scores_text = f"{title}:\n"
-        for arv, score_val in scores.items():
-            eff = efficacite.get(arv, "Non interprétable")
-            scores_text += f"    {arv}: score={score_val}, efficacité={eff}\n"
-        scores_prompt.append(scores_text)
-scores_prompt_str = "\n".join(scores_prompt) if scores_prompt else "Aucun score ARV détectée"
+mutations_prompt = extracted_data.get("mutations", []) if extracted_data else []
+scores_prompt = extracted_data.get("scores", []) if extracted_data else []
 
 # Préparation des données pour le prompt
-user_prompt = f"""
-### Contexte du patient:
-Code patient: {code_patient}
-Nom patient: {Nom_patient}
-Sexe: {sexe}
-Date de naissance: {date_naissance.strftime('%d/%m/%Y')}
-Historique thérapeutique: {json.dumps(historique, ensure_ascii=False)}
-Charges virales: {json.dumps(charges_virales, ensure_ascii=False)}
-Taux de CD4: {json.dumps(t_cd4, ensure_ascii=False)}
-Observance: {jours_manques} jours manqués
-Co-infections: {json.dumps(co_infections, ensure_ascii=False)}
-
-### Mutations du VIH détectées:
-{mutations_prompt_str}
-
-### Scores d'efficacité des ARV face aux mutations:
-{scores_prompt_str}
-### Instruction complémentaire:
-
-"""
+patient_ui = {
+    "code_patient": code_patient,
+    "nom_patient": Nom_patient,
+    "sexe": sexe,
+    "date_naissance": date_naissance.strftime('%d/%m/%Y'),
+    "historique_therapeutique": historique,
+    "charges_virales": charges_virales,
+    "taux_cd4": t_cd4,
+    "observance": jours_manques,
+    "co_infections": co_infections
+}
+user_prompt = construire_user_prompt(patient_ui, extracted_data)
 
 st.subheader("📝 Prompt généré pour le LLM")
 with st.expander("Voir le prompt complet"):
@@ -412,25 +500,51 @@ with st.expander("Voir le prompt complet"):
 # ---------------------------
 interpretation_clinique = ""
 premiere_interpretation = ""
+
+def generer_interpretation_job(job, user_prompt, mutations_patient, texte_demo, profil=False, adaptateur=None):
+    """Pipeline de génération exécuté en arrière-plan (modèle local puis amélioration Ollama)"""
+    try:
+        from pipeline_rapport import generer_rapport
+        return generer_rapport(user_prompt, mutations_patient, job, profil=profil, adaptateur=adaptateur)
+    except ImportError:
+        return {"premiere": "", "finale": texte_demo}
+
+def precharger_modele(job):
+    """Charge et préchauffe le modèle dans le worker de jobs avant la première génération"""
+    from pipeline_rapport import charger_generation
+    job.avancer(0.1, "Chargement du modèle...")
+    charger_generation()
+    if not os.environ.get("INFERENCE_WORKER"):   # sinon le worker d'inférence se préchauffe lui-même
+        from prechauffage import prechauffer
+        job.avancer(0.5, "Préchauffage du modèle...")
+        prechauffer()
+
+@st.cache_resource
+def get_file_jobs():
+    """File de jobs unique pour le serveur : survit aux reruns du script"""
+    file_jobs = FileJobs(max_workers=1)
+    if os.environ.get("PRECHARGER_MODELE"):
+        file_jobs.soumettre(precharger_modele, nom="préchargement")
+    return file_jobs
+
+file_jobs = get_file_jobs()
+
+if os.environ.get("PRECHARGER_MODELE") and not os.environ.get("INFERENCE_WORKER"):
+    from prechauffage import rapport_prechauffage
+    etat_modele = rapport_prechauffage()
+    if etat_modele["pret"]:
+        premiere = etat_modele["premiere_requete_s"]
+        st.sidebar.caption(f"✅ Modèle prêt (chargement {etat_modele['chargement_s']}s, préchauffage {etat_modele['prechauffage_s']}s"
+                           + (f", 1re génération {premiere}s)" if premiere is not None else ")"))
+    else:
+        st.sidebar.caption("⏳ Modèle en cours de chargement / préchauffage")
+
+taux, n_rapports = taux_sans_raffinement()
+if n_rapports:
+    st.sidebar.metric("Rapports sans raffinement Ollama", f"{taux:.0%}", help=f"sur {n_rapports} rapport(s) depuis le démarrage")
+
 if st.button("📝 Générer l'interprétation", type="primary"):
-    with st.spinner("Génération de l'interprétation en cours..."):
-        try:
-            # Vérifier la disponibilité des modules de génération
-            try:
-                from generation_tr import generate_model_response
-                from generate_with_ollama import generate_model_ollama_response
-                
-                premiere_interpretation = generate_model_response(user_prompt)
-                if premiere_interpretation:
-                    interpretation_clinique = generate_model_ollama_response(
-                        premiere_interpretation, user_prompt
-                    )
-                else:
-                    interpretation_clinique = "Erreur : la génération locale a échoué."
-                    
-            except ImportError:
-                interpretation_clinique = "⚠️ Modules de génération non disponibles. Mode démonstration activé."
-                interpretation_clinique = f"""
+    texte_demo = f"""
                 RAPPORT MÉDICAL - MODE DÉMONSTRATION
                 Patient: {Nom_patient} ({code_patient})
                 Sexe: {sexe}
@@ -445,9 +559,41 @@ if st.button("📝 Générer l'interprétation", type="primary"):
                 
                 Ceci est une démonstration. Activez les modules de génération pour obtenir un rapport complet.
                 """
-                
-        except Exception as e:
-            interpretation_clinique = f"❌ Erreur lors de la génération : {str(e)}"
+    mutations_patient = extracted_data.get("mutations") if extracted_data else None
+    st.session_state["job_generation"] = file_jobs.soumettre(
+        generer_interpretation_job, user_prompt, mutations_patient, texte_demo, profil=profilage_ui,
+        adaptateur=adaptateur_ui, nom=code_patient
+    )
+
+# Suivi du job courant : le résultat est récupéré, jamais recalculé
+job_id = st.session_state.get("job_generation")
+job = file_jobs.get(job_id) if job_id else None
+if job is not None:
+    if not job.termine:
+        if job.statut == EN_ATTENTE:
+            st.info(f"⏳ En file d'attente ({file_jobs.position(job_id)} job(s) avant celui-ci)")
+        st.progress(job.progression, text=f"{job.etape} ({job.duree:.0f}s)")
+        if st.button("⛔ Annuler la génération"):
+            file_jobs.annuler(job_id)
+        time.sleep(1)
+        st.rerun()
+    elif job.statut == TERMINE:
+        premiere_interpretation = job.resultat["premiere"]
+        interpretation_clinique = job.resultat["finale"]
+        if job.resultat.get("validation"):
+            if job.resultat["raffinement"]:
+                st.caption(f"🔁 Raffinement Ollama appliqué (critères non satisfaits : {', '.join(job.resultat['validation']['echecs']) or 'forcé'})")
+            else:
+                st.caption("⚡ Première version validée : raffinement Ollama évité")
+        durees = job.resultat.get("durees", {})
+        if durees:
+            st.caption("⏱️ " + " | ".join(f"{etape} {d:.1f}s" for etape, d in durees.items()))
+        if job.resultat.get("profil"):
+            st.caption(f"🔬 Profil de la génération : {job.resultat['profil']['fichiers']['pile']}")
+    elif job.statut == ERREUR:
+        interpretation_clinique = f"❌ Erreur lors de la génération : {job.erreur}"
+    elif job.statut == ANNULE:
+        st.warning("Génération annulée")
 
     if interpretation_clinique:
         st.subheader("📝 1 ere version de l'Interprétation générée")
@@ -468,6 +614,18 @@ if interpretation_clinique:
         file_name=f"rapport_{code_patient}.txt",
         mime="text/plain"
     )
+    # Même rapport dans le modèle Word (patient, bilans, mutations, scores, interprétation)
+    try:
+        from rendu_docx import rendre_docx
+        st.download_button(
+            label="📥 Télécharger le rapport (.docx)",
+            data=rendre_docx({"patient": patient_ui, "extraction": extracted_data or {},
+                              "interpretation": interpretation_clinique, "adaptateur": adaptateur_ui}),
+            file_name=f"rapport_{code_patient}.docx",
+            mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
+    except Exception as e:
+        st.caption(f"⚠️ Rapport .docx indisponible : {e}")
 else:
     st.warning("Générez d'abord une interprétation")
 
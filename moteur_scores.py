@@ -0,0 +1,157 @@
+import re
+import json
+import numpy as np
+from functools import lru_cache
+
+# === 0) Configuration ===
+REGLES_PATH = r".\regles_hivdb.json"
+# Blocs de scores calculés ici (et non lus dans un rapport Stanford) : étiquetés pour le prompt, l'interface et le .docx
+SOURCE_MOTEUR = "moteur_local"
+
+# Seuils HIVdb : score total -> niveau d'efficacité
+SEUILS_EFFICACITE = [0, 10, 30, 60]
+NIVEAUX_EFFICACITE = ["Hyper actif", "Totalement actif", "Bonne activité résiduelle", "Partiellement actif", "Inactif"]
+
+GENE_CLASSE = {"PR": "PR", "NRTI": "RT", "NNRTI": "RT", "INSTI": "IN"}
+MUTATION_CLE = re.compile(r"^([A-Z])(\d{1,3})(Ins|del|[A-Z]+)$")
+TAILLE_LOT = 1024
+
+def niveau_efficacite(score):
+    """Niveau d'efficacité d'un score total (str ou int)"""
+    try:
+        score = int(score)
+    except (TypeError, ValueError):
+        return "Non interprétable"
+    return NIVEAUX_EFFICACITE[int(np.searchsorted(SEUILS_EFFICACITE, score, side="right"))]
+
+def niveaux_efficacite(scores):
+    """Version vectorisée de niveau_efficacite sur un tableau de scores"""
+    return np.asarray(NIVEAUX_EFFICACITE, dtype=object)[np.searchsorted(SEUILS_EFFICACITE, scores, side="right")]
+
+def composants(mutation):
+    """'M184MV' -> [(184, 'V')] : position et acides aminés mutants d'une mutation (mélanges inclus)"""
+    match = MUTATION_CLE.match(mutation)
+    if not match:
+        return []
+    ref, pos, alts = match.group(1), int(match.group(2)), match.group(3)
+    if alts in ("Ins", "del"):
+        return [(pos, alts)]
+    return [(pos, aa) for aa in alts if aa != ref]
+
+# === 1) Moteur ===
+class MoteurScores:
+    """Calcule les scores HIVdb et niveaux d'efficacité à partir des listes de mutations"""
+
+    def __init__(self, regles):
+        self.version = regles["version"]
+        self.classes = regles["medicaments"]
+        # Colonnes : tous les médicaments, dans l'ordre des classes
+        self.medicaments = [m for meds in self.classes.values() for m in meds]
+        col = {m: j for j, m in enumerate(self.medicaments)}
+
+        # Vocabulaire : (gène, position, aa) -> ligne ; mutations simples + composants des combinaisons
+        self.vocab = {}
+        cles = [(gene, mut) for gene, muts in regles["mutations"].items() for mut in muts]
+        cles += [(c["gene"], mut) for c in regles.get("combinaisons", []) for mut in c["mutations"]]
+        for gene, mut in cles:
+            for pos, aa in composants(mut):
+                self.vocab.setdefault((gene, pos, aa), len(self.vocab))
+
+        # Trie le vocabulaire par (gène, position) pour la réduction "max par position"
+        ordre = sorted(self.vocab, key=lambda k: (k[0], k[1], k[2]))
+        self.vocab = {k: i for i, k in enumerate(ordre)}
+        positions = [(g, p) for g, p, _ in ordre]
+        self.debuts_position = np.array([i for i, gp in enumerate(positions) if i == 0 or gp != positions[i - 1]])
+
+        self.penalites = np.zeros((len(self.vocab), len(self.medicaments)), dtype=np.float32)
+        for gene, muts in regles["mutations"].items():
+            for mut, scores in muts.items():
+                for pos, aa in composants(mut):
+                    for med, val in scores.items():
+                        self.penalites[self.vocab[(gene, pos, aa)], col[med]] = val
+
+        combinaisons = regles.get("combinaisons", [])
+        self.combi_membres = np.zeros((len(combinaisons), len(self.vocab)), dtype=np.float32)
+        self.combi_penalites = np.zeros((len(combinaisons), len(self.medicaments)), dtype=np.float32)
+        for i, c in enumerate(combinaisons):
+            for mut in c["mutations"]:
+                pos, aa = composants(mut)[0]
+                self.combi_membres[i, self.vocab[(c["gene"], pos, aa)]] = 1
+            for med, val in c["scores"].items():
+                self.combi_penalites[i, col[med]] = val
+        self.combi_tailles = self.combi_membres.sum(axis=1)
+
+    def encoder(self, genotypes):
+        """Matrice binaire (n_génotypes x n_mutations) à partir de sorties de extract_mutation_blocks"""
+        from extract import aplatir_mutations
+        X = np.zeros((len(genotypes), len(self.vocab)), dtype=np.float32)
+        for i, mutation_table in enumerate(genotypes):
+            for section, _, mut in aplatir_mutations(mutation_table):
+                for pos, aa in composants(mut):
+                    j = self.vocab.get((section, pos, aa))
+                    if j is not None:
+                        X[i, j] = 1
+        return X
+
+    def scorer_matrice(self, X):
+        """Scores totaux (n_génotypes x n_médicaments) ; mélanges : max par position comme HIVdb"""
+        totaux = np.empty((X.shape[0], len(self.medicaments)), dtype=np.float32)
+        for debut in range(0, X.shape[0], TAILLE_LOT):
+            lot = X[debut:debut + TAILLE_LOT]
+            # (lot x mutations x médicaments), -inf là où la mutation est absente
+            contrib = np.where(lot[:, :, None] > 0, self.penalites[None, :, :], -np.inf)
+            par_position = np.maximum.reduceat(contrib, self.debuts_position, axis=1)
+            par_position[np.isneginf(par_position)] = 0
+            total = par_position.sum(axis=1)
+            if len(self.combi_tailles):
+                presentes = (lot @ self.combi_membres.T) >= self.combi_tailles
+                total += presentes.astype(np.float32) @ self.combi_penalites
+            totaux[debut:debut + TAILLE_LOT] = total
+        return totaux
+
+    def scorer(self, genotypes):
+        return self.scorer_matrice(self.encoder(genotypes))
+
+    def scores_patient(self, mutation_table):
+        """Scores au même format que extract.extract_scores (régions séquencées uniquement)"""
+        totaux = self.scorer([mutation_table])[0].astype(int)
+        niveaux = niveaux_efficacite(totaux)
+        sections = {bloc.get("Section") for bloc in mutation_table}
+        resultat, j = [], 0
+        for classe, meds in self.classes.items():
+            scores = {m: str(totaux[j + k]) for k, m in enumerate(meds)}
+            efficacite = {m: niveaux[j + k] for k, m in enumerate(meds)}
+            j += len(meds)
+            if GENE_CLASSE[classe] not in sections:
+                continue
+            entry = {
+                "section": GENE_CLASSE[classe],
+                "scores": scores,
+                "efficacite": efficacite,
+                "source": SOURCE_MOTEUR,
+                "version_regles": self.version
+            }
+            if entry["section"] == "RT":
+                entry["sous_section"] = classe
+            resultat.append(entry)
+        return resultat
+
+@lru_cache(maxsize=4)
+def charger_moteur(path=REGLES_PATH):
+    """Moteur construit à partir de la table de règles versionnée (mis en cache)"""
+    with open(path, "r", encoding="utf-8") as f:
+        return MoteurScores(json.load(f))
+
+if __name__ == "__main__":
+    import sys, time
+    from pathlib import Path
+    dossier = Path(sys.argv[1] if len(sys.argv) > 1 else r".\data_json")
+    genotypes = []
+    for path in sorted(dossier.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            genotypes.append(json.load(f).get("extraction_texte", {}).get("mutations", []))
+    moteur = charger_moteur()
+    debut = time.perf_counter()
+    totaux = moteur.scorer(genotypes)
+    duree = time.perf_counter() - debut
+    print(f"✅ {len(genotypes)} génotypes scorés en {duree:.3f}s ({len(genotypes) / max(duree, 1e-9):.0f}/s) | règles {moteur.version}")
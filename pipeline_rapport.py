@@ -0,0 +1,126 @@
+import os
+import re
+import time
+import threading
+
+# === Pipeline de génération partagé (interface, API, CLI) ===
+_generation = {}
+_verrou = threading.Lock()
+
+# Raffinement Ollama seulement si la première version échoue à la validation
+# (RAFFINEMENT_TOUJOURS=1 pour revenir aux deux passes systématiques)
+RAFFINEMENT_TOUJOURS = bool(os.environ.get("RAFFINEMENT_TOUJOURS"))
+STATS_RAFFINEMENT = {"rapports": 0, "sans_raffinement": 0}
+
+def charger_generation():
+    """Importe une seule fois les deux étapes de génération (le modèle est réutilisé entre les appels)"""
+    with _verrou:
+        if not _generation:
+            if os.environ.get("INFERENCE_WORKER"):
+                # Modèle servi par serveur_inference.py (une seule copie pour tous les processus)
+                from serveur_inference import generate_model_response
+            else:
+                from generate_interpretation import generate_model_response
+            from generate_with_ollama import generate_model_ollama_response
+            _generation["locale"] = generate_model_response
+            _generation["ollama"] = generate_model_ollama_response
+    return _generation["locale"], _generation["ollama"]
+
+def generer_rapport(user_prompt, mutations=None, job=None, profil=None, adaptateur=None):
+    """Modèle local puis amélioration Ollama ; `job` (file_jobs.Job) reçoit la progression
+
+    `profil` : capture d'un profil CPU/allocations de l'appel (None : variable PROFILAGE)
+    `adaptateur` : adaptateur LoRA de la première étape (BACKEND_LOCAL=lora ; None : ADAPTATEUR)
+    """
+    from profilage import profiler
+    with profiler("generation", actif=profil) as capture:
+        rapport = _generer_rapport(user_prompt, mutations, job, adaptateur)
+    if capture:
+        rapport["profil"] = capture.resume
+    return rapport
+
+def _generer_rapport(user_prompt, mutations, job, adaptateur=None):
+    generate_model_response, generate_model_ollama_response = charger_generation()
+    from backends_inference import REPONSE_ERREUR
+    durees = {}
+
+    if job:
+        job.avancer(0.05, "Génération locale (modèle fine-tuné)...")
+    debut = time.perf_counter()
+    premiere = generate_model_response(user_prompt, mutations, adaptateur=adaptateur)
+    durees["locale"] = time.perf_counter() - debut
+    from prechauffage import noter_requete
+    noter_requete(durees["locale"])
+    if not premiere.strip() or premiere == REPONSE_ERREUR:
+        return {"premiere": "", "finale": "Erreur : la génération locale a échoué.", "durees": durees}
+
+    from validation_rapport import valider_rapport
+    from decodage_schema import molecules_autorisees
+    validation = valider_rapport(premiere, user_prompt, molecules=molecules_autorisees(user_prompt=user_prompt))
+    raffinement = RAFFINEMENT_TOUJOURS or not validation["valide"]
+    if raffinement:
+        if job:
+            job.avancer(0.5, f"Amélioration avec Ollama ({', '.join(validation['echecs']) or 'forcée'})...")
+        debut = time.perf_counter()
+        finale = generate_model_ollama_response(premiere, user_prompt, mutations)
+        durees["ollama"] = time.perf_counter() - debut
+    else:
+        finale = premiere
+        durees["ollama"] = 0.0
+
+    with _verrou:
+        STATS_RAFFINEMENT["rapports"] += 1
+        STATS_RAFFINEMENT["sans_raffinement"] += not raffinement
+    return {"premiere": premiere, "finale": finale, "durees": durees,
+            "raffinement": raffinement, "validation": validation, "adaptateur": adaptateur}
+
+def taux_sans_raffinement():
+    """(fraction des rapports servis sans passe Ollama, nombre de rapports) depuis le démarrage"""
+    with _verrou:
+        n = STATS_RAFFINEMENT["rapports"]
+        return (STATS_RAFFINEMENT["sans_raffinement"] / n if n else 0.0), n
+
+def extraire_patient(note, stanford, code_patient="", profil=None):
+    """Contexte patient + données Stanford à partir des deux .docx (chemins ou fichiers binaires)"""
+    from extract import extract_info_from_text
+    from extractrslt import extract_note_and_interpretation
+    from profilage import profiler
+
+    with profiler("extraction", actif=profil):
+        data_note = extract_note_and_interpretation(note)
+        extraction = extract_info_from_text(stanford)
+    patient = {
+        "code_patient": code_patient,
+        "nom_patient": "",
+        "sexe": data_note.get("sexe") or "Autre",
+        "date_naissance": data_note.get("date_naissance", ""),
+        "historique_therapeutique": data_note.get("historique_therapeutique", []),
+        "charges_virales": data_note.get("charges_virales", []),
+        "taux_cd4": data_note.get("taux_cd4", []),
+        "observance": "inconnu",
+        "co_infections": []
+    }
+    return patient, extraction, data_note
+
+# Mots des noms de fichiers qui identifient le type de rapport (ex: P001_TR.docx / P001_Stanford.docx)
+MOTS_NOTE = {"tr", "note"}
+MOTS_MUTATION = {"stanford", "mut", "mutation", "mutations"}
+
+def apparier_fichiers(dossier):
+    """Regroupe récursivement les .docx d'un dossier par code patient : {code: {"note": Path, "mut": Path}}"""
+    from pathlib import Path
+    patients = {}
+    for f in sorted(Path(dossier).rglob("*.docx")):
+        if f.name.startswith("~$"):   # fichiers verrous de Word
+            continue
+        mots = [m for m in re.split(r"[_\-\s.]+", f.stem) if m]
+        minuscules = {m.lower() for m in mots}
+        if minuscules & MOTS_MUTATION:
+            type_fichier = "mut"
+        elif minuscules & MOTS_NOTE:
+            type_fichier = "note"
+        else:
+            continue
+        code = "_".join(m for m in mots if m.lower() not in MOTS_NOTE | MOTS_MUTATION).upper()
+        patients.setdefault(code, {})[type_fichier] = f
+    return patients
@@ -0,0 +1,97 @@
+import os
+import time
+import threading
+
+# === 0) Configuration ===
+# PRECHAUFFAGE=0 : le service (API, worker) se déclare prêt sans préchauffer le modèle
+PRECHAUFFAGE_ACTIF = os.environ.get("PRECHAUFFAGE", "1") != "0"
+TAILLES = (1, 4, 10)        # traitements / mesures / mutations du patient fictif : prompts court, moyen, long
+TOKENS_PRECHAUFFAGE = 16    # génération courte : initialise noyaux, caches et graphes compilés sans tout décoder
+ESSAIS_MAX = 3
+TOLERANCE = 1.25            # une taille est chaude quand un essai n'est pas plus de 25 % plus lent que le précédent
+
+ETAT = {"pret": False, "en_cours": False, "chargement_s": None, "prechauffage_s": None,
+        "essais": [], "premiere_requete_s": None}
+_verrou = threading.Lock()
+
+# === 1) Prompts représentatifs ===
+def patient_fictif(taille):
+    """Patient et extraction synthétiques dont le prompt grandit avec `taille`"""
+    arv = ["TDF+3TC+EFV", "AZT+3TC+NVP", "TDF+3TC+DTG", "ABC+3TC+LPV/r"]
+    historique = [{"arv": arv[i % len(arv)], "debut": f"01/01/{2005 + i}", "fin": f"01/01/{2006 + i}",
+                   "raison_changement": "Échec virologique"} for i in range(taille)]
+    mesures = [{"valeur": str(1000 * (i + 1)), "date": f"{2010 + i}-06-01"} for i in range(taille)]
+    mutations = ["M184V", "K65R", "K103N", "Y181C", "G190A", "L74V", "T215Y", "M41L", "K219Q", "D67N"][:taille]
+    extraction = {
+        "mutations": [{"Section": "RT", "Mutations_majeures": [{"NRTIs": mutations[::2]}, {"NNRTIS": mutations[1::2]}]}],
+        "scores": [{"section": "RT", "sous_section": "NRTI",
+                    "scores": {m: str(15 * (i % 5)) for i, m in enumerate(["ABC", "AZT", "FTC", "3TC", "TDF"][:taille + 1])}}]
+    }
+    patient = {"code_patient": f"PRECHAUFFAGE_{taille}", "sexe": "Féminin", "date_naissance": "01/01/1980",
+               "historique_therapeutique": historique, "charges_virales": mesures, "taux_cd4": mesures,
+               "observance": "inconnu", "co_infections": []}
+    return patient, extraction
+
+def generer_court(backend, texte, max_new_tokens=TOKENS_PRECHAUFFAGE):
+    """Génération de quelques tokens par le backend (pipeline transformers, llama.cpp ou LLM LangChain)"""
+    debut = time.perf_counter()
+    if hasattr(backend, "pipe"):
+        backend.pipe(texte, max_new_tokens=max_new_tokens, return_full_text=False)
+    elif hasattr(backend, "modele"):
+        backend.modele(texte, max_tokens=max_new_tokens)
+    else:
+        backend.llm.invoke(texte)
+    return time.perf_counter() - debut
+
+# === 2) Préchauffage ===
+def prechauffer(tailles=TAILLES, max_new_tokens=TOKENS_PRECHAUFFAGE, essais_max=ESSAIS_MAX):
+    """Charge le modèle de la première étape puis génère sur des prompts de plusieurs longueurs
+    jusqu'à latence stable ; ETAT["pret"] passe à True à la fin"""
+    with _verrou:
+        if ETAT["pret"] or ETAT["en_cours"]:
+            return ETAT
+        ETAT["en_cours"] = True
+    try:
+        from prompt_patient import construire_user_prompt
+        debut = time.perf_counter()
+        import generate_interpretation as gi   # chargement du backend (et compilation paresseuse si COMPILATION)
+        ETAT["chargement_s"] = round(time.perf_counter() - debut, 2)
+
+        debut = time.perf_counter()
+        for taille in tailles:
+            user_msg = construire_user_prompt(*patient_fictif(taille))
+            texte = gi.prompt.format(**gi.preparer_entree(user_msg))
+            durees = []
+            for _ in range(essais_max):
+                with gi.adaptateur_actif(gi.backend):
+                    durees.append(round(generer_court(gi.backend, texte, max_new_tokens), 3))
+                if len(durees) > 1 and durees[-1] <= durees[-2] * TOLERANCE:
+                    break
+            ETAT["essais"].append({"taille": taille, "caracteres": len(texte), "durees_s": durees})
+            print(f"🔥 Préchauffage taille {taille} ({len(texte)} car.) : {' → '.join(f'{d:.2f}s' for d in durees)}")
+        ETAT["prechauffage_s"] = round(time.perf_counter() - debut, 2)
+        ETAT["pret"] = True
+        print(f"✅ Modèle prêt (chargement {ETAT['chargement_s']}s, préchauffage {ETAT['prechauffage_s']}s)")
+    finally:
+        ETAT["en_cours"] = False
+    return ETAT
+
+def noter_requete(duree):
+    """Latence de la première vraie génération après démarrage (cf. pipeline_rapport)"""
+    with _verrou:
+        if ETAT["premiere_requete_s"] is None:
+            ETAT["premiere_requete_s"] = round(duree, 2)
+
+def rapport_prechauffage():
+    with _verrou:
+        return {k: (list(v) if isinstance(v, list) else v) for k, v in ETAT.items()}
+
+if __name__ == "__main__":
+    # Comparer : python prechauffage.py  /  COMPILATION=1 python prechauffage.py
+    import json
+    prechauffer()
+    from pipeline_rapport import generer_rapport
+    patient, extraction = patient_fictif(TAILLES[len(TAILLES) // 2])
+    from prompt_patient import construire_user_prompt
+    generer_rapport(construire_user_prompt(patient, extraction), profil=False)
+    print(json.dumps(rapport_prechauffage(), ensure_ascii=False, indent=2))
@@ -0,0 +1,79 @@
+import re
+import sys
+import argparse
+import subprocess
+from functools import lru_cache
+
+# === 0) Configuration ===
+# Modules importables sans effet de bord (data.py et interface_final.py exécutent leur script à l'import)
+POINTS_ENTREE = [
+    "extract", "extractrslt", "dates_bilans", "extract_fasta", "moteur_scores", "connaissances_mutations",
+    "registre_patients", "dataset_shards", "file_jobs", "prompt_patient", "pipeline_rapport",
+    "generation_lot", "api_rapports", "serveur_inference", "generate_with_ollama"
+]
+BUDGET_S = 1.0
+LIGNE_IMPORTTIME = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+# === 1) Mesure (processus neuf : aucun module déjà en cache) ===
+def _importtime(code):
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+
+@lru_cache(maxsize=1)
+def modules_demarrage():
+    """Modules chargés par l'interpréteur lui-même (site, .pth...) : exclus du détail"""
+    return frozenset(m.group(4) for m in map(LIGNE_IMPORTTIME.match, _importtime("pass").stderr.splitlines()) if m)
+
+def profiler_import(module):
+    """Temps d'import d'un module via `python -X importtime` : total et détail par module importé"""
+    proc = _importtime(f"import {module}")
+    details, total = [], None
+    for ligne in proc.stderr.splitlines():
+        match = LIGNE_IMPORTTIME.match(ligne)
+        if not match or match.group(4) in modules_demarrage():
+            continue
+        propre, cumul, indentation, nom = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+        profondeur = (len(indentation) - 1) // 2
+        details.append({"module": nom, "propre_s": propre / 1e6, "cumul_s": cumul / 1e6, "profondeur": profondeur})
+        if nom == module:
+            total = cumul / 1e6
+    erreur = None
+    if proc.returncode != 0:
+        erreur = (proc.stderr.strip().splitlines() or ["échec"])[-1]
+    return {"module": module, "total_s": total, "erreur": erreur, "details": details}
+
+def dependances_lourdes(profil, n=8):
+    """Paquets de premier niveau les plus coûteux (cumul, sous-modules inclus)"""
+    paquets = {}
+    for d in profil["details"]:
+        if d["module"] == profil["module"]:
+            continue
+        racine = d["module"].split(".")[0]
+        if d["module"] == racine or racine not in paquets:
+            paquets[racine] = max(paquets.get(racine, 0.0), d["cumul_s"])
+    return sorted(paquets.items(), key=lambda kv: kv[1], reverse=True)[:n]
+
+# === 2) Rapport ===
+def afficher(profils, budget=BUDGET_S, n=8):
+    depassements = []
+    for p in profils:
+        if p["erreur"]:
+            print(f"❌ {p['module']:26s} import impossible : {p['erreur']}")
+            continue
+        etat = "✅" if p["total_s"] <= budget else "⚠️"
+        if p["total_s"] > budget:
+            depassements.append(p["module"])
+        lourdes = ", ".join(f"{nom} {duree * 1000:.0f}ms" for nom, duree in dependances_lourdes(p, n))
+        print(f"{etat} {p['module']:26s} {p['total_s'] * 1000:8.0f} ms   {lourdes}")
+    return depassements
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coût d'import des points d'entrée (python -X importtime)")
+    parser.add_argument("modules", nargs="*", default=POINTS_ENTREE)
+    parser.add_argument("--budget", type=float, default=BUDGET_S, help="budget par module en secondes")
+    parser.add_argument("-n", type=int, default=8, help="nombre de dépendances lourdes affichées")
+    args = parser.parse_args()
+    profils = [profiler_import(m) for m in args.modules]
+    depassements = afficher(profils, args.budget, args.n)
+    if depassements:
+        print(f"⚠️ Budget de {args.budget:.1f}s dépassé : {', '.join(depassements)}")
+        sys.exit(1)
@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+
+# === 0) Configuration ===
+# PROFILAGE=1 active la capture pour les exécutions CLI / ETL ; l'interface a son propre interrupteur.
+# PROFILAGE=cpu : pile seule (tracemalloc ralentit fortement le code qui alloue beaucoup)
+PROFILAGE_ACTIF = bool(os.environ.get("PROFILAGE"))
+ALLOCATIONS_ACTIVES = os.environ.get("PROFILAGE", "").lower() != "cpu"
+DOSSIER_PROFILS = Path(os.environ.get("PROFILAGE_DOSSIER", r".\profils"))
+INTERVALLE_S = 0.005        # période d'échantillonnage de la pile
+PROFONDEUR_ALLOCATIONS = 1      # statistiques par ligne : une frame suffit (surcoût réduit)
+TOP_ALLOCATIONS = 30
+
+# === 1) Échantillonneur de pile (format "folded" : flamegraph.pl, speedscope, inferno) ===
+class Echantillonneur(threading.Thread):
+    """Relève périodiquement la pile d'un thread et compte les piles identiques"""
+
+    def __init__(self, thread_id, intervalle=INTERVALLE_S):
+        super().__init__(daemon=True, name="profilage")
+        self.thread_id = thread_id
+        self.intervalle = intervalle
+        self.piles = Counter()
+        self._arret = threading.Event()
+
+    def run(self):
+        while not self._arret.wait(self.intervalle):
+            frame = sys._current_frames().get(self.thread_id)
+            pile = []
+            while frame is not None:
+                code = frame.f_code
+                pile.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if pile:
+                self.piles[";".join(reversed(pile))] += 1
+
+    def arreter(self):
+        self._arret.set()
+        self.join()
+
+    def ecrire(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for pile, n in self.piles.most_common():
+                f.write(f"{pile} {n}\n")
+
+    def fonctions_chaudes(self, n=10):
+        """Fonctions les plus souvent en sommet de pile (temps propre)"""
+        sommets = Counter()
+        for pile, k in self.piles.items():
+            sommets[pile.rsplit(";", 1)[-1]] += k
+        total = sum(sommets.values()) or 1
+        return [{"fonction": f, "part": round(k / total, 3)} for f, k in sommets.most_common(n)]
+
+# === 2) tracemalloc partagé : global au processus, démarré par la première capture, arrêté par la dernière ===
+_traces = {"captures": 0, "externe": False}
+_verrou_traces = threading.Lock()
+
+def _debut_traces():
+    with _verrou_traces:
+        if _traces["captures"] == 0:
+            _traces["externe"] = tracemalloc.is_tracing()   # tracé par ailleurs : ne jamais l'arrêter
+            if not _traces["externe"]:
+                tracemalloc.start(PROFONDEUR_ALLOCATIONS)
+        _traces["captures"] += 1
+
+def _fin_traces():
+    with _verrou_traces:
+        _traces["captures"] -= 1
+        if _traces["captures"] == 0 and not _traces["externe"]:
+            tracemalloc.stop()
+
+# === 3) Capture d'un appel ===
+class Capture:
+    def __init__(self, nom):
+        self.nom = nom
+        self.fichiers = {}
+        self.resume = {}
+
+@contextmanager
+def profiler(nom, actif=None, dossier=None, allocations=None):
+    """Profil CPU échantillonné + allocations d'un bloc ; ne fait rien (aucun coût) si inactif
+
+    with profiler("generation") as capture: ...
+    capture.fichiers -> {"pile", "resume", "allocations"} une fois le bloc terminé
+    """
+    actif = PROFILAGE_ACTIF if actif is None else actif
+    allocations = ALLOCATIONS_ACTIVES if allocations is None else allocations
+    if not actif:
+        yield None
+        return
+
+    capture = Capture(nom)
+    dossier = Path(dossier or DOSSIER_PROFILS)
+    dossier.mkdir(parents=True, exist_ok=True)
+    prefixe = dossier / f"{time.strftime('%Y%m%d_%H%M%S')}_{int(time.time() * 1000) % 1000:03d}_{nom}"
+
+    if allocations:
+        _debut_traces()
+    echantillonneur = Echantillonneur(threading.get_ident())
+    echantillonneur.start()
+    debut = time.perf_counter()
+    try:
+        yield capture
+    finally:
+        duree = time.perf_counter() - debut
+        echantillonneur.arreter()
+        capture.fichiers = {"pile": f"{prefixe}.folded", "resume": f"{prefixe}_resume.json"}
+        echantillonneur.ecrire(capture.fichiers["pile"])
+        pic = 0
+        if allocations:
+            # Instantané pris avant de libérer le tracé : une capture concurrente peut encore tourner
+            snapshot = tracemalloc.take_snapshot()
+            _, pic = tracemalloc.get_traced_memory()
+            _fin_traces()
+            capture.fichiers["allocations"] = f"{prefixe}_allocations.txt"
+            with open(capture.fichiers["allocations"], "w", encoding="utf-8") as f:
+                f.write(f"Pic mémoire tracé : {pic / 1024 / 1024:.1f} MB\n")
+                for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+        capture.resume = {
+            "nom": nom,
+            "duree_s": round(duree, 3),
+            "echantillons": sum(echantillonneur.piles.values()),
+            "pic_memoire_mb": round(pic / 1024 / 1024, 1),
+            "fonctions_chaudes": echantillonneur.fonctions_chaudes(),
+            "fichiers": capture.fichiers
+        }
+        with open(capture.fichiers["resume"], "w", encoding="utf-8") as f:
+            json.dump(capture.resume, f, ensure_ascii=False, indent=2)
+        print(f"🔬 Profil '{nom}' enregistré : {capture.fichiers['pile']}")
@@ -0,0 +1,163 @@
+import re
+from series_bilans import SerieBilan, resume_charges_virales, resume_cd4
+
+# === Encodage canonique du patient (partagé par l'interface, l'API, le CLI, l'ETL et les données d'entraînement) ===
+# Une ligne par section, champs vides omis, listes jointes par ", " : texte déterministe et court
+# (moins de tokens à préremplir qu'avec des json.dumps / repr Python de listes et de dicts).
+NIVEAUX_ORDRE = ["Hyper actif", "Totalement actif", "Bonne activité résiduelle", "Partiellement actif",
+                 "Inactif", "Non interprétable"]
+CATEGORIES = {"Mutations_majeures": "majeures", "Mutations_accessoires": "accessoires", "Autres_mutations": "autres"}
+CLASSES_RT = {"NRTIS": "INTI", "NNRTIS": "INNTI"}
+
+def _valeur(v):
+    return str(v).strip() if v is not None else ""
+
+def formater_co_infection(c):
+    """{"nom": "VHB", "duree": "3 mois"} (saisie de l'interface) -> 'VHB (3 mois)'"""
+    if isinstance(c, dict):
+        nom, duree = _valeur(c.get("nom")), _valeur(c.get("duree"))
+        return f"{nom} ({duree})" if duree else nom
+    return _valeur(c)
+
+def formater_patient(patient):
+    champs = [("code", patient.get("code_patient")), ("sexe", patient.get("sexe") or "Autre"),
+              ("naissance", patient.get("date_naissance"))]
+    observance = _valeur(patient.get("observance", "inconnu"))
+    champs.append(("observance", f"{observance} jours manqués" if observance.isdigit() else observance or "inconnu"))
+    champs.append(("co-infections", ", ".join(map(formater_co_infection, patient.get("co_infections") or [])) or "aucune"))
+    return "Patient: " + " | ".join(f"{k}={_valeur(v)}" for k, v in champs if _valeur(v))
+
+def formater_traitements(historique):
+    """'TDF+3TC+EFV 01/03/2015→06/2018 (Échec virologique) ; ...' dans l'ordre de saisie"""
+    lignes = []
+    for t in historique or []:
+        arv = _valeur(t.get("arv")) or "inconnu"
+        periode = f"{_valeur(t.get('debut')) or 'inconnue'}→{_valeur(t.get('fin')) or 'inconnue'}"
+        raison = _valeur(t.get("raison_changement"))
+        lignes.append(f"{arv} {periode}" + (f" ({raison})" if raison else ""))
+    return "Traitements: " + (" ; ".join(lignes) or "aucun")
+
+def formater_mutations(mutations):
+    """Une ligne par gène (sortie de extract_mutation_blocks) : 'Mutations RT: INTI M184V ; INNTI K103N'"""
+    lignes = []
+    for bloc in mutations or []:
+        parties = []
+        for cle, valeur in bloc.items():
+            if cle == "Section" or not valeur:
+                continue
+            if isinstance(valeur, list) and valeur and isinstance(valeur[0], dict):
+                # RT : [{"NRTIs": [...]}, {"NNRTIS": [...]}]
+                for item in valeur:
+                    for classe, muts in item.items():
+                        if muts:
+                            parties.append(f"{CLASSES_RT.get(classe.upper(), classe)} {', '.join(muts)}")
+            else:
+                texte = ", ".join(map(str, valeur)) if isinstance(valeur, (list, tuple)) else _valeur(valeur)
+                parties.append(f"{CATEGORIES.get(cle, cle)} {texte}")
+        lignes.append(f"Mutations {bloc.get('Section', 'inconnue')}: " + (" ; ".join(parties) or "aucune"))
+    return "\n".join(lignes) if lignes else "Mutations: aucune détectée"
+
+def libelle_source(bloc):
+    """'' pour un tableau lu dans le rapport Stanford ; mention explicite pour les scores du moteur local"""
+    if bloc.get("source") != "moteur_local":   # cf. moteur_scores.SOURCE_MOTEUR
+        return ""
+    return f"estimés par le moteur local (règles {bloc.get('version_regles', 'inconnues')}, non validées), pas par Stanford"
+
+def formater_scores(scores_blocs):
+    """Une ligne par tableau (sortie de extract_scores), molécules regroupées par niveau d'efficacité :
+    'Scores RT-NRTI: Inactif 3TC 60, FTC 60 ; Totalement actif AZT 0, TDF 5'
+    (préfixe '[estimés par le moteur local ...]' pour les scores de moteur_scores)"""
+    lignes = []
+    for bloc in scores_blocs or []:
+        titre = bloc.get("section", "inconnue") + (f"-{bloc['sous_section']}" if bloc.get("sous_section") else "")
+        efficacite = bloc.get("efficacite", {})
+        groupes = {}
+        for arv, score in bloc.get("scores", {}).items():
+            groupes.setdefault(efficacite.get(arv, "Non interprétable"), []).append(f"{arv} {_valeur(score)}")
+        ordre = sorted(groupes, key=lambda n: NIVEAUX_ORDRE.index(n) if n in NIVEAUX_ORDRE else len(NIVEAUX_ORDRE))
+        source = f"[{libelle_source(bloc)}] " if libelle_source(bloc) else ""
+        lignes.append(f"Scores {titre}: {source}" + " ; ".join(f"{n} {', '.join(groupes[n])}" for n in ordre))
+    return "\n".join(lignes) if lignes else "Scores: aucun"
+
+def sections_prompt(patient, extraction=None):
+    """[(section, texte)] dans l'ordre du prompt (cf. rapport_tokens)"""
+    extraction = extraction or {}
+    return [
+        ("patient", formater_patient(patient)),
+        ("traitements", formater_traitements(patient.get("historique_therapeutique"))),
+        ("charges_virales", f"CV: {resume_charges_virales(SerieBilan.depuis_mesures(patient.get('charges_virales')))}"),
+        ("cd4", f"CD4: {resume_cd4(SerieBilan.depuis_mesures(patient.get('taux_cd4')))}"),
+        ("mutations", formater_mutations(extraction.get("mutations"))),
+        ("scores", formater_scores(extraction.get("scores")))
+    ]
+
+def construire_user_prompt(patient, extraction=None):
+    """Prompt utilisateur à partir du contexte patient et des données extraites du rapport Stanford
+
+    `patient` : code_patient, sexe, date_naissance, historique_therapeutique, charges_virales,
+    taux_cd4, observance, co_infections (le nom du patient n'entre pas dans le prompt).
+    """
+    return "\n".join(texte for _, texte in sections_prompt(patient, extraction))
+
+# === Rapport de tokens ===
+JETON_APPROX = re.compile(r"\w+|[^\w\s]")
+
+def compteur_tokens(chemin=None):
+    """Compteur du tokenizer du modèle s'il est disponible, sinon approximation mots + ponctuation"""
+    try:
+        from transformers import AutoTokenizer
+        from backends_inference import MERGED_MODEL_PATH
+        tokenizer = AutoTokenizer.from_pretrained(chemin or MERGED_MODEL_PATH, use_fast=True)
+        return lambda texte: len(tokenizer.encode(texte, add_special_tokens=False))
+    except Exception:
+        return lambda texte: len(JETON_APPROX.findall(texte))
+
+def rapport_tokens(patient, extraction=None, compter=None):
+    """Tokens par section et total du prompt"""
+    compter = compter or compteur_tokens()
+    rapport = {nom: compter(texte) for nom, texte in sections_prompt(patient, extraction)}
+    rapport["total"] = compter(construire_user_prompt(patient, extraction))
+    return rapport
+
+if __name__ == "__main__":
+    # Comparaison avec le format précédent (prompt de interface_final avant ce module : listes en json.dumps,
+    # titres ###) sur les dossiers de data.py
+    import sys, json
+    from pathlib import Path
+
+    def prompt_precedent(patient, extraction):
+        mutations = "\n".join(
+            f"Section {b.get('Section', 'Unknown')}:\n" + "".join(f"    {k}: {v}\n" for k, v in b.items() if k != "Section")
+            for b in extraction.get("mutations") or []) or "Aucune mutation détectée"
+        scores = "\n".join(
+            f"{b.get('section', 'Unknown')}" + (f" - {b['sous_section']}" if b.get("sous_section") else "") + ":\n"
+            + "".join(f"    {a}: score={s}, efficacité={b.get('efficacite', {}).get(a, 'Non interprétable')}\n"
+                      for a, s in b.get("scores", {}).items())
+            for b in extraction.get("scores") or []) or "Aucun score ARV détectée"
+        return (f"\n### Contexte du patient:\nCode patient: {patient.get('code_patient', '')}\nNom patient: \n"
+                f"Sexe: {patient.get('sexe', 'Autre')}\nDate de naissance: {patient.get('date_naissance', '')}\n"
+                f"Historique thérapeutique: {json.dumps(patient.get('historique_therapeutique', []), ensure_ascii=False)}\n"
+                f"Charges virales: {json.dumps(patient.get('charges_virales', []), ensure_ascii=False)}\n"
+                f"Taux de CD4: {json.dumps(patient.get('taux_cd4', []), ensure_ascii=False)}\n"
+                f"Observance: {patient.get('observance', 'inconnu')} jours manqués\n"
+                f"Co-infections: {json.dumps(patient.get('co_infections', []), ensure_ascii=False)}\n\n"
+                f"### Mutations du VIH détectées:\n{mutations}\n\n"
+                f"### Scores d'efficacité des ARV face aux mutations:\n{scores}\n### Instruction complémentaire:\n\n")
+
+    dossier = Path(sys.argv[1] if len(sys.argv) > 1 else r".\data_json")
+    compter = compteur_tokens()
+    avant, apres, sections = 0, 0, {}
+    fichiers = sorted(dossier.glob("*.json"))
+    for path in fichiers:
+        with open(path, "r", encoding="utf-8") as f:
+            patient = json.load(f)
+        extraction = patient.get("extraction_texte") or {}
+        avant += compter(prompt_precedent(patient, extraction))
+        for nom, n in rapport_tokens(patient, extraction, compter).items():
+            sections[nom] = sections.get(nom, 0) + n
+    apres = sections.pop("total", 0)
+    n = max(len(fichiers), 1)
+    for nom, total in sections.items():
+        print(f"   {nom:16s} {total / n:7.1f} tokens/patient")
+    print(f"✅ {len(fichiers)} patients : {avant / n:.0f} → {apres / n:.0f} tokens/patient "
+          f"({(1 - apres / avant) * 100 if avant else 0:.0f} % de préremplissage en moins)")
@@ -0,0 +1,214 @@
+import re
+import json
+import sqlite3
+from pathlib import Path
+from datetime import datetime
+
+# === 0) Configuration ===
+REGISTRE_PATH = Path(r".\registre_patients.db")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    code_patient TEXT PRIMARY KEY,
+    sexe TEXT,
+    date_naissance TEXT,
+    sous_type TEXT,
+    donnees TEXT
+);
+CREATE TABLE IF NOT EXISTS mutations (
+    code_patient TEXT NOT NULL,
+    section TEXT NOT NULL,
+    categorie TEXT,
+    mutation TEXT NOT NULL,
+    position INTEGER,
+    aa_ref TEXT,
+    aa_mut TEXT
+);
+CREATE TABLE IF NOT EXISTS scores (
+    code_patient TEXT NOT NULL,
+    section TEXT NOT NULL,
+    sous_section TEXT,
+    arv TEXT NOT NULL,
+    score INTEGER,
+    efficacite TEXT
+);
+CREATE TABLE IF NOT EXISTS charges_virales (
+    code_patient TEXT NOT NULL,
+    date TEXT,
+    valeur INTEGER
+);
+CREATE TABLE IF NOT EXISTS taux_cd4 (
+    code_patient TEXT NOT NULL,
+    date TEXT,
+    valeur INTEGER
+);
+CREATE TABLE IF NOT EXISTS traitements (
+    code_patient TEXT NOT NULL,
+    arv TEXT,
+    debut TEXT,
+    fin TEXT,
+    raison_changement TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_mut_mutation ON mutations(mutation, code_patient);
+CREATE INDEX IF NOT EXISTS idx_mut_position ON mutations(section, position, code_patient);
+CREATE INDEX IF NOT EXISTS idx_mut_patient ON mutations(code_patient);
+CREATE INDEX IF NOT EXISTS idx_scores_arv ON scores(arv, score, code_patient);
+CREATE INDEX IF NOT EXISTS idx_scores_patient ON scores(code_patient);
+CREATE INDEX IF NOT EXISTS idx_cv_date ON charges_virales(date, code_patient);
+CREATE INDEX IF NOT EXISTS idx_cv_patient ON charges_virales(code_patient);
+CREATE INDEX IF NOT EXISTS idx_cd4_date ON taux_cd4(date, code_patient);
+CREATE INDEX IF NOT EXISTS idx_cd4_patient ON taux_cd4(code_patient);
+CREATE INDEX IF NOT EXISTS idx_trt_patient ON traitements(code_patient);
+"""
+
+TABLES_PATIENT = ["mutations", "scores", "charges_virales", "taux_cd4", "traitements"]
+MUTATION_PARTS = re.compile(r"^([A-Z])(\d{1,3})([A-Z]+)$")
+
+# === 1) Ouverture ===
+def ouvrir_registre(path=REGISTRE_PATH):
+    """Ouvre (ou crée) le registre SQLite et applique le schéma"""
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+# === 2) Normalisation ===
+def date_iso(text):
+    """Convertit une date 'dd/mm/YYYY' ou 'YYYY-mm-dd' en ISO (None si invalide)"""
+    if not text:
+        return None
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text.strip(), fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+def entier(val):
+    try:
+        return int(str(val).strip())
+    except (TypeError, ValueError):
+        return None
+
+def decomposer_mutation(mut):
+    """'M184V' -> (184, 'M', 'V') ; (None, None, None) si le format est inattendu"""
+    match = MUTATION_PARTS.match(mut)
+    if not match:
+        return None, None, None
+    return int(match.group(2)), match.group(1), match.group(3)
+
+# === 3) Alimentation (appelée par l'ETL) ===
+def enregistrer_patient(conn, json_data):
+    """Insère ou remplace un patient (format data_json/<code>.json)"""
+    from extract import aplatir_mutations
+
+    code = json_data["code_patient"]
+    extraction = json_data.get("extraction_texte", {}) or {}
+
+    with conn:
+        for table in TABLES_PATIENT:
+            conn.execute(f"DELETE FROM {table} WHERE code_patient = ?", (code,))
+        conn.execute(
+            "INSERT OR REPLACE INTO patients VALUES (?, ?, ?, ?, ?)",
+            (code, json_data.get("sexe"), date_iso(json_data.get("date_naissance")),
+             extraction.get("sous_type_viral", {}).get("Subtype"),
+             json.dumps(json_data, ensure_ascii=False))
+        )
+
+        mutations = []
+        for section, categorie, mut in aplatir_mutations(extraction.get("mutations", [])):
+            position, aa_ref, aa_mut = decomposer_mutation(mut)
+            mutations.append((code, section, categorie, mut, position, aa_ref, aa_mut))
+        conn.executemany("INSERT INTO mutations VALUES (?, ?, ?, ?, ?, ?, ?)", mutations)
+
+        scores = []
+        for bloc in extraction.get("scores", []):
+            efficacite = bloc.get("efficacite", {})
+            for arv, val in bloc.get("scores", {}).items():
+                scores.append((code, bloc.get("section"), bloc.get("sous_section"), arv,
+                               entier(val), efficacite.get(arv)))
+        conn.executemany("INSERT INTO scores VALUES (?, ?, ?, ?, ?, ?)", scores)
+
+        conn.executemany(
+            "INSERT INTO charges_virales VALUES (?, ?, ?)",
+            [(code, date_iso(cv.get("date")), entier(cv.get("valeur"))) for cv in json_data.get("charges_virales", [])]
+        )
+        conn.executemany(
+            "INSERT INTO taux_cd4 VALUES (?, ?, ?)",
+            [(code, date_iso(cd4.get("date")), entier(cd4.get("valeur"))) for cd4 in json_data.get("taux_cd4", [])]
+        )
+        conn.executemany(
+            "INSERT INTO traitements VALUES (?, ?, ?, ?, ?)",
+            [(code, t.get("arv"), date_iso(t.get("debut")), date_iso(t.get("fin")), t.get("raison_changement"))
+             for t in json_data.get("historique_therapeutique", [])]
+        )
+
+def importer_dossier_json(conn, dossier=Path(r".\data_json")):
+    """Remplit le registre à partir des fichiers data_json existants"""
+    n = 0
+    for path in sorted(Path(dossier).glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            enregistrer_patient(conn, json.load(f))
+        n += 1
+    return n
+
+# === 4) Requêtes de cohorte ===
+def patient(conn, code):
+    """Données complètes d'un patient (None si absent)"""
+    row = conn.execute("SELECT donnees FROM patients WHERE code_patient = ?", (code,)).fetchone()
+    return json.loads(row["donnees"]) if row else None
+
+def patients_avec_mutations(conn, mutations, section=None):
+    """Codes des patients porteurs de TOUTES les mutations données (ex: ['M184V', 'K65R'])"""
+    mutations = sorted({m.strip().upper() for m in mutations})
+    if not mutations:
+        return []
+    sql = f"SELECT code_patient FROM mutations WHERE mutation IN ({','.join('?' * len(mutations))})"
+    params = list(mutations)
+    if section:
+        sql += " AND section = ?"
+        params.append(section.upper())
+    sql += " GROUP BY code_patient HAVING COUNT(DISTINCT mutation) = ? ORDER BY code_patient"
+    params.append(len(mutations))
+    return [r["code_patient"] for r in conn.execute(sql, params)]
+
+def patients_avec_position(conn, section, position):
+    """Codes des patients ayant une mutation quelconque à une position donnée (ex: RT 184)"""
+    rows = conn.execute(
+        "SELECT DISTINCT code_patient FROM mutations WHERE section = ? AND position = ? ORDER BY code_patient",
+        (section.upper(), int(position))
+    )
+    return [r["code_patient"] for r in rows]
+
+def patients_score_superieur(conn, arv, seuil, section=None):
+    """(code, score) des patients dont le score pour un ARV dépasse un seuil (ex: EFV > 60)"""
+    sql = "SELECT code_patient, MAX(score) AS score FROM scores WHERE arv = ? AND score > ?"
+    params = [arv, seuil]
+    if section:
+        sql += " AND section = ?"
+        params.append(section.upper())
+    sql += " GROUP BY code_patient ORDER BY code_patient"
+    return [(r["code_patient"], r["score"]) for r in conn.execute(sql, params)]
+
+def patients_charge_virale(conn, seuil, debut=None, fin=None):
+    """(code, date, valeur) des charges virales >= seuil, éventuellement sur une période"""
+    sql = "SELECT code_patient, date, valeur FROM charges_virales WHERE valeur >= ?"
+    params = [seuil]
+    if debut:
+        sql += " AND date >= ?"
+        params.append(date_iso(debut))
+    if fin:
+        sql += " AND date <= ?"
+        params.append(date_iso(fin))
+    sql += " ORDER BY code_patient, date"
+    return [(r["code_patient"], r["date"], r["valeur"]) for r in conn.execute(sql, params)]
+
+if __name__ == "__main__":
+    import sys
+    dossier = sys.argv[1] if len(sys.argv) > 1 else r".\data_json"
+    conn = ouvrir_registre()
+    n = importer_dossier_json(conn, dossier)
+    print(f"✅ {n} patients importés dans {REGISTRE_PATH}")
+    conn.close()
@@ -0,0 +1,312 @@
+import io
+import os
+import re
+import json
+import time
+import zipfile
+import argparse
+from pathlib import Path
+from datetime import date
+from xml.sax.saxutils import escape
+from concurrent.futures import ProcessPoolExecutor
+
+from prompt_patient import CATEGORIES, CLASSES_RT, NIVEAUX_ORDRE, formater_co_infection, libelle_source
+from series_bilans import ordinal, jj_mm_aaaa
+
+# === 0) Configuration ===
+MODELE_PATH = Path(os.environ.get("MODELE_RAPPORT", r".\modeles\rapport_modele.docx"))
+DOSSIER_RAPPORTS = Path(r".\rapports_generes")
+PARALLELISME = int(os.environ.get("RENDU_PARALLELISME", str(os.cpu_count() or 1)))
+LOT_MIN_PROCESSUS = 500     # un rendu coûte ~1 ms : en dessous, démarrer des processus coûte plus qu'il ne rapporte
+DOCUMENT = "word/document.xml"
+
+# Champs {{nom}} remplacés dans le texte ; blocs {{nom}} seuls dans leur paragraphe, remplacés par des tableaux / paragraphes
+BLOCS = ("traitements", "charges_virales", "cd4", "mutations", "scores", "interpretation")
+PARAGRAPHE = re.compile(r"<w:p(?:\s[^>]*[^/])?>.*?</w:p>", re.DOTALL)
+RUN = re.compile(r"<w:r(?:\s[^>]*)?>.*?</w:r>", re.DOTALL)
+TEXTE = re.compile(r"<w:t(?:\s[^>]*)?>(.*?)</w:t>|<w:t/>", re.DOTALL)
+CHAMP = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# === 1) Modèle compilé : lu une fois, rendu N fois par simple concaténation ===
+def _remplacer_texte(run, texte):
+    premier = [True]
+    def remplacer(m):
+        if premier[0]:
+            premier[0] = False
+            return f'<w:t xml:space="preserve">{texte}</w:t>'
+        return "<w:t/>"
+    return TEXTE.sub(remplacer, run)
+
+def _fusionner_runs(paragraphe):
+    """Word découpe souvent {{champ}} sur plusieurs runs : le texte de chaque champ est regroupé dans le run
+    où il commence ; les autres runs et leur mise en forme (libellé en gras, police...) restent intacts"""
+    runs = list(RUN.finditer(paragraphe))
+    textes = ["".join(m.group(1) or "" for m in TEXTE.finditer(r.group(0))) for r in runs]
+    texte = "".join(textes)
+    if "{{" not in texte:
+        return paragraphe
+    proprietaires = [i for i, t in enumerate(textes) for _ in t]   # run de chaque caractère
+    for champ in CHAMP.finditer(texte):
+        for k in range(champ.start(), champ.end()):
+            proprietaires[k] = proprietaires[champ.start()]
+    nouveaux = [""] * len(runs)
+    for k, c in enumerate(texte):
+        nouveaux[proprietaires[k]] += c
+    morceaux, position = [], 0
+    for run, avant, apres in zip(runs, textes, nouveaux):
+        morceaux += [paragraphe[position:run.start()], run.group(0) if apres == avant else _remplacer_texte(run.group(0), apres)]
+        position = run.end()
+    return "".join(morceaux) + paragraphe[position:]
+
+class ModeleRapport:
+    """Modèle .docx compilé : parties fixes du paquet zippées une fois, document.xml découpé en
+    segments (texte littéral, ("champ", nom) ou ("bloc", nom))"""
+
+    def __init__(self, path=MODELE_PATH):
+        self.path = Path(path)
+        tampon = io.BytesIO()
+        with zipfile.ZipFile(self.path) as zin, zipfile.ZipFile(tampon, "w", zipfile.ZIP_DEFLATED) as zout:
+            for info in zin.infolist():
+                if info.filename == DOCUMENT:
+                    xml = zin.read(info).decode("utf-8")
+                else:
+                    zout.writestr(info, zin.read(info))
+        # Paquet sans document.xml : chaque rendu l'y ajoute sans recompresser styles, thème, images...
+        self.base = tampon.getvalue()
+        self.segments = self._compiler(PARAGRAPHE.sub(lambda m: _fusionner_runs(m.group(0)), xml))
+        self.champs = sorted({s[1] for s in self.segments if isinstance(s, tuple)})
+
+    @staticmethod
+    def _compiler(xml):
+        segments, position = [], 0
+        for p in PARAGRAPHE.finditer(xml):
+            texte = "".join(m.group(1) or "" for m in TEXTE.finditer(p.group(0))).strip()
+            bloc = CHAMP.fullmatch(texte)
+            if bloc and bloc.group(1) in BLOCS:
+                segments += [xml[position:p.start()], ("bloc", bloc.group(1))]
+                position = p.end()
+        segments.append(xml[position:])
+        # Champs en ligne dans les segments littéraux restants
+        resultat = []
+        for s in segments:
+            if isinstance(s, tuple):
+                resultat.append(s)
+                continue
+            morceaux = CHAMP.split(s)
+            for i, m in enumerate(morceaux):
+                resultat.append(("champ", m) if i % 2 else m)
+        return [s for s in resultat if s != ""]
+
+    def document(self, champs, blocs):
+        return "".join(s if isinstance(s, str) else
+                       (blocs.get(s[1], "") if s[0] == "bloc" else escape(str(champs.get(s[1], ""))))
+                       for s in self.segments)
+
+    def rendre(self, champs, blocs):
+        """Octets du .docx rempli"""
+        tampon = io.BytesIO(self.base)
+        with zipfile.ZipFile(tampon, "a", zipfile.ZIP_DEFLATED) as z:
+            z.writestr(DOCUMENT, self.document(champs, blocs))
+        return tampon.getvalue()
+
+_modeles = {}
+
+def charger_modele(path=MODELE_PATH):
+    """Modèle compilé mis en cache (recompilé si le fichier change) ; modèle par défaut créé s'il manque"""
+    path = Path(path)
+    if not path.exists():
+        creer_modele_defaut(path)
+    cle = (str(path.resolve()), path.stat().st_mtime_ns)
+    if cle not in _modeles:
+        _modeles[cle] = ModeleRapport(path)
+    return _modeles[cle]
+
+def creer_modele_defaut(path=MODELE_PATH):
+    """Modèle de départ (python-docx), à retoucher dans Word en conservant les {{champs}}"""
+    from docx import Document
+
+    doc = Document()
+    doc.add_heading("Rapport d'interprétation du test de résistance VIH", level=1)
+    for ligne in ("Code patient : {{code_patient}}    Nom : {{nom_patient}}",
+                  "Sexe : {{sexe}}    Date de naissance : {{date_naissance}}",
+                  "Observance : {{observance}}    Co-infections : {{co_infections}}",
+                  "Date du rapport : {{date_rapport}}"):
+        doc.add_paragraph(ligne)
+    for titre, bloc in (("Historique thérapeutique", "traitements"), ("Charges virales", "charges_virales"),
+                        ("Taux de CD4", "cd4"), ("Mutations détectées", "mutations"),
+                        ("Scores d'efficacité des ARV", "scores"), ("Interprétation", "interpretation")):
+        doc.add_heading(titre, level=2)
+        doc.add_paragraph("{{%s}}" % bloc)
+    doc.add_paragraph("Rapport généré automatiquement, à valider par le biologiste.")
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    doc.save(str(path))
+    return path
+
+# === 2) WordprocessingML des blocs ===
+BORDURES = "".join(f'<w:{b} w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+                   for b in ("top", "left", "bottom", "right", "insideH", "insideV"))
+
+def _run(texte, gras=False):
+    rpr = "<w:rPr><w:b/></w:rPr>" if gras else ""
+    return f'<w:r>{rpr}<w:t xml:space="preserve">{escape(str(texte))}</w:t></w:r>'
+
+def paragraphe_xml(texte, gras=False):
+    return f"<w:p>{_run(texte, gras) if texte else ''}</w:p>"
+
+def tableau_xml(entetes, lignes, vide="Aucune donnée"):
+    if not lignes:
+        return paragraphe_xml(vide)
+    def ligne(cellules, gras=False):
+        return "<w:tr>" + "".join(f'<w:tc><w:tcPr><w:tcW w:w="0" w:type="auto"/></w:tcPr>{paragraphe_xml(c, gras)}</w:tc>'
+                                  for c in cellules) + "</w:tr>"
+    grille = "".join('<w:gridCol/>' for _ in entetes)
+    # Paragraphe vide après le tableau : obligatoire si le bloc est placé dans une cellule du modèle
+    return (f'<w:tbl><w:tblPr><w:tblW w:w="5000" w:type="pct"/><w:tblBorders>{BORDURES}</w:tblBorders></w:tblPr>'
+            f'<w:tblGrid>{grille}</w:tblGrid>{ligne(entetes, True)}{"".join(ligne(l) for l in lignes)}</w:tbl><w:p/>')
+
+def interpretation_xml(texte):
+    """Un paragraphe par ligne ; une ligne **en gras** markdown devient un titre en gras"""
+    paragraphes = []
+    for ligne in (texte or "").strip().splitlines():
+        ligne = ligne.strip()
+        gras = len(ligne) > 4 and ligne.startswith("**") and ligne.endswith("**")
+        paragraphes.append(paragraphe_xml(ligne.strip("*").strip() if gras else ligne, gras))
+    return "".join(paragraphes) or paragraphe_xml("Aucune interprétation")
+
+def date_affichee(texte):
+    o = ordinal(texte)
+    return jj_mm_aaaa(o) if o is not None else (texte or "")
+
+def lignes_mesures(mesures):
+    """Mesures triées par date (les dates illisibles en dernier)"""
+    mesures = [m for m in mesures or [] if str(m.get("valeur") or "").strip()]
+    mesures.sort(key=lambda m: ordinal(m.get("date")) or float("inf"))
+    return [(date_affichee(m.get("date")), m.get("valeur")) for m in mesures]
+
+def lignes_mutations(blocs):
+    lignes = []
+    for bloc in blocs or []:
+        for cle, valeur in bloc.items():
+            if cle == "Section" or not valeur:
+                continue
+            if isinstance(valeur, list) and isinstance(valeur[0], dict):
+                for item in valeur:
+                    lignes += [(bloc.get("Section", ""), CLASSES_RT.get(c.upper(), c), ", ".join(m))
+                               for c, m in item.items() if m]
+            else:
+                texte = ", ".join(map(str, valeur)) if isinstance(valeur, (list, tuple)) else str(valeur)
+                lignes.append((bloc.get("Section", ""), CATEGORIES.get(cle, cle), texte))
+    return lignes
+
+def lignes_scores(blocs):
+    lignes = []
+    for bloc in blocs or []:
+        titre = bloc.get("section", "") + (f" - {bloc['sous_section']}" if bloc.get("sous_section") else "")
+        if libelle_source(bloc):
+            titre += f" ({libelle_source(bloc)})"
+        efficacite = bloc.get("efficacite", {})
+        for arv, score in bloc.get("scores", {}).items():
+            lignes.append((titre, arv, score, efficacite.get(arv, "Non interprétable")))
+    rang = lambda n: NIVEAUX_ORDRE.index(n) if n in NIVEAUX_ORDRE else len(NIVEAUX_ORDRE)
+    return sorted(lignes, key=lambda l: (l[0], rang(l[3])))
+
+# === 3) Rapport -> champs et blocs ===
+def contenu_rapport(rapport):
+    """`rapport` : sortie de generation_lot (<code>.json), dossier data.py ou dict de l'interface
+    {code_patient, patient, extraction, interpretation}"""
+    patient = rapport.get("patient") or rapport
+    extraction = rapport.get("extraction") or rapport.get("extraction_texte") or {}
+    observance = str(patient.get("observance") or "inconnu")
+    champs = {
+        "code_patient": rapport.get("code_patient") or patient.get("code_patient", ""),
+        "nom_patient": patient.get("nom_patient", ""),
+        "sexe": patient.get("sexe", ""),
+        "date_naissance": date_affichee(patient.get("date_naissance")),
+        "observance": f"{observance} jours manqués" if observance.isdigit() else observance,
+        "co_infections": ", ".join(map(formater_co_infection, patient.get("co_infections") or [])) or "aucune",
+        "date_rapport": rapport.get("date_rapport") or date.today().strftime("%d/%m/%Y"),
+        "adaptateur": rapport.get("adaptateur") or ""
+    }
+    interpretation = rapport.get("interpretation")
+    if interpretation is None:
+        interpretation = (rapport.get("results") or {}).get("interpretation", "")
+    historique = [(t.get("arv", ""), date_affichee(t.get("debut")), date_affichee(t.get("fin")), t.get("raison_changement", ""))
+                  for t in patient.get("historique_therapeutique") or []]
+    blocs = {
+        "traitements": tableau_xml(["ARV", "Début", "Fin", "Raison du changement"], historique, "Aucun traitement renseigné"),
+        "charges_virales": tableau_xml(["Date", "Charge virale (copies/mL)"], lignes_mesures(patient.get("charges_virales"))),
+        "cd4": tableau_xml(["Date", "CD4 (cellules/mm³)"], lignes_mesures(patient.get("taux_cd4"))),
+        "mutations": tableau_xml(["Gène", "Catégorie", "Mutations"], lignes_mutations(extraction.get("mutations")),
+                                 "Aucune mutation détectée"),
+        "scores": tableau_xml(["Tableau", "Molécule", "Score", "Niveau"], lignes_scores(extraction.get("scores")),
+                              "Aucun score disponible"),
+        "interpretation": interpretation_xml(interpretation)
+    }
+    return champs, blocs
+
+def rendre_docx(rapport, modele=None):
+    """Octets du rapport .docx (téléchargement de l'interface, réponse HTTP...)"""
+    modele = modele or charger_modele()
+    return modele.rendre(*contenu_rapport(rapport))
+
+def ecrire_docx(rapport, path, modele=None):
+    path = Path(path)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(rendre_docx(rapport, modele))
+    os.replace(tmp, path)
+    return path
+
+# === 4) Rendu en masse : le modèle compilé est transmis une fois à chaque processus ===
+_modele_processus = None
+
+def _initialiser(modele):
+    global _modele_processus
+    _modele_processus = modele
+
+def _rendre_fichier(tache):
+    source, destination = tache
+    try:
+        if not isinstance(source, dict):
+            with open(source, "r", encoding="utf-8") as f:
+                source = json.load(f)
+        ecrire_docx(source, destination, _modele_processus)
+        return str(destination), None
+    except Exception as e:
+        return str(destination), str(e)
+
+def rendre_lot(rapports, sortie, modele=MODELE_PATH, parallelisme=PARALLELISME):
+    """Rend [(nom, rapport dict ou chemin .json)] dans `sortie`/<nom>.docx ; retourne {fichier: erreur ou None}"""
+    sortie = Path(sortie)
+    sortie.mkdir(parents=True, exist_ok=True)
+    modele = modele if isinstance(modele, ModeleRapport) else charger_modele(modele)
+    taches = [(r, sortie / f"{nom}.docx") for nom, r in rapports]
+    if parallelisme <= 1 or len(taches) < LOT_MIN_PROCESSUS:
+        _initialiser(modele)
+        return dict(map(_rendre_fichier, taches))
+    with ProcessPoolExecutor(max_workers=parallelisme, initializer=_initialiser, initargs=(modele,)) as pool:
+        return dict(pool.map(_rendre_fichier, taches, chunksize=max(1, len(taches) // (parallelisme * 4))))
+
+def rendre_dossier(dossier=DOSSIER_RAPPORTS, sortie=None, modele=MODELE_PATH, parallelisme=PARALLELISME, codes=None):
+    """Tous les <code>.json d'un dossier de generation_lot (ou data_json) -> `sortie` (défaut `dossier`/docx)"""
+    dossier = Path(dossier)
+    rapports = [(p.stem, p) for p in sorted(dossier.glob("*.json")) if codes is None or p.stem in codes]
+    return rendre_lot(rapports, sortie or dossier / "docx", modele, parallelisme)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rendu des interprétations dans le modèle de rapport Word")
+    parser.add_argument("dossier", nargs="?", default=str(DOSSIER_RAPPORTS), help="dossier des <code>.json")
+    parser.add_argument("-o", "--sortie", default=None, help="dossier des .docx (défaut <dossier>/docx)")
+    parser.add_argument("--modele", default=str(MODELE_PATH), help="modèle .docx ({{champs}} et blocs)")
+    parser.add_argument("--parallelisme", type=int, default=PARALLELISME)
+    args = parser.parse_args()
+
+    debut = time.perf_counter()
+    resultats = rendre_dossier(args.dossier, args.sortie, args.modele, args.parallelisme)
+    erreurs = {f: e for f, e in resultats.items() if e}
+    for f, e in erreurs.items():
+        print(f"❌ {f} : {e}")
+    duree = time.perf_counter() - debut
+    print(f"✅ {len(resultats) - len(erreurs)} rapport(s) .docx en {duree:.1f}s "
+          f"({len(resultats) / duree if duree else 0:.0f} rapports/s)")
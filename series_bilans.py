@@ -0,0 +1,195 @@
+import re
+import numpy as np
+from datetime import date
+
+from dates_bilans import parser_date, valeur_numerique
+
+# === 0) Configuration ===
+SEUIL_SUPPRESSION = 1000   # copies/ml : seuil d'échec virologique OMS
+JOURS_AN = 365.25
+DATE_ISO = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+
+def ordinal(texte):
+    """'2021-03-05' ou '05/03/2021' -> ordinal de la date (None si invalide)"""
+    texte = str(texte or "").strip()
+    match = DATE_ISO.match(texte)
+    if match:
+        try:
+            return date(int(match.group(1)), int(match.group(2)), int(match.group(3))).toordinal()
+        except ValueError:
+            return None
+    d = parser_date(texte)
+    return d.toordinal() if d else None
+
+def valeur(texte):
+    """'12 500 copies/ml' -> 12500.0 ; 'indétectable' -> 0.0 ; '<40' -> 40.0 (None si vide)"""
+    texte = str(texte or "").strip()
+    if "indétect" in texte.lower() or "indetect" in texte.lower():
+        return 0.0
+    chiffres = valeur_numerique(texte)
+    return float(chiffres) if chiffres else None
+
+def jj_mm_aaaa(o):
+    return date.fromordinal(int(o)).strftime("%d/%m/%Y")
+
+# === 1) Série d'un patient ===
+class SerieBilan:
+    """Mesures datées d'un bilan (CV ou CD4) : dates en ordinaux int32, valeurs en float64, triées"""
+
+    def __init__(self, dates, valeurs):
+        dates = np.asarray(dates, dtype=np.int32)
+        valeurs = np.asarray(valeurs, dtype=np.float64)
+        ordre = np.argsort(dates, kind="stable")
+        self.dates = dates[ordre]
+        self.valeurs = valeurs[ordre]
+
+    @classmethod
+    def depuis_mesures(cls, mesures):
+        """À partir de la liste [{"valeur", "date"}] produite par l'extraction ou l'interface"""
+        dates, valeurs = [], []
+        for m in mesures or []:
+            o, v = ordinal(m.get("date")), valeur(m.get("valeur"))
+            if o is not None and v is not None:
+                dates.append(o)
+                valeurs.append(v)
+        return cls(dates, valeurs)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def vers_mesures(self):
+        """Retour au format liste de dicts (dates ISO, valeurs entières en texte)"""
+        return [{"valeur": str(int(v)), "date": date.fromordinal(int(o)).isoformat()}
+                for o, v in zip(self.dates, self.valeurs)]
+
+# === 2) Cohorte : toutes les séries concaténées (une ligne de calcul vectorisé pour N patients) ===
+class CohorteSeries:
+    """Séries de plusieurs patients dans deux tableaux plats ; `debuts[i]:fins[i]` = patient i"""
+
+    def __init__(self, series):
+        series = list(series)
+        self.longueurs = np.array([len(s) for s in series], dtype=np.int64)
+        self.fins = np.cumsum(self.longueurs)
+        self.debuts = self.fins - self.longueurs
+        self.dates = np.concatenate([s.dates for s in series]) if series else np.zeros(0, np.int32)
+        self.valeurs = np.concatenate([s.valeurs for s in series]) if series else np.zeros(0)
+
+    def __len__(self):
+        return len(self.longueurs)
+
+    def _par_patient(self, ufunc, x, vide=np.nan):
+        """Réduction `ufunc` de x par patient (NaN pour les séries vides)"""
+        res = np.full(len(self), vide, dtype=np.float64)
+        ok = self.longueurs > 0
+        if ok.any():
+            res[ok] = ufunc.reduceat(x, self.debuts[ok])
+        return res
+
+    def derniere(self):
+        """(date ordinale, valeur) de la dernière mesure de chaque patient (NaN si aucune)"""
+        ok = self.longueurs > 0
+        d, v = np.full(len(self), np.nan), np.full(len(self), np.nan)
+        d[ok], v[ok] = self.dates[self.fins[ok] - 1], self.valeurs[self.fins[ok] - 1]
+        return d, v
+
+    def precedente(self):
+        ok = self.longueurs > 1
+        d, v = np.full(len(self), np.nan), np.full(len(self), np.nan)
+        d[ok], v[ok] = self.dates[self.fins[ok] - 2], self.valeurs[self.fins[ok] - 2]
+        return d, v
+
+    def variation_log10(self):
+        """log10(dernière CV) - log10(CV précédente) (valeurs < 1 ramenées à 1)"""
+        _, dernier = self.derniere()
+        _, avant = self.precedente()
+        return np.log10(np.maximum(dernier, 1)) - np.log10(np.maximum(avant, 1))
+
+    def jours_depuis_suppression(self, seuil=SEUIL_SUPPRESSION):
+        """Jours entre la dernière mesure < seuil et la dernière mesure (0 si supprimée, NaN si jamais)"""
+        indices = np.where(self.valeurs < seuil, np.arange(len(self.valeurs)), -1)
+        dernier_ok = self._par_patient(np.maximum, indices, vide=-1)
+        derniere_date, _ = self.derniere()
+        res = np.full(len(self), np.nan)
+        ok = dernier_ok >= self.debuts
+        res[ok] = derniere_date[ok] - self.dates[dernier_ok[ok].astype(np.int64)]
+        return res
+
+    def pente_par_an(self):
+        """Pente des moindres carrés (unités par an), NaN si moins de deux dates distinctes"""
+        origine = np.repeat(self.dates[self.debuts[self.longueurs > 0]], self.longueurs[self.longueurs > 0])
+        x = (self.dates - origine) / JOURS_AN
+        y = self.valeurs
+        n = self.longueurs.astype(np.float64)
+        sx, sy = self._par_patient(np.add, x, 0), self._par_patient(np.add, y, 0)
+        sxy, sxx = self._par_patient(np.add, x * y, 0), self._par_patient(np.add, x * x, 0)
+        denominateur = n * sxx - sx ** 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            pente = (n * sxy - sx * sy) / denominateur
+        pente[~(denominateur > 1e-12)] = np.nan
+        return pente
+
+# === 3) Résumé pour le prompt ===
+def _nombre(v):
+    return f"{int(round(v)):,}".replace(",", " ")
+
+def resume_charges_virales(serie, seuil=SEUIL_SUPPRESSION):
+    """Une ligne : nombre de mesures, dernière valeur (log10), variation et délai depuis la suppression"""
+    if not len(serie):
+        return "aucune mesure"
+    cohorte = CohorteSeries([serie])
+    (d,), (v,) = cohorte.derniere()
+    parties = [f"{len(serie)} mesure(s) du {jj_mm_aaaa(serie.dates[0])} au {jj_mm_aaaa(d)}",
+               f"dernière {_nombre(v)} copies/ml le {jj_mm_aaaa(d)} ({np.log10(max(v, 1)):.1f} log10)"]
+    if len(serie) > 1:
+        (d_avant,), _ = cohorte.precedente()
+        parties.append(f"variation {cohorte.variation_log10()[0]:+.1f} log10 depuis le {jj_mm_aaaa(d_avant)}")
+    jours = cohorte.jours_depuis_suppression(seuil)[0]
+    if np.isnan(jours):
+        parties.append(f"jamais < {seuil} copies/ml")
+    elif jours == 0:
+        parties.append(f"< {seuil} copies/ml à la dernière mesure")
+    else:
+        parties.append(f"dernière mesure < {seuil} copies/ml {int(jours)} jours avant")
+    return " ; ".join(parties)
+
+def resume_cd4(serie):
+    if not len(serie):
+        return "aucune mesure"
+    cohorte = CohorteSeries([serie])
+    (d,), (v,) = cohorte.derniere()
+    parties = [f"{len(serie)} mesure(s)", f"dernier {_nombre(v)} cellules/µl le {jj_mm_aaaa(d)}",
+               f"minimum {_nombre(serie.valeurs.min())}"]
+    pente = cohorte.pente_par_an()[0]
+    if not np.isnan(pente):
+        parties.append(f"pente {pente:+.0f} cellules/µl par an")
+    return " ; ".join(parties)
+
+def tendances_cohorte(patients):
+    """Indicateurs vectorisés pour une liste de dossiers patients (format data_json)"""
+    cv = CohorteSeries(SerieBilan.depuis_mesures(p.get("charges_virales")) for p in patients)
+    cd4 = CohorteSeries(SerieBilan.depuis_mesures(p.get("taux_cd4")) for p in patients)
+    _, derniere_cv = cv.derniere()
+    _, dernier_cd4 = cd4.derniere()
+    return {
+        "code_patient": [p.get("code_patient", "") for p in patients],
+        "derniere_cv": derniere_cv,
+        "variation_log10_cv": cv.variation_log10(),
+        "jours_depuis_suppression": cv.jours_depuis_suppression(),
+        "dernier_cd4": dernier_cd4,
+        "pente_cd4_an": cd4.pente_par_an()
+    }
+
+if __name__ == "__main__":
+    import sys, json, time
+    from pathlib import Path
+    dossier = Path(sys.argv[1] if len(sys.argv) > 1 else r".\data_json")
+    patients = []
+    for path in sorted(dossier.glob("*.json")):
+        with open(path, "r", encoding="utf-8") as f:
+            patients.append(json.load(f))
+    debut = time.perf_counter()
+    t = tendances_cohorte(patients)
+    duree = time.perf_counter() - debut
+    echec = np.nan_to_num(t["derniere_cv"]) >= SEUIL_SUPPRESSION
+    print(f"✅ {len(patients)} patients en {duree:.3f}s | CV ≥ {SEUIL_SUPPRESSION} : {int(echec.sum())} | "
+          f"pente CD4 médiane : {np.nanmedian(t['pente_cd4_an']) if len(patients) else float('nan'):+.0f}/an")
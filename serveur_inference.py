@@ -0,0 +1,171 @@
+import os
+import time
+import queue
+import threading
+from multiprocessing.connection import Listener, Client
+
+from prechauffage import noter_requete, rapport_prechauffage
+
+# === 0) Configuration ===
+HOTE = os.environ.get("INFERENCE_HOTE", "127.0.0.1")
+PORT = int(os.environ.get("INFERENCE_PORT", "6010"))
+AUTHKEY = os.environ.get("INFERENCE_AUTHKEY", "circb-inference").encode()
+
+TAILLE_LOT_MAX = int(os.environ.get("INFERENCE_LOT_MAX", "4"))
+ATTENTE_LOT_MS = int(os.environ.get("INFERENCE_ATTENTE_LOT_MS", "50"))
+FILE_MAX = int(os.environ.get("INFERENCE_FILE_MAX", "16"))        # au-delà : refus (backpressure)
+DELAI_REPONSE = float(os.environ.get("INFERENCE_DELAI", "900"))   # secondes
+
+class ServeurSature(Exception):
+    """Le worker refuse la requête : file pleine"""
+
+class Requete:
+    def __init__(self, user_msg, mutations, adaptateur=None):
+        self.user_msg = user_msg
+        self.mutations = mutations
+        self.adaptateur = adaptateur
+        self.reponse = None
+        self.erreur = None
+        self.fait = threading.Event()
+
+# === 1) Worker : unique propriétaire du modèle ===
+class WorkerInference:
+    """Sert les requêtes de génération de tous les processus UI avec batching dynamique"""
+
+    def __init__(self, generer_lot, taille_lot=TAILLE_LOT_MAX, attente_ms=ATTENTE_LOT_MS, file_max=FILE_MAX):
+        self.generer_lot = generer_lot
+        self.taille_lot = taille_lot
+        self.attente = attente_ms / 1000
+        self.file = queue.Queue(maxsize=file_max)
+        self.stats = {"requetes": 0, "lots": 0, "refus": 0}
+        self._verrou_stats = threading.Lock()   # threads clients et boucle des lots
+
+    def compter(self, **increments):
+        with self._verrou_stats:
+            for cle, n in increments.items():
+                self.stats[cle] += n
+
+    def lire_stats(self):
+        with self._verrou_stats:
+            return dict(self.stats)
+
+    def soumettre(self, user_msg, mutations=None, adaptateur=None):
+        """Place une requête en file ; lève ServeurSature si la file est pleine"""
+        req = Requete(user_msg, mutations, adaptateur)
+        try:
+            self.file.put_nowait(req)
+        except queue.Full:
+            self.compter(refus=1)
+            raise ServeurSature(f"File pleine ({self.file.maxsize} requêtes en attente)")
+        return req
+
+    def boucle_lots(self):
+        """Regroupe les requêtes arrivées pendant `attente` (max taille_lot) et les génère ensemble"""
+        while True:
+            lot = [self.file.get()]
+            limite = time.monotonic() + self.attente
+            while len(lot) < self.taille_lot:
+                reste = limite - time.monotonic()
+                if reste <= 0:
+                    break
+                try:
+                    lot.append(self.file.get(timeout=reste))
+                except queue.Empty:
+                    break
+            # Un passage du pipeline par adaptateur LoRA présent dans le lot
+            groupes = {}
+            for req in lot:
+                groupes.setdefault(req.adaptateur, []).append(req)
+            for adaptateur, groupe in groupes.items():
+                try:
+                    kwargs = {"adaptateur": adaptateur} if adaptateur else {}
+                    debut = time.perf_counter()
+                    reponses = self.generer_lot([r.user_msg for r in groupe], [r.mutations for r in groupe], **kwargs)
+                    noter_requete(time.perf_counter() - debut)
+                    for req, rep in zip(groupe, reponses):
+                        req.reponse = rep
+                except Exception as e:
+                    for req in groupe:
+                        req.erreur = str(e)
+                self.compter(lots=1)
+            self.compter(requetes=len(lot))
+            for req in lot:
+                req.fait.set()
+
+    def servir_client(self, conn):
+        """Une connexion = un processus UI ; requêtes traitées en série sur la connexion"""
+        try:
+            while True:
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    break
+                if message.get("type") == "stats":
+                    conn.send({"ok": True, "stats": dict(self.lire_stats(), en_file=self.file.qsize(),
+                                                         prechauffage=rapport_prechauffage())})
+                    continue
+                try:
+                    req = self.soumettre(message["user_msg"], message.get("mutations"), message.get("adaptateur"))
+                except ServeurSature as e:
+                    conn.send({"ok": False, "sature": True, "erreur": str(e)})
+                    continue
+                if not req.fait.wait(DELAI_REPONSE):
+                    conn.send({"ok": False, "erreur": "Délai de génération dépassé"})
+                elif req.erreur:
+                    conn.send({"ok": False, "erreur": req.erreur})
+                else:
+                    conn.send({"ok": True, "reponse": req.reponse})
+        finally:
+            conn.close()
+
+    def servir(self, hote=HOTE, port=PORT, authkey=AUTHKEY):
+        threading.Thread(target=self.boucle_lots, daemon=True, name="lots").start()
+        with Listener((hote, port), backlog=64, authkey=authkey) as listener:
+            print(f"✅ Worker d'inférence prêt sur {hote}:{port} (lot max {self.taille_lot}, file max {self.file.maxsize})")
+            while True:
+                conn = listener.accept()
+                threading.Thread(target=self.servir_client, args=(conn,), daemon=True).start()
+
+# === 2) Client (processus UI) ===
+_client_local = threading.local()
+
+def _connexion():
+    conn = getattr(_client_local, "conn", None)
+    if conn is None:
+        conn = Client((HOTE, PORT), authkey=AUTHKEY)
+        _client_local.conn = conn
+    return conn
+
+def generate_model_response(user_msg: str, mutations=None, adaptateur=None, tentatives=3):
+    """Même interface que generate_interpretation.generate_model_response, servie par le worker"""
+    for tentative in range(tentatives):
+        try:
+            conn = _connexion()
+            conn.send({"type": "generer", "user_msg": user_msg, "mutations": mutations, "adaptateur": adaptateur})
+            reponse = conn.recv()
+        except (EOFError, OSError):
+            _client_local.conn = None
+            if tentative == tentatives - 1:
+                raise
+            continue
+        if reponse["ok"]:
+            return reponse["reponse"]
+        if not reponse.get("sature") or tentative == tentatives - 1:
+            if reponse.get("sature"):
+                raise ServeurSature(reponse["erreur"])
+            raise RuntimeError(reponse["erreur"])
+        time.sleep(2 ** tentative)   # file pleine : nouvel essai avec attente croissante
+
+def stats_worker():
+    conn = _connexion()
+    conn.send({"type": "stats"})
+    return conn.recv()["stats"]
+
+if __name__ == "__main__":
+    # Le modèle n'est chargé qu'ici, une seule fois pour toutes les sessions UI ;
+    # le worker n'accepte de connexions qu'une fois préchauffé (PRECHAUFFAGE=0 pour s'en passer)
+    from generate_interpretation import generate_model_responses
+    from prechauffage import prechauffer, PRECHAUFFAGE_ACTIF
+    if PRECHAUFFAGE_ACTIF:
+        prechauffer()
+    WorkerInference(generate_model_responses).servir()
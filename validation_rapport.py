@@ -0,0 +1,66 @@
+import re
+
+# === 0) Critères attendus d'une interprétation (cf. prompts système et calque) ===
+DEBUT_ATTENDU = re.compile(r"^[\s\"'«“]*Cadre virologique", re.IGNORECASE)
+MOTS_MIN = 60
+MOTS_MAX = 180          # 150 mots demandés + tolérance
+TAILLE_ECHO = 10        # n-grammes de mots du prompt recopiés à l'identique = écho
+MARQUEURS_ECHO = ("Système :", "Utilisateur :", "Réponse :", "Patient: code=", "Traitements: ", "Mutations PR:",
+                  "Mutations RT:", "Mutations IN:", "Scores PR:", "Scores RT-", "Scores IN:",
+                  "Voici la réponse à améliorer")
+LISTE_OU_TITRE = re.compile(r"^\s*(?:[-*•#]|\d+[.)])\s", re.MULTILINE)
+MOLECULE = r"[A-Z0-9][A-Za-z0-9]*(?:/r)?\*?"
+SCHEMA = re.compile(rf"(?<![\w+]){MOLECULE}(?:\s*\+\s*{MOLECULE}){{2,}}(?![\w+])")
+MUTATION = re.compile(r"^[A-Z]\d{1,3}[A-Z]+$")
+MOT = re.compile(r"\w+(?:['’]\w+)?")
+
+def schemas_therapeutiques(texte):
+    """Associations de la forme molecule1+molecule2+molecule3 présentes dans le texte"""
+    schemas = [re.sub(r"\s+", "", m.group(0)) for m in SCHEMA.finditer(texte or "")]
+    # 'M41L+T215Y+...' est une combinaison de mutations, pas un schéma thérapeutique
+    return [s for s in schemas if not any(MUTATION.match(x.rstrip("*")) for x in s.split("+"))]
+
+def ngrammes(mots, n=TAILLE_ECHO):
+    return {tuple(mots[i:i + n]) for i in range(len(mots) - n + 1)}
+
+def echo_prompt(texte, user_prompt=None):
+    """Vrai si la réponse recopie le prompt (marqueurs de template ou passage du prompt utilisateur)"""
+    if any(m in texte for m in MARQUEURS_ECHO):
+        return True
+    if not user_prompt:
+        return False
+    mots_prompt = [m.lower() for m in MOT.findall(user_prompt)]
+    mots_texte = [m.lower() for m in MOT.findall(texte)]
+    return bool(ngrammes(mots_prompt) & ngrammes(mots_texte))
+
+# === 1) Validation ===
+def schema_connu(schema, molecules):
+    return all(m.rstrip("*").upper() in molecules for m in schema.split("+"))
+
+def valider_rapport(texte, user_prompt=None, mots_min=MOTS_MIN, mots_max=MOTS_MAX, molecules=None):
+    """Contrôle rapide d'une première version : {"valide", "score", "echecs", "mots", "schemas"}
+
+    `molecules` : abréviations ARV admises (cf. decodage_schema.molecules_autorisees) ; un schéma
+    contenant une molécule inconnue ne compte pas.
+    """
+    texte = (texte or "").strip()
+    nb_mots = len(MOT.findall(texte))
+    schemas = schemas_therapeutiques(texte)
+    if molecules is not None:
+        connues = {m.upper() for m in molecules}
+        schemas = [s for s in schemas if schema_connu(s, connues)]
+    criteres = {
+        "debut": bool(DEBUT_ATTENDU.match(texte)),
+        "paragraphe_unique": not re.search(r"\n\s*\n", texte) and not LISTE_OU_TITRE.search(texte),
+        "longueur": mots_min <= nb_mots <= mots_max,
+        "sans_echo": not echo_prompt(texte, user_prompt),
+        "schema": bool(schemas)
+    }
+    echecs = [nom for nom, ok in criteres.items() if not ok]
+    return {
+        "valide": not echecs,
+        "score": round(sum(criteres.values()) / len(criteres), 2),
+        "echecs": echecs,
+        "mots": nb_mots,
+        "schemas": schemas
+    }